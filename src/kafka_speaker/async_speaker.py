@@ -0,0 +1,302 @@
+import asyncio
+from contextlib import closing
+from pathlib import Path
+from typing import Dict
+import httpx
+import openai
+from kafka_speaker.cache import GenerationCache
+from kafka_speaker.model import decode_messages, parse_messages
+from kafka_speaker.paragraph import Paragraph, file_paragraphs
+from kafka_speaker.registry import AssistantRegistry
+from kafka_speaker.speaker import (
+    Conversation,
+    File,
+    Message,
+    _attachment_assistant_description,
+    _attachment_assistant_name,
+    _attachment_assistant_params,
+    _attachment_cache_key,
+    _attachment_file_id,
+    _attachment_file_ids,
+    _image_prompt,
+    _message_assistant_description,
+    _message_assistant_name,
+    _message_assistant_params,
+    _messages_cache_key,
+    _normalize_image_attachment,
+    _write_conversations,
+)
+
+
+class AsyncKafkaSpeaker:
+    """asyncio counterpart of `KafkaSpeaker` built on `openai.AsyncOpenAI`
+
+    Every network call is awaited, so a single event loop can keep many runs,
+    image generations and downloads in flight at once.
+    """
+
+    def __init__(
+        self,
+        openai_client: openai.AsyncOpenAI,
+        model: str = "gpt-4o-mini",
+        http_client: httpx.AsyncClient | None = None,
+        cache: GenerationCache | None = None,
+        registry: AssistantRegistry | None = None
+    ):
+        self._client = openai_client
+        self._model = model
+        self._cache = cache
+        self._registry = registry or AssistantRegistry(None)
+        self._http = http_client or httpx.AsyncClient(timeout=60)
+        self._message_assistant = None
+        self._message_thread = None
+        self._attachment_assistant = None
+        # The message thread only allows one active run at a time
+        self._thread_lock = asyncio.Lock()
+        # One lock per lazily created resource so they can be set up concurrently
+        self._message_assistant_lock = asyncio.Lock()
+        self._message_thread_lock = asyncio.Lock()
+        self._attachment_assistant_lock = asyncio.Lock()
+
+    async def aclose(self):
+        await self._http.aclose()
+
+    async def warm(self) -> None:
+        """Set up both assistants and the message thread at once instead of on first use"""
+        await asyncio.gather(self._get_message_assistant(), self._get_message_thread(), self._get_attachment_assistant())
+
+    async def _get_message_assistant(self):
+        async with self._message_assistant_lock:
+            if self._message_assistant is None:
+                self._message_assistant = await self._registry.setup_async(
+                    self._client,
+                    _message_assistant_name,
+                    _message_assistant_description,
+                    _message_assistant_params(self._model)
+                )
+            return self._message_assistant
+
+    async def _get_message_thread(self):
+        async with self._message_thread_lock:
+            if self._message_thread is None:
+                self._message_thread = await self._client.beta.threads.create()
+            return self._message_thread
+
+    async def _get_attachment_assistant(self):
+        async with self._attachment_assistant_lock:
+            if self._attachment_assistant is None:
+                self._attachment_assistant = await self._registry.setup_async(
+                    self._client,
+                    _attachment_assistant_name,
+                    _attachment_assistant_description,
+                    _attachment_assistant_params(self._model)
+                )
+            return self._attachment_assistant
+
+    async def _get_assistant_response(self, thread_id: str, assistant_id: str):
+        run = await self._client.beta.threads.runs.create_and_poll(
+            thread_id=thread_id,
+            assistant_id=assistant_id
+        )
+
+        if run.status == "completed":
+            return await self._client.beta.threads.messages.list(
+                thread_id=thread_id,
+                run_id=run.id
+            )
+        else:
+            raise Exception(f"Assistant failed to respond: {run.status}")
+
+    async def _send_to_message_thread(self, content: str, assistant):
+        thread = await self._get_message_thread()
+        async with self._thread_lock:
+            await self._client.beta.threads.messages.create(
+                thread_id=thread.id,
+                role="user",
+                content=content
+            )
+            return await self._get_assistant_response(
+                thread_id=thread.id,
+                assistant_id=assistant.id
+            )
+
+    async def generate_messages(self, paragraph: Paragraph) -> list[Message]:
+        if self._cache:
+            key = _messages_cache_key(self._model, paragraph)
+            cached = await asyncio.to_thread(self._cache.get_json, key)
+            if cached is not None:
+                return decode_messages(cached)
+
+        assistant = await self._get_message_assistant()
+        new_messages = await self._send_to_message_thread(str(paragraph), assistant)
+        messages = parse_messages(new_messages.data[0].content[0].text.value)
+        if self._cache:
+            await asyncio.to_thread(self._cache.put_json, key, [msg.to_dict() for msg in messages])
+        return messages
+
+    async def _generate_attachment(self, attachment: File) -> str:
+        """Run the attachment assistant on a short-lived thread of its own, see `KafkaSpeaker._generate_attachment`"""
+        assistant = await self._get_attachment_assistant()
+        thread_id = None
+        file_ids: list[str] = []
+        try:
+            run = await self._client.beta.threads.create_and_run(
+                assistant_id=assistant.id,
+                thread={"messages": [{"role": "user", "content": str(attachment)}]}
+            )
+            thread_id = run.thread_id
+            run = await self._client.beta.threads.runs.poll(run.id, thread_id=thread_id)
+            if run.status != "completed":
+                raise Exception(f"Assistant failed to respond: {run.status}")
+            new_messages = await self._client.beta.threads.messages.list(
+                thread_id=thread_id,
+                run_id=run.id
+            )
+            file_ids = _attachment_file_ids(new_messages)
+            return _attachment_file_id(file_ids)
+        finally:
+            if thread_id is not None:
+                await self._delete_thread(thread_id)
+            for file_id in file_ids[1:]:
+                await self._delete_file(file_id)
+
+    async def _delete_thread(self, thread_id: str) -> None:
+        try:
+            await self._client.beta.threads.delete(thread_id)
+        except Exception as e:
+            print(f"Failed to delete thread {thread_id}: {e}")
+
+    async def _delete_file(self, file_id: str) -> None:
+        try:
+            await self._client.files.delete(file_id)
+        except Exception as e:
+            print(f"Failed to delete file {file_id}: {e}")
+
+    async def _download_attachment(self, file_id: str) -> bytes:
+        response = await self._client.files.content(file_id)
+        return response.content
+
+    async def _generate_image_attachment(self, attachment: File) -> bytes:
+        result = await self._client.images.generate(
+            model="dall-e-3",
+            prompt=_image_prompt(attachment),
+            size="1024x1024",
+            style="natural",
+            user="elemdiscovery/kafka-speaker"
+        )
+        response = await self._http.get(result.data[0].url)
+        response.raise_for_status()
+        return response.content
+
+    async def generate_attachment(self, attachment: File) -> bytes:
+        is_image = _normalize_image_attachment(attachment)
+        if self._cache:
+            key = _attachment_cache_key(self._model, attachment, is_image)
+            cached = await asyncio.to_thread(self._cache.get_bytes, key)
+            if cached is not None:
+                return cached
+
+        if is_image:
+            content = await self._generate_image_attachment(attachment)
+        else:
+            file_id = await self._generate_attachment(attachment)
+            try:
+                content = await self._download_attachment(file_id)
+            finally:
+                await self._delete_file(file_id)
+
+        if self._cache:
+            await asyncio.to_thread(self._cache.put_bytes, key, content)
+        return content
+
+
+async def _save_attachment(speaker: AsyncKafkaSpeaker, file_desc: File, attachments_dir: Path, file_number: int, semaphore: asyncio.Semaphore) -> bool:
+    async with semaphore:
+        try:
+            file_content = await speaker.generate_attachment(file_desc)
+        except Exception as e:
+            print(f"Failed to generate attachment.\nFile description: {str(file_desc)}\nError: {e}")
+            return False
+
+    save_path = attachments_dir / f"ATT{file_number:07d}{file_desc.normalized_docext}"
+    file_desc.set_saved_location(save_path)
+
+    print(f"Saving file to {save_path}")
+    await asyncio.to_thread(save_path.write_bytes, file_content)
+    return True
+
+
+async def process_book(
+    file_path: str,
+    skip_past: str,
+    end_at: str,
+    output_dir: str | Path,
+    openai_client: openai.AsyncOpenAI,
+    model: str,
+    file_limit: int,
+    max_workers: int = 16,
+    cache: GenerationCache | None = None,
+    registry: AssistantRegistry | None = None,
+    speaker: AsyncKafkaSpeaker | None = None
+) -> Dict:
+    """Async version of `kafka_speaker.speaker.process_book`
+
+    Message generation stays in paragraph order on one thread while attachments
+    for every paragraph are generated concurrently on the event loop. Reading the
+    book, the cache and the output files is done on worker threads so it doesn't
+    hold up the loop.
+
+    Args:
+        file_path: Path to the book file
+        skip_past: String to skip past in the book file
+        end_at: String to end at in the book file
+        output_dir: Directory to save outputs (string or Path)
+        openai_client: Async OpenAI client instance
+        max_workers: Number of attachments in flight at once
+        cache: Cache of previous generations to reuse
+        registry: Where assistant IDs are remembered between runs
+        speaker: Speaker to use instead of creating one; it's left open
+
+    Returns:
+        Dict containing the conversation history that was written to the output directory
+    """
+    output_dir = Path(output_dir)
+    attachments_dir = output_dir / "attachments"
+    attachments_dir.mkdir(parents=True, exist_ok=True)
+
+    owns_speaker = speaker is None
+    if owns_speaker:
+        speaker = AsyncKafkaSpeaker(openai_client, model, cache=cache, registry=registry)
+    semaphore = asyncio.Semaphore(max_workers)
+    conversations: list[Conversation] = []
+    pending: list[asyncio.Task] = []
+    file_counter = 0
+
+    print(f"Processing file {file_path}")
+
+    try:
+        await speaker.warm()
+        with closing(file_paragraphs(file_path, skip_past=skip_past, end_at=end_at)) as paragraphs:
+            while (paragraph := await asyncio.to_thread(next, paragraphs, None)) is not None:
+                if file_counter >= file_limit:
+                    print(f"Reached max files ({file_limit})")
+                    break
+                print(f"Processing paragraph {paragraph.paragraph_number}")
+                messages = await speaker.generate_messages(paragraph)
+
+                current_conversation = Conversation(messages=[])
+                for msg in messages:
+                    for file_desc in msg.files:
+                        file_counter += 1
+                        pending.append(asyncio.create_task(
+                            _save_attachment(speaker, file_desc, attachments_dir, file_counter, semaphore)
+                        ))
+                    current_conversation.messages.append(msg)
+                conversations.append(current_conversation)
+    finally:
+        # Like the thread pool in the sync version, let queued attachments finish
+        await asyncio.gather(*pending, return_exceptions=True)
+        if owns_speaker:
+            await speaker.aclose()
+
+    return await asyncio.to_thread(_write_conversations, output_dir, conversations)
@@ -0,0 +1,135 @@
+from typing import Dict, Iterator
+import openai
+from kafka_speaker.telemetry import Telemetry
+from kafka_speaker.threads import ThreadManager
+
+
+class ChatCompletionsBackend:
+    """Generates structured output with one Chat Completions request per input
+
+    Each request is independent, so no conversation context carries over between
+    paragraphs.
+    """
+    name = "chat"
+
+    def __init__(self, openai_client: openai.OpenAI, model: str, instructions: str, json_schema: Dict, telemetry: Telemetry | None = None):
+        self._client = openai_client
+        self._model = model
+        self._instructions = instructions
+        self._json_schema = json_schema
+        self._telemetry = telemetry or Telemetry()
+
+    def generate(self, content: str, model: str | None = None) -> str:
+        """Returns the JSON text of the structured response, from model if given"""
+        model = model or self._model
+        completion = self._client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": self._instructions},
+                {"role": "user", "content": content},
+            ],
+            response_format={"type": "json_schema", "json_schema": self._json_schema}
+        )
+        self._telemetry.add_usage(model, getattr(completion, "usage", None))
+        message = completion.choices[0].message
+        if message.refusal:
+            raise Exception(f"Model refused to respond: {message.refusal}")
+        return message.content
+
+    def stream(self, content: str, model: str | None = None) -> Iterator[str]:
+        """Yields the JSON text of the structured response as it is generated"""
+        model = model or self._model
+        chunks = self._client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": self._instructions},
+                {"role": "user", "content": content},
+            ],
+            response_format={"type": "json_schema", "json_schema": self._json_schema},
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        for chunk in chunks:
+            # The last chunk has no choices, only the usage
+            if chunk.usage:
+                self._telemetry.add_usage(model, chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.refusal:
+                raise Exception(f"Model refused to respond: {delta.refusal}")
+            if delta.content:
+                yield delta.content
+
+
+class ResponsesBackend:
+    """Generates structured output with one Responses API request per input
+
+    Requests are chained with `previous_response_id`, so like an assistant thread
+    the model sees the earlier paragraphs, but without the run polling. When given
+    threads, the chain is restarted whenever their `ThreadPolicy` would rotate a thread.
+    """
+    name = "responses"
+
+    def __init__(self, openai_client: openai.OpenAI, model: str, instructions: str, json_schema: Dict, telemetry: Telemetry | None = None, threads: ThreadManager | None = None):
+        self._client = openai_client
+        self._model = model
+        self._instructions = instructions
+        self._json_schema = json_schema
+        self._telemetry = telemetry or Telemetry()
+        self._threads = threads
+        self._previous_response_id = None
+
+    def _request(self, content: str) -> Dict:
+        """The chaining and input of the next request, starting a new chain once the current one is over budget"""
+        if self._threads is None:
+            return {"previous_response_id": self._previous_response_id, "input": content}
+        self._previous_response_id, seed = self._threads.chain(self._previous_response_id)
+        self._threads.record_paragraph(content)
+        return {"previous_response_id": self._previous_response_id, "input": [*seed, {"role": "user", "content": content}] if seed else content}
+
+    def _completed(self, model: str, response) -> None:
+        self._telemetry.add_usage(model, getattr(response, "usage", None))
+        if self._threads is not None:
+            self._threads.record_response(response)
+        if response.status != "completed":
+            raise Exception(f"Response failed: {response.status}")
+        self._previous_response_id = response.id
+
+    def generate(self, content: str, model: str | None = None) -> str:
+        """Returns the JSON text of the structured response, from model if given"""
+        model = model or self._model
+        response = self._client.responses.create(
+            model=model,
+            instructions=self._instructions,
+            text={"format": {"type": "json_schema", **self._json_schema}},
+            **self._request(content)
+        )
+        self._completed(model, response)
+        return response.output_text
+
+    def stream(self, content: str, model: str | None = None) -> Iterator[str]:
+        """Yields the JSON text of the structured response as it is generated"""
+        model = model or self._model
+        events = self._client.responses.create(
+            model=model,
+            instructions=self._instructions,
+            text={"format": {"type": "json_schema", **self._json_schema}},
+            stream=True,
+            **self._request(content)
+        )
+        for event in events:
+            if event.type == "response.output_text.delta":
+                yield event.delta
+            elif event.type in ("response.completed", "response.incomplete", "response.failed"):
+                self._completed(model, event.response)
+            elif event.type == "error":
+                raise Exception(f"Response failed: {event.message}")
+
+
+# The default "assistants" backend is the thread/run flow built into KafkaSpeaker
+BACKENDS = {
+    ChatCompletionsBackend.name: ChatCompletionsBackend,
+    ResponsesBackend.name: ResponsesBackend,
+}
+BACKEND_NAMES = ["assistants", *BACKENDS]
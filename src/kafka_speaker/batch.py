@@ -0,0 +1,233 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from itertools import islice
+import json
+from pathlib import Path
+import time
+from typing import Dict
+import openai
+from kafka_speaker.model import ModelError, parse_messages
+from kafka_speaker.paragraph import file_paragraphs
+from kafka_speaker.store import AttachmentStore
+from kafka_speaker.speaker import (
+    Conversation,
+    File,
+    KafkaSpeaker,
+    _attachment_instructions,
+    _message_format,
+    _normalize_image_attachment,
+    _save_attachment,
+    _speaker_instructions,
+    _write_attachment,
+    _write_conversations,
+)
+
+# Formats a chat completion can write directly; anything else becomes markdown,
+# as the attachment instructions already ask for files the model can't make
+_text_extensions = ('txt', 'md', 'csv')
+
+_text_attachment_instructions = _attachment_instructions + '''
+You do not have access to any tools. Respond with only the contents of the file, with no commentary before or after it.
+'''
+
+
+class BatchRunner(ABC):
+    """Runs a set of Batch API request lines and returns the response bodies
+
+    Subclass this to run batches somewhere other than OpenAI, e.g. a local fake in tests.
+    """
+
+    @abstractmethod
+    def run(self, requests: list[Dict]) -> Dict[str, Dict]:
+        """
+        Args:
+            requests: Batch API input lines, each with a unique custom_id
+
+        Returns:
+            Dict mapping custom_id -> response body for every request that succeeded
+        """
+
+
+class OpenAIBatchRunner(BatchRunner):
+    def __init__(self, openai_client: openai.OpenAI, poll_interval: float = 30, endpoint: str = "/v1/chat/completions"):
+        self._client = openai_client
+        self._poll_interval = poll_interval
+        self._endpoint = endpoint
+
+    def run(self, requests: list[Dict]) -> Dict[str, Dict]:
+        jsonl = "\n".join(json.dumps(request, ensure_ascii=False) for request in requests)
+        input_file = self._client.files.create(
+            file=("batch.jsonl", jsonl.encode("utf-8")),
+            purpose="batch"
+        )
+        batch = self._client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=self._endpoint,
+            completion_window="24h"
+        )
+        print(f"Submitted batch {batch.id} with {len(requests)} requests")
+
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            time.sleep(self._poll_interval)
+            batch = self._client.batches.retrieve(batch.id)
+
+        if batch.status != "completed":
+            raise Exception(f"Batch {batch.id} did not complete: {batch.status}")
+
+        results = {}
+        if batch.output_file_id:
+            output = self._client.files.content(batch.output_file_id).text
+            for line in output.splitlines():
+                result = json.loads(line)
+                response = result.get("response")
+                if result.get("error") or not response or response["status_code"] != 200:
+                    print(f"Batch request {result['custom_id']} failed: {result.get('error') or response}")
+                    continue
+                results[result["custom_id"]] = response["body"]
+        return results
+
+
+def chat_request(custom_id: str, model: str, instructions: str, content: str, response_format: Dict | None = None) -> Dict:
+    """Build a Batch API input line for a chat completion"""
+    body = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": instructions},
+            {"role": "user", "content": content},
+        ],
+    }
+    if response_format:
+        body["response_format"] = response_format
+    return {"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body}
+
+
+def _completion_text(body: Dict) -> str:
+    """The reply of a chat completion response body, raising ModelError for a refusal"""
+    try:
+        message = body["choices"][0]["message"]
+    except (KeyError, IndexError, TypeError) as e:
+        raise ModelError(f"Unexpected chat completion body: {e!r}") from e
+    if message.get("content") is None:
+        raise ModelError(f"Model refused to respond: {message.get('refusal')}")
+    return message["content"]
+
+
+def _strip_code_fence(text: str) -> str:
+    """Drop a ``` fence wrapped around a whole file, which models like to add"""
+    lines = text.strip().splitlines()
+    if len(lines) >= 2 and lines[0].startswith("```") and lines[-1].strip() == "```":
+        return "\n".join(lines[1:-1]) + "\n"
+    return text
+
+
+def process_book_batch(
+    file_path: str,
+    skip_past: str,
+    end_at: str,
+    output_dir: str | Path,
+    openai_client: openai.OpenAI,
+    model: str,
+    file_limit: int,
+    max_workers: int = 4,
+    runner: BatchRunner | None = None
+) -> Dict:
+    """Process a book with the Batch API instead of interactive assistant runs
+
+    Paragraphs go into batches of chat completions, one paragraph per file left in
+    the budget, until the budget is used up or the book ends, so paragraphs past
+    file_limit aren't generated. The text attachments the conversations ask for go
+    into one more batch. Attachments that aren't plain text are written as markdown.
+    Images aren't batched and are generated with DALL-E as usual.
+
+    Args:
+        file_path: Path to the book file
+        skip_past: String to skip past in the book file
+        end_at: String to end at in the book file
+        output_dir: Directory to save outputs (string or Path)
+        openai_client: OpenAI client instance
+        model: OpenAI model to use
+        file_limit: Limit for the number of files to generate, checked before each paragraph
+        max_workers: Number of images to generate concurrently
+        runner: Where to run the batches, OpenAI's Batch API by default
+
+    Returns:
+        Dict containing the conversation history that was written to the output directory
+    """
+    output_dir = Path(output_dir)
+    attachments_dir = output_dir / "attachments"
+    attachments_dir.mkdir(parents=True, exist_ok=True)
+    runner = runner or OpenAIBatchRunner(openai_client)
+
+    print(f"Processing file {file_path}")
+    message_format = {"type": "json_schema", "json_schema": _message_format}
+    conversations: list[Conversation] = []
+    text_attachments: Dict[int, File] = {}
+    image_attachments: Dict[int, File] = {}
+    file_counter = 0
+    with closing(file_paragraphs(file_path, skip_past=skip_past, end_at=end_at)) as paragraphs:
+        while file_counter < file_limit:
+            # Conversations almost always ask for at least one file, so a paragraph per
+            # file left in the budget is usually the only batch needed
+            chunk = list(islice(paragraphs, file_limit - file_counter))
+            if not chunk:
+                break
+            message_results = runner.run([
+                chat_request(f"paragraph-{p.paragraph_number}", model, _speaker_instructions, str(p), message_format)
+                for p in chunk
+            ])
+
+            for paragraph in chunk:
+                if file_counter >= file_limit:
+                    break
+                body = message_results.get(f"paragraph-{paragraph.paragraph_number}")
+                if body is None:
+                    print(f"No messages generated for paragraph {paragraph.paragraph_number}")
+                    continue
+
+                try:
+                    messages = parse_messages(_completion_text(body))
+                except ModelError as e:
+                    print(f"Skipping paragraph {paragraph.paragraph_number}, its messages couldn't be read: {e}")
+                    continue
+                for msg in messages:
+                    for file_desc in msg.files:
+                        file_counter += 1
+                        if _normalize_image_attachment(file_desc):
+                            image_attachments[file_counter] = file_desc
+                        else:
+                            if file_desc.docext.lower() not in _text_extensions:
+                                file_desc.docext = 'md'
+                            text_attachments[file_counter] = file_desc
+                conversations.append(Conversation(messages=messages))
+    if file_counter >= file_limit:
+        print(f"Reached max files ({file_limit})")
+
+    speaker = KafkaSpeaker(openai_client, model)
+    store = AttachmentStore()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        images = [
+            executor.submit(_save_attachment, speaker, file_desc, attachments_dir, file_number, store=store)
+            for file_number, file_desc in image_attachments.items()
+        ]
+
+        attachment_results = runner.run([
+            chat_request(f"attachment-{file_number}", model, _text_attachment_instructions, str(file_desc))
+            for file_number, file_desc in text_attachments.items()
+        ]) if text_attachments else {}
+        for file_number, file_desc in text_attachments.items():
+            body = attachment_results.get(f"attachment-{file_number}")
+            if body is None:
+                print(f"Failed to generate attachment.\nFile description: {str(file_desc)}")
+                continue
+            try:
+                content = _strip_code_fence(_completion_text(body))
+            except ModelError as e:
+                print(f"Failed to generate attachment: {e}\nFile description: {str(file_desc)}")
+                continue
+            _write_attachment(file_desc, attachments_dir, file_number, content.encode("utf-8"), store=store)
+
+        for future in images:
+            future.result()
+
+    return _write_conversations(output_dir, conversations)
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+import threading
+from typing import Any, BinaryIO, Iterable, Iterator
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "kafka-speaker"
+# Eviction frees space down to this fraction of max_bytes, so the cache directory
+# is only scanned once every so many writes rather than on every write when full
+EVICT_TO = 0.9
+
+
+def cache_key(*parts: Any) -> str:
+    """Content address for a generation request
+
+    Parts are anything JSON serializable, typically the kind of request, model,
+    instructions, schema and input text.
+    """
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """On-disk, content-addressed cache of OpenAI generations
+
+    Entries are stored as `<key[:2]>/<key>` under cache_dir. Reads bump the entry's
+    mtime, and once the cache grows past max_bytes the least recently used entries
+    are evicted down to `EVICT_TO` of it. Several processes can share a cache.
+    """
+
+    def __init__(self, cache_dir: str | Path = DEFAULT_CACHE_DIR, max_bytes: int = 1024 * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size = sum(p.stat().st_size for p in self._entries())
+
+    def _entries(self):
+        return (p for p in self.cache_dir.glob("??/*") if not p.name.endswith(".tmp"))
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / key
+
+    def get_bytes(self, key: str) -> bytes | None:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def open(self, key: str) -> BinaryIO | None:
+        """Open an entry for reading, e.g. to stream a large attachment out of the cache"""
+        path = self._path(key)
+        try:
+            f = open(path, "rb")
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return f
+
+    def _tmp_path(self, key: str) -> Path:
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        return path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+    def _commit(self, key: str, tmp_path: Path, size: int) -> None:
+        path = self._path(key)
+        with self._lock:
+            old_size = path.stat().st_size if path.exists() else 0
+            os.replace(tmp_path, path)
+            self._size += size - old_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def put_bytes(self, key: str, data: bytes) -> None:
+        tmp_path = self._tmp_path(key)
+        tmp_path.write_bytes(data)
+        self._commit(key, tmp_path, len(data))
+
+    def put_stream(self, key: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Pass chunks through, storing them as the entry for key once they've all been read
+
+        Nothing is stored if the chunks fail or aren't read to the end.
+        """
+        tmp_path = self._tmp_path(key)
+        size = 0
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    size += len(chunk)
+                    yield chunk
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        self._commit(key, tmp_path, size)
+
+    def get_json(self, key: str) -> Any | None:
+        data = self.get_bytes(key)
+        return None if data is None else json.loads(data)
+
+    def put_json(self, key: str, value: Any) -> None:
+        self.put_bytes(key, json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+    def _evict(self) -> None:
+        """Remove least recently used entries until the cache is under EVICT_TO of max_bytes"""
+        entries = []
+        for path in self._entries():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                # Evicted by another process sharing the cache
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        # Other processes may have written to or evicted from the cache too
+        self._size = sum(size for _, size, _ in entries)
+        entries.sort(key=lambda entry: entry[0])
+        target = self.max_bytes * EVICT_TO
+        for _, size, path in entries:
+            if self._size <= target:
+                break
+            path.unlink(missing_ok=True)
+            self._size -= size
@@ -1,9 +1,23 @@
 import argparse
+import asyncio
 import os
+from pathlib import Path
 import environs
 import openai
+from kafka_speaker.backends import BACKEND_NAMES
+from kafka_speaker.batch import process_book_batch
+from kafka_speaker.cache import DEFAULT_CACHE_DIR, GenerationCache
+from kafka_speaker.governor import Budget, Governor
+from kafka_speaker.images import ImageOptions
+from kafka_speaker.registry import AssistantRegistry
 from kafka_speaker.speaker import process_book
+from kafka_speaker.scheduler import book_paths, process_books
+from kafka_speaker.shard import default_index_path, merge_shards, process_shard
+from kafka_speaker import async_speaker
 from kafka_speaker.slack import upload_to_slack
+from kafka_speaker.telemetry import Telemetry
+from kafka_speaker.threads import ThreadPolicy
+from kafka_speaker.tracing import Tracer
 
 
 def main():
@@ -14,23 +28,191 @@ def main():
     # Sub-parser for the 'parse' command
     parser_parse = subparsers.add_parser('speak', help='Parse a Gutenberg book and turn it into a Slack style conversation with file attachments.')
     # Add arguments specific to the 'parse' command if needed
-    parser_parse.add_argument('--file', type=str, help='Path to the document file', default='pg69327-kafka-der-prozess.txt')
+    parser_parse.add_argument('--file', type=str, help='Path to the document file, or a directory or glob of document files. Each book gets its own subdirectory of the output directory.', default='pg69327-kafka-der-prozess.txt')
     parser_parse.add_argument('--output', type=str, help='Path to the output directory', default=os.getcwd())
     parser_parse.add_argument('--skip-past', type=str, help='Skip through the file until past this line of text', default='*** START OF THE PROJECT GUTENBERG')
     parser_parse.add_argument('--end-at', type=str, help='Stop parsing the file at this line of text', default='*** END OF THE PROJECT GUTENBERG')
     parser_parse.add_argument('--model', type=str, help='OpenAI model to use', default='gpt-4o-mini')
-    parser_parse.add_argument('--file-limit', type=int, help='Limit for the number of files to generate. Not a hard cutoff--the speaker will complete the current paragraph.', default=50)
+    parser_parse.add_argument('--file-limit', type=int, help='Limit for the number of files to generate. Not a hard cutoff--the speaker will complete the current paragraph. Shared by all books when processing several.', default=50)
+    parser_parse.add_argument('--workers', type=int, help='Number of attachments to generate concurrently', default=4)
+    parser_parse.add_argument('--max-books', type=int, help='Number of books to process at once when --file matches several books', default=2)
+    parser_parse.add_argument('--resume', action='store_true', help='Continue an interrupted run from the journal in the output directory')
+    parser_parse.add_argument('--cache-dir', type=str, help='Directory for caching OpenAI generations and assistant IDs between runs', default=str(DEFAULT_CACHE_DIR))
+    parser_parse.add_argument('--cache-size', type=int, help='Maximum size of the generation cache in MB. Least recently used entries are evicted past this.', default=1024)
+    parser_parse.add_argument('--no-cache', action='store_true', help='Always call OpenAI instead of reusing cached generations')
+    parser_parse.add_argument('--backend', type=str, choices=BACKEND_NAMES, help='How messages are generated: an assistant thread, or a single Chat Completions or Responses request per paragraph', default='assistants')
+    parser_parse.add_argument('--batch', action='store_true', help='Generate the whole book through the OpenAI Batch API. Cheaper, but can take up to 24 hours.')
+    parser_parse.add_argument('--stream', action='store_true', help="Stream each paragraph's messages and start generating a message's attachments as soon as it arrives")
+    parser_parse.add_argument('--lookahead', type=int, help='Generate messages for up to this many paragraphs ahead of the one whose attachments are being queued. 0 to generate them one at a time.', default=2)
+    parser_parse.add_argument('--async', dest='use_async', action='store_true', help='Drive all OpenAI calls from a single asyncio event loop')
+    parser_parse.add_argument('--attachments', type=str, choices=['assistant', 'local'], help='How documents are made: by a code_interpreter assistant, or written by the model and rendered locally. Local rendering of .docx/.pptx/.xlsx/.pdf needs the "documents" extra, otherwise they become markdown.', default='assistant')
+    parser_parse.add_argument('--image-format', type=str, choices=['png', 'webp', 'jpeg'], help='Transcode generated images to this format, stripping their metadata. Needs the "images" extra. Images are kept as they are by default.', default=None)
+    parser_parse.add_argument('--image-quality', type=int, help='Encoder quality for webp and jpeg images', default=80)
+    parser_parse.add_argument('--image-max-size', type=int, help='Scale images down to fit in a square this many pixels wide', default=None)
+    parser_parse.add_argument('--image-max-kb', type=int, help='Lower the image quality until it fits in this many KB', default=None)
+    parser_parse.add_argument('--thumbnail-size', type=int, help='Also write thumbnails this many pixels wide to attachments/thumbnails', default=None)
+    parser_parse.add_argument('--thread-max-tokens', type=int, help='Start a new message thread once a run sends this many prompt tokens, e.g. 16000. Threads are not rotated on tokens by default.', default=0)
+    parser_parse.add_argument('--thread-max-paragraphs', type=int, help='Start a new message thread after this many paragraphs', default=None)
+    parser_parse.add_argument('--thread-summary', action='store_true', help='Seed each new message thread with a short summary of the story so far')
+    parser_parse.add_argument('--shard-index', type=int, help='Only process this shard of the book, counting from 0. Combine the shard outputs with the merge command.', default=None)
+    parser_parse.add_argument('--shard-count', type=int, help='Number of shards the book is split into', default=1)
+    parser_parse.add_argument('--shard-by-chapter', action='store_true', help='Only split the book into shards at chapter boundaries')
+    parser_parse.add_argument('--max-dollars', type=float, help='Stop once the estimated spend reaches this many dollars', default=None)
+    parser_parse.add_argument('--max-tokens', type=int, help='Stop once this many tokens have been used', default=None)
+    parser_parse.add_argument('--max-images', type=int, help='Generate at most this many images', default=None)
+    parser_parse.add_argument('--requests-per-minute', type=float, help='Start at most this many runs, completions and image generations per minute', default=None)
+    parser_parse.add_argument('--degrade-at', type=float, help='Past this fraction of any budget, switch to --cheap-model, smaller DALL-E 2 images and locally rendered documents', default=0.8)
+    parser_parse.add_argument('--cheap-model', type=str, help='Model to switch to once degraded', default='gpt-4o-mini')
+    parser_parse.add_argument('--metrics', type=str, help='Write a JSON summary of API call latency, tokens and estimated cost to this file', default=None)
+    parser_parse.add_argument('--prometheus', type=str, help='Write the same summary in the Prometheus text format, e.g. for the node_exporter textfile collector', default=None)
+    parser_parse.add_argument('--trace', type=str, help='Write a trace of the run in the Chrome trace-event format, to open in Perfetto or chrome://tracing', default=None)
+    parser_parse.add_argument('--paragraph-index', type=str, help='Where to keep the byte-offset paragraph index used to seek to a shard. Built on first use; kept in the cache directory by default.', default=None)
+
+    # Sub-parser for the 'merge' command
+    parser_merge = subparsers.add_parser('merge', help='Combine the outputs of a sharded speak run.')
+    parser_merge.add_argument('--inputs', type=str, nargs='+', help='Output directories of each shard', required=True)
+    parser_merge.add_argument('--output', type=str, help='Directory to write the merged conversations.json and attachments to', default='output')
 
     # Sub-parser for the 'convert' command
     parser_slack = subparsers.add_parser('slack', help='Send parsed data to a Slack channel.')
-    parser_slack.add_argument('--input', type=str, help='Input directory containing conversations.json and attachments', default='output')
+    parser_slack.add_argument('--input', type=str, help='Input directory containing conversations.jsonl (or conversations.json) and attachments', default='output')
     parser_slack.add_argument('--channel', type=str, help='Slack channel to send the conversation to. By default, the channel is set in the environment variable SLACK_CHANNEL_ID.', default=None)
     parser_slack.add_argument('--file-channel', type=str, help='Slack channel to send the files to. By default, the channel is set in the environment variable SLACK_FILE_CHANNEL_ID.', default=None)
+    parser_slack.add_argument('--metrics', type=str, help='Write a JSON summary of API call latency to this file', default=None)
+    parser_slack.add_argument('--prometheus', type=str, help='Write the same summary in the Prometheus text format', default=None)
+    parser_slack.add_argument('--trace', type=str, help='Write a trace of the upload in the Chrome trace-event format', default=None)
 
     args = parser.parse_args()
     env = environs.Env()
     env.read_env()
+    books = book_paths(args.file) if args.command == 'speak' else []
+    cache = None
+    telemetry = Telemetry(tracer=Tracer() if getattr(args, 'trace', None) else None)
+    governor = None
+    if args.command == 'speak':
+        governor = Governor(Budget(
+            max_dollars=args.max_dollars,
+            max_tokens=args.max_tokens,
+            max_images=args.max_images,
+            requests_per_minute=args.requests_per_minute,
+            degrade_at=args.degrade_at,
+            cheap_model=args.cheap_model
+        ), telemetry)
+    registry = None
+    thread_policy = None
     if args.command == 'speak':
+        registry = AssistantRegistry(Path(args.cache_dir) / "assistants.json")
+        thread_policy = ThreadPolicy(args.thread_max_tokens or None, args.thread_max_paragraphs, args.thread_summary)
+    image_options = None
+    if args.command == 'speak' and args.image_format:
+        image_options = ImageOptions(
+            format=args.image_format,
+            quality=args.image_quality,
+            max_size=args.image_max_size,
+            max_bytes=args.image_max_kb * 1024 if args.image_max_kb else None,
+            thumbnail_size=args.thumbnail_size
+        )
+    if args.command == 'speak' and not args.no_cache:
+        cache = GenerationCache(args.cache_dir, max_bytes=args.cache_size * 1024 * 1024)
+    if args.command == 'speak' and (args.use_async or args.batch) and args.stream:
+        parser.error('--stream is not supported with --async or --batch')
+    if args.command == 'speak' and (args.use_async or args.batch) and governor.budget != Budget(degrade_at=args.degrade_at, cheap_model=args.cheap_model):
+        parser.error('Budgets are not supported with --async or --batch')
+    if args.command == 'speak' and (len(books) > 1 or (books and books[0] != Path(args.file))):
+        if args.use_async or args.batch:
+            parser.error('--async and --batch only support a single --file')
+        if args.shard_index is not None:
+            parser.error('--shard-index only supports a single --file')
+        process_books(
+            file_paths=books,
+            skip_past=args.skip_past,
+            end_at=args.end_at,
+            output_dir=args.output,
+            openai_client=openai.OpenAI(),
+            model=args.model,
+            file_limit=args.file_limit,
+            max_books=args.max_books,
+            max_workers=args.workers,
+            resume=args.resume,
+            cache=cache,
+            backend=args.backend,
+            registry=registry,
+            thread_policy=thread_policy,
+            attachments=args.attachments,
+            image_options=image_options,
+            telemetry=telemetry,
+            governor=governor,
+            stream=args.stream,
+            lookahead=args.lookahead
+        )
+        print(f"Successfully processed {len(books)} documents. Output saved to {args.output}")
+
+    elif args.command == 'speak' and args.shard_index is not None:
+        if args.use_async or args.batch:
+            parser.error('--async and --batch are not supported with --shard-index')
+        process_shard(
+            file_path=args.file,
+            skip_past=args.skip_past,
+            end_at=args.end_at,
+            output_dir=args.output,
+            openai_client=openai.OpenAI(),
+            model=args.model,
+            file_limit=args.file_limit,
+            shard_index=args.shard_index,
+            shard_count=args.shard_count,
+            by_chapter=args.shard_by_chapter,
+            index_path=args.paragraph_index or default_index_path(args.cache_dir, args.file),
+            max_workers=args.workers,
+            resume=args.resume,
+            cache=cache,
+            backend=args.backend,
+            registry=registry,
+            thread_policy=thread_policy,
+            attachments=args.attachments,
+            image_options=image_options,
+            telemetry=telemetry,
+            governor=governor,
+            stream=args.stream,
+            lookahead=args.lookahead
+        )
+        print(f"Successfully processed shard {args.shard_index} of document. Output saved to {args.output}")
+
+    elif args.command == 'speak' and args.batch:
+        if args.resume or args.backend != 'assistants' or args.attachments != 'assistant' or image_options or args.no_cache \
+                or args.metrics or args.prometheus or args.trace:
+            parser.error('--resume, --backend, --attachments, --image-format, --no-cache, --metrics, --prometheus and --trace are not supported with --batch')
+        process_book_batch(
+            file_path=args.file,
+            skip_past=args.skip_past,
+            end_at=args.end_at,
+            output_dir=args.output,
+            openai_client=openai.OpenAI(),
+            model=args.model,
+            file_limit=args.file_limit,
+            max_workers=args.workers
+        )
+        print(f"Successfully processed document. Output saved to {args.output}")
+
+    elif args.command == 'speak' and args.use_async:
+        if args.resume or args.backend != 'assistants' or args.attachments != 'assistant' or image_options:
+            parser.error('--resume, --backend, --attachments and --image-format are not supported with --async')
+        if args.metrics or args.prometheus or args.trace:
+            parser.error('--metrics, --prometheus and --trace are not supported with --async, which records no telemetry')
+        conversation = asyncio.run(async_speaker.process_book(
+            file_path=args.file,
+            skip_past=args.skip_past,
+            end_at=args.end_at,
+            output_dir=args.output,
+            openai_client=openai.AsyncOpenAI(),
+            model=args.model,
+            file_limit=args.file_limit,
+            max_workers=args.workers,
+            cache=cache,
+            registry=registry
+        ))
+        print(f"Successfully processed document. Output saved to {args.output}")
+
+    elif args.command == 'speak':
         client = openai.OpenAI()
         
         # Process the book and get conversation history
@@ -41,18 +223,43 @@ def main():
             output_dir=args.output,
             openai_client=client,
             model=args.model,
-            file_limit=args.file_limit
+            file_limit=args.file_limit,
+            max_workers=args.workers,
+            resume=args.resume,
+            cache=cache,
+            backend=args.backend,
+            registry=registry,
+            thread_policy=thread_policy,
+            attachments=args.attachments,
+            image_options=image_options,
+            telemetry=telemetry,
+            governor=governor,
+            stream=args.stream,
+            lookahead=args.lookahead
         )
         print(f"Successfully processed document. Output saved to {args.output}")
 
+    elif args.command == 'merge':
+        merge_shards(args.inputs, args.output)
+        print(f"Successfully merged {len(args.inputs)} shards. Output saved to {args.output}")
+
     elif args.command == 'slack':
         token = env("SLACK_BOT_TOKEN")
         channel = args.channel or env("SLACK_CHANNEL_ID")
         file_channel = args.file_channel or env("SLACK_FILE_CHANNEL_ID") or args.channel or env("SLACK_CHANNEL_ID")
-        upload_to_slack(args.input, channel, token, file_channel)
+        upload_to_slack(args.input, channel, token, file_channel, telemetry=telemetry)
     else:
         parser.print_help()
 
+    if telemetry.records:
+        print(telemetry.report())
+    if getattr(args, 'metrics', None):
+        telemetry.write_summary(args.metrics)
+    if getattr(args, 'prometheus', None):
+        telemetry.write_prometheus(args.prometheus)
+    if telemetry.tracer:
+        telemetry.tracer.write(args.trace)
+
 if __name__ == '__main__':
     main()
 
@@ -0,0 +1,131 @@
+"""Hard spend and rate budgets for a whole run, degrading to cheaper options as they run out
+
+Unlike `file_limit`, which is checked between paragraphs, the governor is asked
+before every run, completion and image generation. Requests are paced to the requests-per-minute limit,
+and once any budget is spent `BudgetExceeded` is raised instead of making the
+request. Past `Budget.degrade_at` of any budget, speakers switch to the cheaper
+model and image size and render documents locally instead of running the
+code_interpreter.
+"""
+from dataclasses import dataclass
+import threading
+import time
+from typing import Callable
+from kafka_speaker.ratelimit import TokenBucket
+from kafka_speaker.telemetry import IMAGE_PRICES, Telemetry
+
+
+@dataclass
+class Budget:
+    """Limits for a whole run; None means unlimited
+
+    Attributes:
+        max_dollars: Estimated spend in USD, see `telemetry.TOKEN_PRICES`
+        max_tokens: Prompt and completion tokens
+        max_images: Images generated
+        requests_per_minute: Runs, completions and image generations started per minute,
+            across every speaker
+        degrade_at: Fraction of any budget after which to switch to the cheaper options
+        cheap_model: Model for messages and documents once degraded
+        cheap_image_model: Image model once degraded
+        cheap_image_size: Image size once degraded
+    """
+    max_dollars: float | None = None
+    max_tokens: int | None = None
+    max_images: int | None = None
+    requests_per_minute: float | None = None
+    degrade_at: float = 0.8
+    cheap_model: str = "gpt-4o-mini"
+    cheap_image_model: str = "dall-e-2"
+    cheap_image_size: str = "512x512"
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class Governor:
+    """Enforces a `Budget` against the spend recorded in telemetry
+
+    Spend is only known once a request returns, so requests already in flight can
+    take the dollar and token totals slightly past their limits. Images are counted
+    when they're admitted, so max_images is never exceeded.
+
+    Args:
+        budget: The limits, unlimited by default
+        telemetry: Where spend is recorded; must be the telemetry the speakers record to
+    """
+
+    def __init__(
+        self,
+        budget: Budget | None = None,
+        telemetry: Telemetry | None = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep
+    ):
+        self.budget = budget or Budget()
+        self.telemetry = telemetry or Telemetry()
+        self._bucket = None
+        if self.budget.requests_per_minute:
+            rate = self.budget.requests_per_minute / 60
+            self._bucket = TokenBucket(rate, max(1.0, rate), clock, sleep)
+        self._images = 0
+        self._degraded = False
+        self._lock = threading.Lock()
+
+    def used(self) -> float:
+        """Fraction of the most used budget"""
+        budget = self.budget
+        totals = self.telemetry.totals
+        fractions = [0.0]
+        if budget.max_dollars:
+            fractions.append(totals.cost / budget.max_dollars)
+        if budget.max_tokens:
+            fractions.append((totals.prompt_tokens + totals.completion_tokens) / budget.max_tokens)
+        if budget.max_images:
+            fractions.append(self._images / budget.max_images)
+        return max(fractions)
+
+    @property
+    def degraded(self) -> bool:
+        """Whether to use the cheaper options; once degraded, a run stays degraded"""
+        if not self._degraded and self.used() >= self.budget.degrade_at:
+            with self._lock:
+                if not self._degraded:
+                    self._degraded = True
+                    print(f"Used {self.used():.0%} of the budget, switching to {self.budget.cheap_model}, "
+                          f"{self.budget.cheap_image_model} {self.budget.cheap_image_size} images and local documents")
+        return self._degraded
+
+    def model(self, model: str) -> str:
+        """The model to use instead of model"""
+        return self.budget.cheap_model if self.degraded else model
+
+    def image(self) -> tuple[str, str]:
+        """(model, size) to generate images with"""
+        if self.degraded:
+            return self.budget.cheap_image_model, self.budget.cheap_image_size
+        return "dall-e-3", "1024x1024"
+
+    def admit(self, images: int = 0, image: tuple[str, str] | None = None) -> None:
+        """Wait for a request slot, or raise BudgetExceeded if a budget is spent
+
+        Args:
+            images: Number of images the request will generate
+            image: (model, size) of those images, to count their cost up front
+        """
+        budget = self.budget
+        totals = self.telemetry.totals
+        with self._lock:
+            if budget.max_images is not None and self._images + images > budget.max_images:
+                raise BudgetExceeded(f"Image budget of {budget.max_images} spent")
+            if budget.max_tokens is not None and totals.prompt_tokens + totals.completion_tokens >= budget.max_tokens:
+                raise BudgetExceeded(f"Token budget of {budget.max_tokens} spent")
+            if budget.max_dollars is not None:
+                upcoming = IMAGE_PRICES.get(image, 0.0) * images if image else 0.0
+                if totals.cost >= budget.max_dollars or totals.cost + upcoming > budget.max_dollars:
+                    raise BudgetExceeded(f"Budget of ${budget.max_dollars:.2f} spent")
+            self._images += images
+        if self._bucket:
+            with self.telemetry.span("governor.wait"):
+                self._bucket.acquire()
@@ -0,0 +1,106 @@
+"""Shrink generated images before they are saved and uploaded
+
+DALL-E returns a 1024x1024 PNG of a few MB. With Pillow installed (the `images`
+extra) it can be transcoded to WebP or JPEG, scaled down, stripped of metadata
+and given a thumbnail. Without Pillow images are kept as they are.
+"""
+from concurrent.futures import Future
+from dataclasses import dataclass
+import io
+from kafka_speaker.pool import LazyProcessPool
+
+# Pillow format name and file extension for each output format
+IMAGE_FORMATS = {"png": ("PNG", "png"), "webp": ("WEBP", "webp"), "jpeg": ("JPEG", "jpg")}
+
+
+@dataclass
+class ImageOptions:
+    """How generated images are processed
+
+    Attributes:
+        format: "png", "webp" or "jpeg"
+        quality: Starting encoder quality for webp and jpeg, 1-100
+        max_size: Scale images down to fit in a square this many pixels wide
+        max_bytes: Lower the quality, down to min_quality, until the image fits in this many bytes
+        min_quality: Lowest quality max_bytes may go down to
+        thumbnail_size: Also make a thumbnail that fits in a square this many pixels wide
+    """
+    format: str = "webp"
+    quality: int = 80
+    max_size: int | None = None
+    max_bytes: int | None = None
+    min_quality: int = 40
+    thumbnail_size: int | None = None
+
+
+@dataclass
+class ProcessedImage:
+    docext: str
+    content: bytes
+    thumbnail: bytes | None = None
+
+
+def _encode(image, options: ImageOptions, quality: int) -> bytes:
+    pil_format, _ = IMAGE_FORMATS[options.format]
+    if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    params = {"optimize": True}
+    if pil_format in ("JPEG", "WEBP"):
+        params["quality"] = quality
+    if pil_format == "WEBP":
+        params["method"] = 4
+    out = io.BytesIO()
+    # No exif, icc_profile or pnginfo is passed, so none of the metadata is written
+    image.save(out, format=pil_format, **params)
+    return out.getvalue()
+
+
+def _encode_within(image, options: ImageOptions) -> bytes:
+    """Encode at the configured quality, stepping it down to fit max_bytes"""
+    quality = options.quality
+    content = _encode(image, options, quality)
+    while options.max_bytes and len(content) > options.max_bytes and options.format != "png" and quality > options.min_quality:
+        quality = max(options.min_quality, quality - 10)
+        content = _encode(image, options, quality)
+    return content
+
+
+def process_image(content: bytes, options: ImageOptions) -> ProcessedImage:
+    """Transcode, scale and strip an image as configured
+
+    Returns the original PNG if Pillow isn't installed or can't read the image.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        print("Pillow is not installed, keeping the original image")
+        return ProcessedImage("png", content)
+
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            image.load()
+            image.info.clear()
+            if options.max_size:
+                image.thumbnail((options.max_size, options.max_size))
+            processed = _encode_within(image, options)
+            thumbnail = None
+            if options.thumbnail_size:
+                small = image.copy()
+                small.thumbnail((options.thumbnail_size, options.thumbnail_size))
+                thumbnail = _encode(small, options, options.quality)
+    except Exception as e:
+        print(f"Failed to process image, keeping the original: {e}")
+        return ProcessedImage("png", content)
+    return ProcessedImage(IMAGE_FORMATS[options.format][1], processed, thumbnail)
+
+
+class ImageProcessor(LazyProcessPool):
+    """Processes images in a process pool, off the threads waiting on the API"""
+
+    def __init__(self, options: ImageOptions, max_workers: int | None = None):
+        super().__init__(max_workers)
+        self.options = options
+
+    def process(self, content: bytes) -> Future:
+        """Queue an image for `process_image`; the future holds a ProcessedImage"""
+        return self.submit(process_image, content, self.options)
@@ -0,0 +1,133 @@
+from dataclasses import dataclass, field
+import json
+from pathlib import Path
+import threading
+from typing import Dict
+from kafka_speaker.model import Conversation, File
+
+JOURNAL_NAME = "conversations.journal.jsonl"
+
+
+@dataclass
+class JournalState:
+    """Everything a previous, unfinished run recorded
+
+    Attributes:
+        paragraphs: paragraph_number -> (first file number, conversation dict), in journal order
+        attachments: file number -> saved file fields for attachments that were written
+    """
+    paragraphs: Dict[int, tuple[int, Dict]] = field(default_factory=dict)
+    attachments: Dict[int, Dict] = field(default_factory=dict)
+
+    @property
+    def last_paragraph(self) -> int:
+        return max(self.paragraphs, default=0)
+
+    @property
+    def last_file_number(self) -> int:
+        """Highest ATT number handed out so far"""
+        last = 0
+        for first_file, conversation in self.paragraphs.values():
+            count = sum(len(msg["files"]) for msg in conversation["messages"])
+            last = max(last, first_file + count - 1)
+        return last
+
+
+class ConversationJournal:
+    """Append-only JSONL record of a speak run
+
+    A `paragraph` entry is written once a paragraph's messages are generated, and an
+    `attachment` entry once each attachment has been saved. Attachments of a
+    streamed paragraph can be recorded before the paragraph itself. Each line is flushed as
+    it is written so a crashed run can be picked up with `load`.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._file = None
+
+    def open(self, resume: bool = False) -> JournalState:
+        """Open the journal for appending
+
+        Args:
+            resume: Keep the existing journal and return its state instead of starting over
+
+        Returns:
+            The state recorded by the previous run, empty if not resuming
+        """
+        state = self.load() if resume else JournalState()
+        if resume and self.path.exists():
+            self._rewrite(state)
+        self._file = open(self.path, "a" if resume else "w", encoding="utf-8")
+        return state
+
+    def _rewrite(self, state: JournalState) -> None:
+        """Replace the journal with just what state holds, dropping anything `load` ignored"""
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for paragraph_number, (first_file, conversation) in state.paragraphs.items():
+                f.write(json.dumps({
+                    "type": "paragraph",
+                    "paragraph_number": paragraph_number,
+                    "first_file": first_file,
+                    "conversation": conversation,
+                }, ensure_ascii=False) + "\n")
+            for file_number, file in state.attachments.items():
+                f.write(json.dumps({"type": "attachment", "file_number": file_number, "file": file}, ensure_ascii=False) + "\n")
+        tmp_path.replace(self.path)
+
+    def close(self) -> None:
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def load(self) -> JournalState:
+        state = JournalState()
+        if not self.path.exists():
+            return state
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash can leave a partially written last line
+                    print(f"Ignoring truncated journal line in {self.path}")
+                    continue
+                if entry["type"] == "paragraph":
+                    state.paragraphs[entry["paragraph_number"]] = (entry["first_file"], entry["conversation"])
+                elif entry["type"] == "attachment":
+                    state.attachments[entry["file_number"]] = entry["file"]
+        # A streamed run saves attachments before their paragraph is recorded; if it
+        # crashed in between, the paragraph is generated again and may differ
+        last_file_number = state.last_file_number
+        state.attachments = {n: file for n, file in state.attachments.items() if n <= last_file_number}
+        return state
+
+    def _append(self, entry: Dict) -> None:
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def record_paragraph(self, paragraph_number: int, first_file: int, conversation: Conversation) -> None:
+        """Record a paragraph's conversation, whose files are numbered from first_file"""
+        self._append({
+            "type": "paragraph",
+            "paragraph_number": paragraph_number,
+            "first_file": first_file,
+            "conversation": conversation.to_dict(),
+        })
+
+    def record_attachment(self, file_number: int, file: File) -> None:
+        """Record that attachment number file_number has been saved"""
+        self._append({
+            "type": "attachment",
+            "file_number": file_number,
+            "file": file.to_dict(),
+        })
+
+    def remove(self) -> None:
+        """Delete the journal once its contents are in conversations.json"""
+        self.close()
+        self.path.unlink(missing_ok=True)
@@ -0,0 +1,214 @@
+"""The conversation model shared by the speaker and the Slack uploader
+
+The classes are slotted to keep per-message memory down. `from_dict` validates
+the shape of the data as it decodes, which covers both `_message_format`
+responses and conversations.json(l) written by earlier runs. `to_dict` builds
+plain dicts straight from the fields; unlike `dataclasses.asdict` it doesn't
+deep-copy anything, the strings are shared with the model.
+"""
+from dataclasses import dataclass
+import json
+from pathlib import Path
+from typing import Any, Dict
+
+
+class ModelError(ValueError):
+    """Raised when data doesn't match the conversation model"""
+
+
+def _check(data: Any, kind: str, required: tuple[str, ...], optional: tuple[str, ...] = ()) -> Dict:
+    if type(data) is not dict:
+        raise ModelError(f"Expected a {kind} object, got {type(data).__name__}")
+    for key in required:
+        if key not in data:
+            raise ModelError(f"{kind} is missing {key!r}")
+    if len(data) > len(required):
+        extra = data.keys() - required - set(optional)
+        if extra:
+            raise ModelError(f"{kind} has unexpected fields {sorted(extra)}")
+    return data
+
+
+def _str(data: Dict, key: str, kind: str, optional: bool = False) -> str | None:
+    value = data.get(key)
+    if type(value) is str or (optional and value is None):
+        return value
+    raise ModelError(f"{kind}.{key} should be a string, got {type(value).__name__}")
+
+
+def _list(data: Dict, key: str, kind: str) -> list:
+    value = data[key]
+    if type(value) is not list:
+        raise ModelError(f"{kind}.{key} should be a list, got {type(value).__name__}")
+    return value
+
+
+@dataclass(slots=True)
+class File:
+    filename: str
+    docext: str
+    description: str
+    saved_name: str | None = None
+    saved_path: str | None = None
+
+    def __str__(self):
+        # Keep the original string format for the AI
+        return f"File: {self.filename}\nDocument Extension: {self.docext}\nDescription: {self.description}"
+
+    def __post_init__(self):
+        """Normalize docext after initialization"""
+        self.docext = self.docext.lstrip('.')
+
+    @property
+    def normalized_docext(self) -> str:
+        """Returns the document extension with leading dot"""
+        return f'.{self.docext}'
+
+    @property
+    def original_name(self) -> str:
+        """Returns original filename with extension"""
+        return f"{self.filename}{self.normalized_docext}"
+
+    def set_saved_location(self, path: Path | str) -> None:
+        """Updates the saved location information"""
+        self.saved_path = str(path)
+        self.saved_name = Path(path).name
+
+    @classmethod
+    def from_dict(cls, data: Any) -> "File":
+        _check(data, "file", ("filename", "docext", "description"), ("saved_name", "saved_path"))
+        return cls(
+            _str(data, "filename", "file"),
+            _str(data, "docext", "file"),
+            _str(data, "description", "file"),
+            _str(data, "saved_name", "file", optional=True),
+            _str(data, "saved_path", "file", optional=True),
+        )
+
+    def to_dict(self) -> Dict:
+        return {
+            "filename": self.filename,
+            "docext": self.docext,
+            "description": self.description,
+            "saved_name": self.saved_name,
+            "saved_path": self.saved_path,
+        }
+
+
+@dataclass(slots=True)
+class Message:
+    sender_name: str
+    message_content: str
+    files: list[File]
+
+    @classmethod
+    def from_dict(cls, data: Any) -> "Message":
+        _check(data, "message", ("sender_name", "message_content", "files"))
+        return cls(
+            _str(data, "sender_name", "message"),
+            _str(data, "message_content", "message"),
+            [File.from_dict(file) for file in _list(data, "files", "message")],
+        )
+
+    def to_dict(self) -> Dict:
+        return {
+            "sender_name": self.sender_name,
+            "message_content": self.message_content,
+            "files": [file.to_dict() for file in self.files],
+        }
+
+
+@dataclass(slots=True)
+class Conversation:
+    messages: list[Message]
+
+    @classmethod
+    def from_dict(cls, data: Any) -> "Conversation":
+        _check(data, "conversation", ("messages",))
+        return cls(decode_messages(_list(data, "messages", "conversation")))
+
+    def to_dict(self) -> Dict:
+        return {"messages": [message.to_dict() for message in self.messages]}
+
+    @property
+    def files(self) -> list[File]:
+        """Every file attached to the conversation, in message order"""
+        return [file for message in self.messages for file in message.files]
+
+
+def decode_messages(data: Any) -> list[Message]:
+    """Decode and validate a list of message dicts"""
+    if type(data) is not list:
+        raise ModelError(f"Expected a list of messages, got {type(data).__name__}")
+    return [Message.from_dict(message) for message in data]
+
+
+def parse_messages(text: str) -> list[Message]:
+    """Decode and validate a `_message_format` JSON response"""
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ModelError(f"Response is not valid JSON: {e}") from e
+    _check(data, "response", ("messages",))
+    return decode_messages(data["messages"])
+
+
+class MessageStream:
+    """Incrementally decodes a `_message_format` response as it streams in
+
+    `feed` returns each message as soon as its object closes, so its files can be
+    worked on while the rest of the response is still being generated. The
+    response is one object holding one array of message objects, so a message
+    is any object that closes three levels deep. `finish` parses the whole text
+    and returns whatever wasn't already returned.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._start: int | None = None
+        self._returned = 0
+
+    def feed(self, delta: str) -> list[Message]:
+        self.text += delta
+        text = self.text
+        messages = []
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif c == "\\":
+                    self._escaped = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c == "{" or c == "[":
+                self._depth += 1
+                if self._depth == 3 and c == "{":
+                    self._start = i
+            elif c == "}" or c == "]":
+                if self._depth == 3 and c == "}" and self._start is not None:
+                    try:
+                        data = json.loads(text[self._start:i + 1])
+                    except json.JSONDecodeError as e:
+                        raise ModelError(f"Streamed message is not valid JSON: {e}") from e
+                    messages.append(Message.from_dict(data))
+                    self._start = None
+                self._depth -= 1
+        self._pos = len(text)
+        self._returned += len(messages)
+        return messages
+
+    def finish(self) -> list[Message]:
+        """Validate the complete response, returning any messages `feed` didn't"""
+        messages = parse_messages(self.text)
+        if len(messages) < self._returned:
+            raise ModelError(f"Streamed {self._returned} messages but the response has {len(messages)}")
+        rest = messages[self._returned:]
+        self._returned = len(messages)
+        return rest
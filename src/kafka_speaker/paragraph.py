@@ -1,5 +1,8 @@
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field
 from typing import List, Iterator
+import json
+import os
+from pathlib import Path
 import re
 from itertools import takewhile, dropwhile
 
@@ -9,50 +12,92 @@ class Paragraph:
     chapter_subtitle: str
     paragraph_number: int
     content: str
+    # Where the paragraph starts in the file, see `ParagraphIndexEntry`
+    start: "ParagraphIndexEntry | None" = field(default=None, compare=False, repr=False)
 
     def __str__(self):
         parts = [self.chapter_title, self.chapter_subtitle, self.content]
         return "\n".join(part for part in parts if part)
 
 
-def file_paragraphs(file_path: str, skip_past: str, end_at: str, min_paragraph_length: int = 200) -> Iterator[Paragraph]:
-    with open(file_path, 'r', encoding='utf-8') as file:
-        # Skip until we find the start marker
-        lines = dropwhile(lambda line: skip_past not in line, file)
-        next(lines)  # Skip the marker line itself
-        
-        # Take lines until we hit the end marker (if specified)
-        if end_at:
-            lines = takewhile(lambda line: end_at not in line, lines)
-        
-        # Convert to list and skip initial metadata
-        lines = list(lines)
-        lines = dropwhile(lambda line: not line.strip() or line.startswith(' ' * 4), lines)
+@dataclass
+class ParagraphIndexEntry:
+    """Enough state to resume parsing a file at the start of a paragraph
+
+    Attributes:
+        paragraph_number: Number of the paragraph starting here
+        offset: Byte offset of the paragraph's first line
+        chapter_title: Chapter title when that line was read
+        chapter_subtitle: Chapter subtitle when that line was read
+    """
+    paragraph_number: int
+    offset: int
+    chapter_title: str
+    chapter_subtitle: str
+
+
+def _lines_with_offsets(file) -> Iterator[tuple[int, str]]:
+    """Yield (byte offset, decoded line) for each line of a binary file"""
+    offset = file.tell()
+    for raw in file:
+        yield offset, raw.decode('utf-8')
+        offset += len(raw)
+
+
+def _book_sections(lines: Iterator[tuple[int, str]], skip_past: str, end_at: str) -> Iterator[Iterator[tuple[int, str]]]:
+    """Lazily yield the lines between each start and end marker
+
+    A file can hold several concatenated books, each with its own markers. Each
+    section must be consumed before the next one is requested.
+    """
+    while True:
+        # Skip until we find the start marker, consuming the marker line itself
+        if not any(skip_past in line for _, line in lines):
+            return
+
+        yield _until_end(lines, end_at)
+        if not end_at:
+            return
+
+
+def _until_end(lines: Iterator[tuple[int, str]], end_at: str) -> Iterator[tuple[int, str]]:
+    """Take lines until we hit the end marker (if specified)"""
+    return takewhile(lambda entry: end_at not in entry[1], lines) if end_at else lines
+
+
+def _segment(
+    lines: Iterator[tuple[int, str]],
+    min_paragraph_length: int,
+    paragraph_number: int = 0,
+    chapter_title: str = "",
+    subtitle: str = "",
+    skip_metadata: bool = True
+) -> Iterator[Paragraph]:
+    """Split the lines of one book into paragraphs, numbering on from paragraph_number"""
+    if skip_metadata:
+        lines = dropwhile(lambda entry: not entry[1].strip() or entry[1].startswith(' ' * 4), lines)
 
-    chapter_title = ""
-    subtitle = ""
-    paragraph_number = 0
     paragraph_content = []
+    paragraph_start = None
+    # Length of ' '.join(paragraph_content), kept up to date as lines are added
+    paragraph_length = 0
 
-    for line in lines:
+    for offset, line in lines:
         line = line.strip()
         
+        # Blank lines and chapter titles (all caps lines) end the current paragraph,
+        # but only yield it once it has enough content
+        is_title = bool(line) and not any(c.islower() for c in line)
+        if (not line or is_title) and paragraph_content and paragraph_length >= min_paragraph_length:
+            paragraph_number += 1
+            yield Paragraph(chapter_title, subtitle, paragraph_number, ' '.join(paragraph_content), paragraph_start)
+            paragraph_content = []
+            paragraph_length = 0
+
         if not line:
-            # On blank line, yield paragraph if we have enough content
-            if paragraph_content and len(' '.join(paragraph_content)) >= min_paragraph_length:
-                paragraph_number += 1
-                yield Paragraph(chapter_title, subtitle, paragraph_number, ' '.join(paragraph_content))
-                paragraph_content = []
             continue
 
-        # Check for chapter title (all caps line)
-        if line and not any(c.islower() for c in line.strip()):
-            # If we have content, yield the previous paragraph first
-            if paragraph_content and len(' '.join(paragraph_content)) >= min_paragraph_length:
-                paragraph_number += 1
-                yield Paragraph(chapter_title, subtitle, paragraph_number, ' '.join(paragraph_content))
-                paragraph_content = []
-            
+        if is_title:
             # If we already have a title, this must be the subtitle
             if chapter_title:
                 subtitle = line
@@ -62,12 +107,99 @@ def file_paragraphs(file_path: str, skip_past: str, end_at: str, min_paragraph_l
             continue
 
         # Add line to current paragraph
+        if not paragraph_content:
+            paragraph_start = ParagraphIndexEntry(paragraph_number + 1, offset, chapter_title, subtitle)
+        paragraph_length += len(line) + (1 if paragraph_content else 0)
         paragraph_content.append(line)
 
     # Handle final paragraph
-    if paragraph_content and len(' '.join(paragraph_content)) >= min_paragraph_length:
+    if paragraph_content and paragraph_length >= min_paragraph_length:
         paragraph_number += 1
-        yield Paragraph(chapter_title, subtitle, paragraph_number, ' '.join(paragraph_content))
+        yield Paragraph(chapter_title, subtitle, paragraph_number, ' '.join(paragraph_content), paragraph_start)
+
+
+def file_paragraphs(
+    file_path: str,
+    skip_past: str,
+    end_at: str,
+    min_paragraph_length: int = 200,
+    start: ParagraphIndexEntry | None = None,
+    stop_after: int | None = None
+) -> Iterator[Paragraph]:
+    """Stream the paragraphs of a Gutenberg text file
+
+    The file is read lazily, so memory use doesn't depend on its size. A file of
+    several concatenated books is handled like one long book: paragraph numbers keep
+    counting up, while chapter titles start over with each book.
+
+    Args:
+        file_path: Path to the book file
+        skip_past: String to skip past in the book file
+        end_at: String to end at in the book file
+        min_paragraph_length: Shorter paragraphs are merged into the next one
+        start: Seek straight to this paragraph instead of reading from the top
+        stop_after: Stop after yielding this paragraph number
+    """
+    with open(file_path, 'rb') as file:
+        paragraph_number = 0
+        found_start = start is not None
+        sections = []
+        if start:
+            file.seek(start.offset)
+            lines = _lines_with_offsets(file)
+            sections.append(_segment(
+                _until_end(lines, end_at), min_paragraph_length, start.paragraph_number - 1,
+                start.chapter_title, start.chapter_subtitle, skip_metadata=False
+            ))
+        else:
+            lines = _lines_with_offsets(file)
+
+        def remaining_sections():
+            yield from sections
+            nonlocal found_start
+            for section in _book_sections(lines, skip_past, end_at):
+                found_start = True
+                yield _segment(section, min_paragraph_length, paragraph_number)
+
+        for section in remaining_sections():
+            for paragraph in section:
+                paragraph_number = paragraph.paragraph_number
+                yield paragraph
+                if stop_after is not None and paragraph_number >= stop_after:
+                    return
+        if not found_start:
+            raise ValueError(f"Start marker {skip_past!r} not found in {file_path}")
+
+
+def build_paragraph_index(file_path: str, skip_past: str, end_at: str, min_paragraph_length: int = 200) -> list[ParagraphIndexEntry]:
+    """Record where every paragraph of the file starts, for `file_paragraphs(start=...)`"""
+    return [p.start for p in file_paragraphs(file_path, skip_past, end_at, min_paragraph_length)]
+
+
+def save_paragraph_index(path: str | Path, index: list[ParagraphIndexEntry], **params) -> None:
+    """Save an index along with the parameters it was built with
+
+    The index is written to a temporary file and renamed into place, so shards
+    building it at the same time never read a partial one.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"params": params, "paragraphs": [asdict(entry) for entry in index]}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def load_paragraph_index(path: str | Path, **params) -> list[ParagraphIndexEntry] | None:
+    """Load a saved index, or None if it is missing or was built with other parameters"""
+    path = Path(path)
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data["params"] != params:
+        return None
+    return [ParagraphIndexEntry(**entry) for entry in data["paragraphs"]]
 
 # # Example usage
 # file_path = 'pg69327-kafka-der-prozess.txt'
@@ -0,0 +1,82 @@
+"""Run a stage of work ahead of its consumer on a background thread
+
+`process_book` uses this to keep reading paragraphs and generating their messages
+while the paragraphs before them are journaled and their attachments queued.
+"""
+import queue
+import threading
+from typing import Callable, Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# How often a blocked producer checks whether the consumer has gone away
+_POLL_SECONDS = 0.1
+
+
+def prefetch(items: Iterable[T], fn: Callable[[T], R], depth: int) -> Iterator[tuple[T, R]]:
+    """Apply fn to each item in order on a background thread, at most depth items ahead
+
+    Items are produced and fn is called one at a time and in order, so fn can rely
+    on state left by the previous call, like a conversation thread. An exception
+    raised by fn or by items is re-raised by the iterator at that item's place.
+    Closing the iterator early stops the producer after the call it's in.
+
+    Args:
+        items: What to process; iterated on the background thread
+        fn: Called with each item
+        depth: Number of finished results to hold before the producer waits.
+            0 calls fn inline, with nothing running ahead.
+
+    Returns:
+        An iterator of (item, fn(item))
+    """
+    if depth <= 0:
+        return ((item, fn(item)) for item in items)
+    return _prefetch(items, fn, depth)
+
+
+def _prefetch(items: Iterable[T], fn: Callable[[T], R], depth: int) -> Iterator[tuple[T, R]]:
+    results: queue.Queue = queue.Queue(maxsize=depth)
+    stopped = threading.Event()
+    done = object()
+
+    def put(entry) -> bool:
+        while not stopped.is_set():
+            try:
+                results.put(entry, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce() -> None:
+        try:
+            for item in items:
+                if stopped.is_set():
+                    return
+                try:
+                    entry = (item, fn(item), None)
+                except Exception as e:
+                    put((item, None, e))
+                    return
+                if not put(entry):
+                    return
+        except Exception as e:
+            put((None, None, e))
+            return
+        put((done, None, None))
+
+    producer = threading.Thread(target=produce, name="prefetch", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, result, error = results.get()
+            if item is done:
+                return
+            if error is not None:
+                raise error
+            yield item, result
+    finally:
+        stopped.set()
+        producer.join()
@@ -0,0 +1,26 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+import threading
+
+
+class LazyProcessPool:
+    """A process pool that is only started when the first job is submitted
+
+    Shut it down with `close`; an open pool is also joined when the interpreter exits.
+    """
+
+    def __init__(self, max_workers: int | None = None):
+        self._max_workers = max_workers
+        self._pool: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args) -> Future:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self._max_workers)
+            return self._pool.submit(fn, *args)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
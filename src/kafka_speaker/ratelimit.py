@@ -0,0 +1,84 @@
+import threading
+import time
+from typing import Callable, Dict
+
+# Slack's published limits as (requests per second, burst). Methods are keyed by the
+# WebClient method name. chat.postMessage is limited to about one message per second
+# per channel with short bursts allowed; the rest are per workspace.
+# https://api.slack.com/apis/rate-limits
+SLACK_RATE_LIMITS: Dict[str, tuple[float, float]] = {
+    "chat_postMessage": (1.0, 3),
+    # files_upload_v2 wraps files.getUploadURLExternal and files.completeUploadExternal (Tier 4)
+    "files_upload_v2": (100 / 60, 10),
+}
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `capacity`"""
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: float) -> float:
+        """Take tokens, possibly going into debt, and return how long to wait for them"""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait, self._paused_until - now)
+
+    def acquire(self, tokens: float = 1) -> float:
+        """Block until tokens are available and return the time spent waiting"""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+    def pause(self, seconds: float) -> None:
+        """Hold every caller for at least `seconds`, e.g. after a Retry-After"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
+            self._tokens = min(self._tokens, 0)
+
+
+class RateLimiter:
+    """One token bucket per (method, key), e.g. per Slack method and channel
+
+    Methods without a configured limit are not throttled.
+    """
+
+    def __init__(self, limits: Dict[str, tuple[float, float]] = SLACK_RATE_LIMITS, clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self._limits = limits
+        self._clock = clock
+        self._sleep = sleep
+        self._buckets: Dict[tuple[str, str], TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, method: str, key: str) -> TokenBucket | None:
+        if method not in self._limits:
+            return None
+        with self._lock:
+            if (method, key) not in self._buckets:
+                rate, capacity = self._limits[method]
+                self._buckets[(method, key)] = TokenBucket(rate, capacity, self._clock, self._sleep)
+            return self._buckets[(method, key)]
+
+    def acquire(self, method: str, key: str = "") -> float:
+        bucket = self._bucket(method, key)
+        return bucket.acquire() if bucket else 0.0
+
+    def pause(self, method: str, key: str, seconds: float) -> None:
+        bucket = self._bucket(method, key)
+        if bucket:
+            bucket.pause(seconds)
+        else:
+            self._sleep(seconds)
@@ -0,0 +1,157 @@
+from dataclasses import dataclass
+import json
+import os
+from pathlib import Path
+import threading
+from typing import Dict
+import openai
+from kafka_speaker.cache import DEFAULT_CACHE_DIR, cache_key
+
+DEFAULT_REGISTRY_PATH = DEFAULT_CACHE_DIR / "assistants.json"
+
+# Assistant metadata key holding the fingerprint of the configuration it was last set up with
+FINGERPRINT_KEY = "kafka_speaker_fingerprint"
+
+
+@dataclass
+class RegisteredAssistant:
+    id: str
+    name: str
+
+
+def assistant_fingerprint(name: str, description: str, params: Dict) -> str:
+    """Hash of everything that goes into an assistant: name, model, instructions, schema and tools"""
+    return cache_key("assistant", name, description, params)
+
+
+def _account_key(openai_client) -> str:
+    """Assistants belong to a project, so registry entries are kept per API key and endpoint"""
+    return cache_key(
+        str(getattr(openai_client, "base_url", "")),
+        getattr(openai_client, "organization", None),
+        getattr(openai_client, "project", None),
+        getattr(openai_client, "api_key", None),
+    )[:16]
+
+
+class AssistantRegistry:
+    """Remembers which assistant ID was set up with which configuration
+
+    A registered assistant is fetched with a single retrieve call instead of paging
+    through every assistant to find it by name. Either way it's only updated if the
+    fingerprint in its metadata is out of date, so an assistant that was changed or
+    deleted elsewhere, e.g. by another machine with its own registry, is caught.
+    New IDs and fingerprints are written back to `path`, or only kept in memory if
+    path is None.
+    """
+
+    def __init__(self, path: str | Path | None = DEFAULT_REGISTRY_PATH):
+        self.path = Path(path) if path else None
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Dict[str, str]]] = {}
+        if self.path and self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Ignoring unreadable assistant registry {self.path}: {e}")
+
+    def registered_id(self, openai_client, name: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(_account_key(openai_client), {}).get(name)
+        return entry["id"] if entry else None
+
+    def remember(self, openai_client, name: str, assistant_id: str, fingerprint: str) -> RegisteredAssistant:
+        entry = {"id": assistant_id, "fingerprint": fingerprint}
+        with self._lock:
+            entries = self._entries.setdefault(_account_key(openai_client), {})
+            if entries.get(name) == entry:
+                return RegisteredAssistant(assistant_id, name)
+            entries[name] = entry
+            if self.path:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = self.path.with_name(self.path.name + f".{os.getpid()}.tmp")
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self._entries, f, indent=2)
+                os.replace(tmp_path, self.path)
+        return RegisteredAssistant(assistant_id, name)
+
+    def forget(self, openai_client, name: str) -> None:
+        with self._lock:
+            self._entries.get(_account_key(openai_client), {}).pop(name, None)
+
+    def setup(self, openai_client: openai.OpenAI, name: str, description: str, params: Dict) -> RegisteredAssistant:
+        """Find, update or create the assistant called name so it matches params"""
+        fingerprint = assistant_fingerprint(name, description, params)
+        assistant_id = self.registered_id(openai_client, name)
+        if assistant_id:
+            try:
+                registered = openai_client.beta.assistants.retrieve(assistant_id)
+            except openai.NotFoundError:
+                print(f"Assistant {name} ({assistant_id}) no longer exists")
+                self.forget(openai_client, name)
+            else:
+                return self._reconcile(openai_client, name, registered, params, fingerprint)
+
+        # Iterating the list page fetches the following pages as needed
+        existing = next((a for a in openai_client.beta.assistants.list(order="desc", limit=100) if a.name == name), None)
+        if existing is None:
+            print(f"Assistant {name} does not exist, creating it.")
+            assistant = openai_client.beta.assistants.create(
+                name=name,
+                description=description,
+                metadata={FINGERPRINT_KEY: fingerprint},
+                **params
+            )
+            return self.remember(openai_client, name, assistant.id, fingerprint)
+        return self._reconcile(openai_client, name, existing, params, fingerprint)
+
+    def _reconcile(self, openai_client: openai.OpenAI, name: str, assistant, params: Dict, fingerprint: str) -> RegisteredAssistant:
+        """Register assistant, updating it first unless its metadata has this fingerprint"""
+        if (assistant.metadata or {}).get(FINGERPRINT_KEY) == fingerprint:
+            return self.remember(openai_client, name, assistant.id, fingerprint)
+        return self._update(openai_client, name, assistant.id, params, fingerprint)
+
+    def _update(self, openai_client: openai.OpenAI, name: str, assistant_id: str, params: Dict, fingerprint: str) -> RegisteredAssistant:
+        print(f"Assistant {name} already exists, updating it.")
+        openai_client.beta.assistants.update(assistant_id, metadata={FINGERPRINT_KEY: fingerprint}, **params)
+        return self.remember(openai_client, name, assistant_id, fingerprint)
+
+    async def setup_async(self, openai_client: openai.AsyncOpenAI, name: str, description: str, params: Dict) -> RegisteredAssistant:
+        """`setup` for the async client"""
+        fingerprint = assistant_fingerprint(name, description, params)
+        assistant_id = self.registered_id(openai_client, name)
+        if assistant_id:
+            try:
+                registered = await openai_client.beta.assistants.retrieve(assistant_id)
+            except openai.NotFoundError:
+                print(f"Assistant {name} ({assistant_id}) no longer exists")
+                self.forget(openai_client, name)
+            else:
+                return await self._reconcile_async(openai_client, name, registered, params, fingerprint)
+
+        existing = None
+        async for assistant in openai_client.beta.assistants.list(order="desc", limit=100):
+            if assistant.name == name:
+                existing = assistant
+                break
+        if existing is None:
+            print(f"Assistant {name} does not exist, creating it.")
+            assistant = await openai_client.beta.assistants.create(
+                name=name,
+                description=description,
+                metadata={FINGERPRINT_KEY: fingerprint},
+                **params
+            )
+            return self.remember(openai_client, name, assistant.id, fingerprint)
+        return await self._reconcile_async(openai_client, name, existing, params, fingerprint)
+
+    async def _reconcile_async(self, openai_client: openai.AsyncOpenAI, name: str, assistant, params: Dict, fingerprint: str) -> RegisteredAssistant:
+        if (assistant.metadata or {}).get(FINGERPRINT_KEY) == fingerprint:
+            return self.remember(openai_client, name, assistant.id, fingerprint)
+        return await self._update_async(openai_client, name, assistant.id, params, fingerprint)
+
+    async def _update_async(self, openai_client: openai.AsyncOpenAI, name: str, assistant_id: str, params: Dict, fingerprint: str) -> RegisteredAssistant:
+        print(f"Assistant {name} already exists, updating it.")
+        await openai_client.beta.assistants.update(assistant_id, metadata={FINGERPRINT_KEY: fingerprint}, **params)
+        return self.remember(openai_client, name, assistant_id, fingerprint)
@@ -0,0 +1,340 @@
+"""Render attachments locally from structured document content
+
+Instead of having a code_interpreter assistant build each file in a sandbox, the
+model only writes the content as a `_document_format` JSON object and the file
+is rendered here. Markdown, text and CSV need nothing extra. The office formats
+need the optional `documents` dependencies (python-docx, python-pptx, openpyxl
+and reportlab); without them those attachments are rendered as markdown.
+"""
+from concurrent.futures import Future
+import csv
+from dataclasses import dataclass
+import io
+import json
+from typing import Any, Callable, Dict
+from kafka_speaker.pool import LazyProcessPool
+
+_document_instructions = '''
+You are participating in an art project where we are re-interpreting Kafka texts as Slack channel conversations.
+
+Your responsibility is to write the documents that the people are sending. You'll be given a filename, a document extension, and a description of the document that you need to write.
+
+Do not directly refer to Kafka in the documents--we are trying to make Kafka-esque documents, not refer to Kafka.
+
+When writing documents, please add whimsical details and lengthen the document to make it more interesting while following the Kafka-esque themes.
+
+All documents should be in English.
+
+Write only the content; it will be laid out as the requested document type for you. Spreadsheets and CSV files are made from the tables, and each section of a presentation becomes a slide. Leave out anything a section doesn't need by using empty arrays.
+'''
+
+_document_format = {
+    "name": "document",
+    "schema": {
+        "type": "object",
+        "properties": {
+            "title": {
+                "type": "string",
+                "description": "The title of the document."
+            },
+            "sections": {
+                "type": "array",
+                "description": "The sections of the document, in order.",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "heading": {
+                            "type": "string",
+                            "description": "The heading of the section, or slide title."
+                        },
+                        "paragraphs": {
+                            "type": "array",
+                            "description": "Paragraphs of plain text.",
+                            "items": {"type": "string"}
+                        },
+                        "bullets": {
+                            "type": "array",
+                            "description": "Bullet points that follow the paragraphs.",
+                            "items": {"type": "string"}
+                        },
+                        "table": {
+                            "type": "object",
+                            "description": "A table that follows the bullets. Use empty columns and rows for no table.",
+                            "properties": {
+                                "columns": {"type": "array", "items": {"type": "string"}},
+                                "rows": {"type": "array", "items": {"type": "array", "items": {"type": "string"}}}
+                            },
+                            "required": ["columns", "rows"],
+                            "additionalProperties": False
+                        }
+                    },
+                    "required": ["heading", "paragraphs", "bullets", "table"],
+                    "additionalProperties": False
+                }
+            }
+        },
+        "required": ["title", "sections"],
+        "additionalProperties": False
+    },
+    "strict": True
+}
+
+
+@dataclass(slots=True)
+class Table:
+    columns: list[str]
+    rows: list[list[str]]
+
+
+@dataclass(slots=True)
+class Section:
+    heading: str
+    paragraphs: list[str]
+    bullets: list[str]
+    table: Table | None
+
+
+@dataclass(slots=True)
+class Document:
+    title: str
+    sections: list[Section]
+
+    @property
+    def tables(self) -> list[tuple[str, Table]]:
+        """(heading, table) for every section with a table"""
+        return [(section.heading, section.table) for section in self.sections if section.table]
+
+
+def _strings(value: Any, field: str) -> list[str]:
+    if type(value) is not list or any(type(item) is not str for item in value):
+        raise ValueError(f"Document {field} should be a list of strings")
+    return value
+
+
+def parse_document(text: str) -> Document:
+    """Decode and validate a `_document_format` response"""
+    data = json.loads(text)
+    if type(data) is not dict or type(data.get("title")) is not str or type(data.get("sections")) is not list:
+        raise ValueError("Document should have a title and sections")
+    sections = []
+    for section in data["sections"]:
+        if type(section) is not dict or type(section.get("heading")) is not str:
+            raise ValueError("Document section should have a heading")
+        table = section.get("table") or {}
+        columns = _strings(table.get("columns", []), "table columns")
+        rows = [_strings(row, "table rows") for row in table.get("rows", [])]
+        sections.append(Section(
+            section["heading"],
+            _strings(section.get("paragraphs", []), "paragraphs"),
+            _strings(section.get("bullets", []), "bullets"),
+            Table(columns, rows) if columns or rows else None,
+        ))
+    return Document(data["title"], sections)
+
+
+def _render_markdown(document: Document) -> bytes:
+    lines = [f"# {document.title}", ""]
+    for section in document.sections:
+        if section.heading:
+            lines += [f"## {section.heading}", ""]
+        for paragraph in section.paragraphs:
+            lines += [paragraph, ""]
+        if section.bullets:
+            lines += [f"- {bullet}" for bullet in section.bullets] + [""]
+        if section.table:
+            width = max([len(section.table.columns)] + [len(row) for row in section.table.rows])
+            columns = section.table.columns + [""] * (width - len(section.table.columns))
+            lines.append("| " + " | ".join(columns) + " |")
+            lines.append("|" + " --- |" * width)
+            for row in section.table.rows:
+                lines.append("| " + " | ".join(cell.replace("|", "\\|") for cell in row + [""] * (width - len(row))) + " |")
+            lines.append("")
+    return "\n".join(lines).encode("utf-8")
+
+
+def _render_text(document: Document) -> bytes:
+    lines = [document.title, "=" * len(document.title), ""]
+    for section in document.sections:
+        if section.heading:
+            lines += [section.heading, "-" * len(section.heading), ""]
+        for paragraph in section.paragraphs:
+            lines += [paragraph, ""]
+        if section.bullets:
+            lines += [f"* {bullet}" for bullet in section.bullets] + [""]
+        if section.table:
+            lines += ["\t".join(row) for row in [section.table.columns, *section.table.rows]] + [""]
+    return "\n".join(lines).encode("utf-8")
+
+
+def _render_csv(document: Document) -> bytes:
+    """The first table, or failing that one row per bullet or paragraph"""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    if document.tables:
+        table = document.tables[0][1]
+        if table.columns:
+            writer.writerow(table.columns)
+        writer.writerows(table.rows)
+    else:
+        writer.writerow(["section", "text"])
+        for section in document.sections:
+            for text in section.paragraphs + section.bullets:
+                writer.writerow([section.heading, text])
+    return out.getvalue().encode("utf-8")
+
+
+def _render_docx(document: Document) -> bytes:
+    import docx
+
+    doc = docx.Document()
+    doc.add_heading(document.title, level=0)
+    for section in document.sections:
+        if section.heading:
+            doc.add_heading(section.heading, level=1)
+        for paragraph in section.paragraphs:
+            doc.add_paragraph(paragraph)
+        for bullet in section.bullets:
+            doc.add_paragraph(bullet, style="List Bullet")
+        if section.table:
+            width = max([len(section.table.columns)] + [len(row) for row in section.table.rows])
+            table = doc.add_table(rows=0, cols=width)
+            table.style = "Table Grid"
+            for row in [section.table.columns, *section.table.rows] if section.table.columns else section.table.rows:
+                cells = table.add_row().cells
+                for cell, text in zip(cells, row):
+                    cell.text = text
+    out = io.BytesIO()
+    doc.save(out)
+    return out.getvalue()
+
+
+def _render_pptx(document: Document) -> bytes:
+    from pptx import Presentation
+    from pptx.util import Inches
+
+    presentation = Presentation()
+    title_slide = presentation.slides.add_slide(presentation.slide_layouts[0])
+    title_slide.shapes.title.text = document.title
+    for section in document.sections:
+        slide = presentation.slides.add_slide(presentation.slide_layouts[1])
+        slide.shapes.title.text = section.heading
+        body = slide.placeholders[1].text_frame
+        texts = [(text, 0) for text in section.paragraphs] + [(text, 1) for text in section.bullets]
+        for i, (text, level) in enumerate(texts):
+            paragraph = body.paragraphs[0] if i == 0 else body.add_paragraph()
+            paragraph.text = text
+            paragraph.level = level
+        if section.table:
+            rows = [section.table.columns, *section.table.rows] if section.table.columns else section.table.rows
+            width = max(len(row) for row in rows)
+            table_slide = presentation.slides.add_slide(presentation.slide_layouts[5])
+            table_slide.shapes.title.text = section.heading
+            table = table_slide.shapes.add_table(len(rows), width, Inches(0.5), Inches(1.5), Inches(9), Inches(0.4) * len(rows)).table
+            for r, row in enumerate(rows):
+                for c, text in enumerate(row):
+                    table.cell(r, c).text = text
+    out = io.BytesIO()
+    presentation.save(out)
+    return out.getvalue()
+
+
+def _sheet_title(heading: str, taken: set[str]) -> str:
+    """Excel sheet names are at most 31 characters, unique, and can't contain []:*?/\\"""
+    base = "".join(c for c in heading if c not in "[]:*?/\\")[:28] or "Sheet"
+    title, n = base, 1
+    while title.lower() in taken:
+        n += 1
+        title = f"{base[:28 - len(str(n))]} {n}"
+    taken.add(title.lower())
+    return title
+
+
+def _render_xlsx(document: Document) -> bytes:
+    from openpyxl import Workbook
+
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+    taken: set[str] = set()
+    for heading, table in document.tables:
+        sheet = workbook.create_sheet(_sheet_title(heading, taken))
+        if table.columns:
+            sheet.append(table.columns)
+        for row in table.rows:
+            sheet.append(row)
+    notes = [(section.heading, text) for section in document.sections for text in section.paragraphs + section.bullets]
+    if notes or not document.tables:
+        sheet = workbook.create_sheet(_sheet_title("Notes", taken))
+        sheet.append([document.title])
+        for row in notes:
+            sheet.append(list(row))
+    out = io.BytesIO()
+    workbook.save(out)
+    return out.getvalue()
+
+
+def _render_pdf(document: Document) -> bytes:
+    from xml.sax.saxutils import escape
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import ListFlowable, ListItem, Paragraph, SimpleDocTemplate, Spacer, Table as PdfTable, TableStyle
+
+    styles = getSampleStyleSheet()
+    story = [Paragraph(escape(document.title), styles["Title"])]
+    for section in document.sections:
+        if section.heading:
+            story.append(Paragraph(escape(section.heading), styles["Heading2"]))
+        for paragraph in section.paragraphs:
+            story.append(Paragraph(escape(paragraph), styles["BodyText"]))
+        if section.bullets:
+            story.append(ListFlowable(
+                [ListItem(Paragraph(escape(bullet), styles["BodyText"])) for bullet in section.bullets],
+                bulletType="bullet"
+            ))
+        if section.table:
+            rows = [section.table.columns, *section.table.rows] if section.table.columns else section.table.rows
+            width = max(len(row) for row in rows)
+            table = PdfTable([[Paragraph(escape(cell), styles["BodyText"]) for cell in row + [""] * (width - len(row))] for row in rows])
+            table.setStyle(TableStyle([("GRID", (0, 0), (-1, -1), 0.5, colors.grey)]))
+            story.append(table)
+        story.append(Spacer(1, 12))
+    out = io.BytesIO()
+    SimpleDocTemplate(out, pagesize=letter, title=document.title).build(story)
+    return out.getvalue()
+
+
+_RENDERERS: Dict[str, Callable[[Document], bytes]] = {
+    "md": _render_markdown,
+    "txt": _render_text,
+    "csv": _render_csv,
+    "docx": _render_docx,
+    "pptx": _render_pptx,
+    "xlsx": _render_xlsx,
+    "pdf": _render_pdf,
+}
+
+
+def render_document(document: Document, docext: str) -> tuple[str, bytes]:
+    """Render a document as docext
+
+    Returns:
+        The extension actually rendered, which is "md" for unknown formats or when
+        the library for the format isn't installed, and the file contents
+    """
+    docext = docext.lower().lstrip(".")
+    renderer = _RENDERERS.get(docext)
+    if renderer is None:
+        return "md", _render_markdown(document)
+    try:
+        return docext, renderer(document)
+    except ImportError as e:
+        print(f"Can't render .{docext} without {e.name}, writing markdown instead")
+        return "md", _render_markdown(document)
+
+
+class DocumentRenderer(LazyProcessPool):
+    """Renders documents in a process pool, off the threads waiting on the API"""
+
+    def render(self, document: Document, docext: str) -> Future:
+        """Queue a document for `render_document`; the future holds (docext, content)"""
+        return self.submit(render_document, document, docext)
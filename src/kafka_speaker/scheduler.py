@@ -0,0 +1,157 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import glob
+import os
+from pathlib import Path
+from typing import Dict
+import openai
+from kafka_speaker.cache import GenerationCache
+from kafka_speaker.governor import Governor
+from kafka_speaker.images import ImageOptions
+from kafka_speaker.registry import AssistantRegistry
+from kafka_speaker.telemetry import Telemetry
+from kafka_speaker.threads import ThreadPolicy
+from kafka_speaker.speaker import FileBudget, KafkaSpeaker, process_book
+
+
+def book_paths(pattern: str) -> list[Path]:
+    """Resolve a file, directory or glob pattern into a sorted list of book files
+
+    Directories are expanded to the `.txt` files they contain.
+    """
+    path = Path(pattern)
+    if path.is_dir():
+        return sorted(path.glob("*.txt"))
+    if path.is_file():
+        return [path]
+    return sorted(Path(p) for p in glob.glob(pattern) if Path(p).is_file())
+
+
+def book_output_names(file_paths: list[Path]) -> Dict[Path, str]:
+    """Name each book's output subdirectory after the book, e.g. "pg69327"
+
+    Books that share a stem, like a/book.txt and b/book.txt, are named by their path
+    from the books' common directory instead, e.g. "a-book" and "b-book".
+    """
+    stems = Counter(path.stem for path in file_paths)
+    common = Path(os.path.commonpath([path.resolve().parent for path in file_paths])) if file_paths else None
+    names = {}
+    for path in file_paths:
+        if stems[path.stem] == 1:
+            names[path] = path.stem
+            continue
+        relative = path.resolve().relative_to(common)
+        names[path] = "-".join(relative.with_suffix("").parts)
+    # Books differing only by extension, e.g. book.txt and book.md
+    duplicates = Counter(names.values())
+    for path, name in names.items():
+        if duplicates[name] > 1:
+            names[path] = f"{name}-{path.suffix.lstrip('.')}"
+    if len(set(names.values())) != len(names):
+        raise ValueError(f"Can't give each book its own output directory: {sorted(map(str, file_paths))}")
+    return names
+
+
+def process_books(
+    file_paths: list[Path],
+    skip_past: str,
+    end_at: str,
+    output_dir: str | Path,
+    openai_client: openai.OpenAI,
+    model: str,
+    file_limit: int,
+    max_books: int = 2,
+    max_workers: int = 4,
+    resume: bool = False,
+    cache: GenerationCache | None = None,
+    backend: str = "assistants",
+    registry: AssistantRegistry | None = None,
+    thread_policy: ThreadPolicy | None = None,
+    attachments: str = "assistant",
+    image_options: ImageOptions | None = None,
+    telemetry: Telemetry | None = None,
+    governor: Governor | None = None,
+    stream: bool = False,
+    lookahead: int = 0
+) -> Dict[str, Dict]:
+    """Process several books at once, each into its own output subtree
+
+    The assistants are set up once and shared by every book, while each book gets
+    its own message thread. All books draw attachments from one worker pool and
+    one file budget.
+
+    Args:
+        file_paths: Book files to process
+        skip_past: String to skip past in each book file
+        end_at: String to end at in each book file
+        output_dir: Directory to create one subdirectory per book in
+        openai_client: OpenAI client instance
+        model: OpenAI model to use
+        file_limit: File budget shared by all books
+        max_books: Number of books to generate messages for at once
+        max_workers: Number of attachments to generate at once across all books
+        resume: Pick up each book from the journal left behind by an interrupted run
+        cache: Cache of previous generations to reuse
+        backend: Message generation backend, see `KafkaSpeaker`
+        registry: Where assistant IDs are remembered between runs
+        thread_policy: When to start a new message thread in each book, see `ThreadPolicy`
+        attachments: How documents are made, see `KafkaSpeaker`
+        image_options: How to post-process generated images, see `ImageOptions`
+        telemetry: Where API call latency, tokens and cost are recorded for every book, see `Telemetry`
+        governor: Enforces spend and rate budgets across every book, see `Governor`
+        stream: Start each message's attachments as soon as it's generated, see `process_book`
+        lookahead: Paragraphs of each book to generate messages for ahead, see `process_book`
+
+    Returns:
+        Dict mapping each book's output directory name, see `book_output_names`, to its conversation history
+    """
+    output_dir = Path(output_dir)
+    file_budget = FileBudget(file_limit)
+
+    names = book_output_names(file_paths)
+
+    # Set up the assistants once instead of once per book
+    base_speaker = KafkaSpeaker(openai_client, model, cache, backend, registry=registry, thread_policy=thread_policy, attachments=attachments, image_options=image_options, telemetry=telemetry, governor=governor)
+    try:
+        base_speaker.warm(threads=False)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as attachment_executor, \
+                ThreadPoolExecutor(max_workers=max_books) as book_executor:
+            futures = {
+                names[file_path]: book_executor.submit(
+                    _process_forked_book,
+                    base_speaker,
+                    file_path=str(file_path),
+                    skip_past=skip_past,
+                    end_at=end_at,
+                    output_dir=output_dir / names[file_path],
+                    openai_client=openai_client,
+                    model=model,
+                    file_limit=file_limit,
+                    file_budget=file_budget,
+                    executor=attachment_executor,
+                    resume=resume,
+                    stream=stream,
+                    lookahead=lookahead
+                )
+                for file_path in file_paths
+            }
+
+            results = {}
+            for name, future in futures.items():
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    print(f"Failed to process book {name}: {e}")
+    finally:
+        base_speaker.close()
+    return results
+
+
+def _process_forked_book(base_speaker: KafkaSpeaker, **kwargs) -> Dict:
+    """Run `process_book` with a fork of base_speaker, stopping any pools the fork starts"""
+    speaker = base_speaker.fork()
+    try:
+        return process_book(speaker=speaker, **kwargs)
+    finally:
+        speaker.close()
@@ -0,0 +1,215 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+import shutil
+from typing import Dict
+import openai
+from kafka_speaker.cache import GenerationCache
+from kafka_speaker.governor import Governor
+from kafka_speaker.images import ImageOptions
+from kafka_speaker.model import Conversation
+from kafka_speaker.paragraph import (
+    ParagraphIndexEntry,
+    build_paragraph_index,
+    file_paragraphs,
+    load_paragraph_index,
+    save_paragraph_index,
+)
+from kafka_speaker.registry import AssistantRegistry
+from kafka_speaker.speaker import KafkaSpeaker, _write_conversations, process_book
+from kafka_speaker.telemetry import Telemetry
+from kafka_speaker.threads import ThreadPolicy
+
+SHARD_NAME = "shard.json"
+
+
+def default_index_path(cache_dir: str | Path, file_path: str) -> Path:
+    """Where to keep the paragraph index of a book in the cache directory, keyed by the book's path"""
+    key = hashlib.sha256(str(Path(file_path).resolve()).encode("utf-8")).hexdigest()[:16]
+    return Path(cache_dir) / "paragraph-index" / f"{Path(file_path).stem}-{key}.json"
+
+
+def paragraph_index(file_path: str, skip_past: str, end_at: str, index_path: str | Path | None = None) -> list[ParagraphIndexEntry]:
+    """Load the paragraph index from index_path, building and saving it if needed
+
+    The saved index is rebuilt when it was made from a file of a different size or
+    modification time, or with other markers.
+    """
+    stat = os.stat(file_path)
+    params = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "skip_past": skip_past, "end_at": end_at}
+    index = load_paragraph_index(index_path, **params) if index_path else None
+    if index is None:
+        index = build_paragraph_index(file_path, skip_past, end_at)
+        if index_path:
+            save_paragraph_index(index_path, index, **params)
+    return index
+
+
+def shard_range(index: list[ParagraphIndexEntry], shard_index: int, shard_count: int, by_chapter: bool = False) -> list[ParagraphIndexEntry]:
+    """The contiguous run of paragraphs belonging to one shard
+
+    Paragraphs are split as evenly as possible. With by_chapter, shards only break
+    at chapter boundaries so each chapter's conversations share a thread; a shard
+    may then be empty if there are fewer chapters than shards.
+    """
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"Shard index {shard_index} out of range for {shard_count} shards")
+
+    def boundary(i: int) -> int:
+        cut = i * len(index) // shard_count
+        if by_chapter:
+            # Move forward to the first paragraph of the next chapter
+            while 0 < cut < len(index) and index[cut].chapter_title == index[cut - 1].chapter_title:
+                cut += 1
+        return cut
+
+    return index[boundary(shard_index):boundary(shard_index + 1)]
+
+
+def process_shard(
+    file_path: str,
+    skip_past: str,
+    end_at: str,
+    output_dir: str | Path,
+    openai_client: openai.OpenAI,
+    model: str,
+    file_limit: int,
+    shard_index: int,
+    shard_count: int,
+    by_chapter: bool = False,
+    index_path: str | Path | None = None,
+    max_workers: int = 4,
+    resume: bool = False,
+    cache: GenerationCache | None = None,
+    backend: str = "assistants",
+    speaker: KafkaSpeaker | None = None,
+    registry: AssistantRegistry | None = None,
+    thread_policy: ThreadPolicy | None = None,
+    attachments: str = "assistant",
+    image_options: ImageOptions | None = None,
+    telemetry: Telemetry | None = None,
+    governor: Governor | None = None,
+    stream: bool = False,
+    lookahead: int = 0
+) -> Dict:
+    """Process one shard of a book, seeking straight to its first paragraph
+
+    Writes conversations.json and attachments like `process_book`, plus a shard.json
+    recording which paragraphs the shard covers, for `merge_shards`.
+
+    Args:
+        file_limit: Limit for the number of files to generate in this shard
+        shard_index: Which shard to process, counting from 0
+        shard_count: Number of shards the book is split into
+        by_chapter: Only split the book at chapter boundaries
+        index_path: Where to keep the paragraph index, so it's only built once
+        See `process_book` for the rest.
+
+    Returns:
+        Dict containing the conversation history that was written to the output directory
+    """
+    output_dir = Path(output_dir)
+    entries = shard_range(paragraph_index(file_path, skip_past, end_at, index_path), shard_index, shard_count, by_chapter)
+    print(f"Shard {shard_index + 1}/{shard_count} has {len(entries)} paragraphs")
+
+    paragraphs = iter(())
+    if entries:
+        paragraphs = file_paragraphs(file_path, skip_past, end_at, start=entries[0], stop_after=entries[-1].paragraph_number)
+    output = process_book(
+        file_path=file_path,
+        skip_past=skip_past,
+        end_at=end_at,
+        output_dir=output_dir,
+        openai_client=openai_client,
+        model=model,
+        file_limit=file_limit,
+        max_workers=max_workers,
+        resume=resume,
+        cache=cache,
+        backend=backend,
+        speaker=speaker,
+        paragraphs=paragraphs,
+        registry=registry,
+        thread_policy=thread_policy,
+        attachments=attachments,
+        image_options=image_options,
+        telemetry=telemetry,
+        governor=governor,
+        stream=stream,
+        lookahead=lookahead
+    )
+
+    with open(output_dir / SHARD_NAME, "w", encoding="utf-8") as f:
+        json.dump({
+            "shard_index": shard_index,
+            "shard_count": shard_count,
+            "first_paragraph": entries[0].paragraph_number if entries else None,
+            "last_paragraph": entries[-1].paragraph_number if entries else None,
+        }, f, indent=2)
+    return output
+
+
+def _link_or_copy(source: Path, target: Path) -> None:
+    if target.exists():
+        target.unlink()
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def merge_shards(shard_dirs: list[str | Path], output_dir: str | Path) -> Dict:
+    """Stitch shard outputs into one conversations.json, renumbering the ATT files
+
+    Shards are ordered by their shard.json, and every shard of the run must be present.
+    Attachments and their thumbnails are hard linked into the merged attachments directory where possible
+    and copied otherwise.
+
+    Args:
+        shard_dirs: Output directories of `process_shard`
+        output_dir: Directory to write the merged output to
+
+    Returns:
+        Dict containing the conversation history that was written to the output directory
+    """
+    shards = []
+    for shard_dir in shard_dirs:
+        with open(Path(shard_dir) / SHARD_NAME, "r", encoding="utf-8") as f:
+            shards.append((json.load(f), Path(shard_dir)))
+    shards.sort(key=lambda shard: shard[0]["shard_index"])
+
+    counts = {info["shard_count"] for info, _ in shards}
+    indexes = [info["shard_index"] for info, _ in shards]
+    if len(counts) != 1 or indexes != list(range(counts.pop())):
+        raise ValueError(f"Expected one output for each shard, got shards {indexes}")
+
+    output_dir = Path(output_dir)
+    attachments_dir = output_dir / "attachments"
+    attachments_dir.mkdir(parents=True, exist_ok=True)
+
+    conversations = []
+    file_number = 0
+    for _, shard_dir in shards:
+        with open(shard_dir / "conversations.json", "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for conv in data["conversations"]:
+            conversation = Conversation.from_dict(conv)
+            for msg in conversation.messages:
+                for file_desc in msg.files:
+                    file_number += 1
+                    if not file_desc.saved_name:
+                        continue
+                    source = shard_dir / "attachments" / file_desc.saved_name
+                    target = attachments_dir / f"ATT{file_number:07d}{Path(file_desc.saved_name).suffix}"
+                    _link_or_copy(source, target)
+                    # Thumbnails are named like their image, so they're renumbered with it
+                    thumbnail = shard_dir / "attachments" / "thumbnails" / file_desc.saved_name
+                    if thumbnail.exists():
+                        (attachments_dir / "thumbnails").mkdir(exist_ok=True)
+                        _link_or_copy(thumbnail, attachments_dir / "thumbnails" / target.name)
+                    file_desc.set_saved_location(target)
+            conversations.append(conversation)
+
+    print(f"Merged {len(shards)} shards into {len(conversations)} conversations with {file_number} files")
+    return _write_conversations(output_dir, conversations)
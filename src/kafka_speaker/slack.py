@@ -1,12 +1,22 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from pathlib import Path
+import hashlib
 import json
-from typing import Dict, List, Callable
+import os
+from typing import Dict, Iterable, Iterator, List, Callable
+import threading
 import time
 import random
 
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 
+from kafka_speaker.ratelimit import SLACK_RATE_LIMITS, RateLimiter
+from kafka_speaker.model import Conversation, File, Message
+from kafka_speaker.speaker import CONVERSATIONS_JSONL, JSONL_END_KEY
+from kafka_speaker.store import CHUNK_SIZE
+from kafka_speaker.telemetry import Telemetry
+
 # List of friendly emojis to assign to users
 FRIENDLY_EMOJIS = [
     ':unicorn_face:', ':smiley_cat:', ':pouting_cat:', ':penguin:', ':chicken:', ':llama:', ':frog:', 
@@ -17,19 +27,68 @@ FRIENDLY_EMOJIS = [
     ':blowfish:', ':duck:', ':eagle:', ':flamingo:', ':hippopotamus:', ':owl:', ':sloth:', ':black_cat:', ':tiger:', ':rage:'
 ]
 
+# Uploads are paced by the rate limiter; this only bounds how many are in flight
+FILE_UPLOAD_WORKERS = 4
+
 class SlackUploader:
-    def __init__(self, token: str):
+    def __init__(
+        self,
+        token: str,
+        client: WebClient | None = None,
+        upload_workers: int = FILE_UPLOAD_WORKERS,
+        rate_limiter: RateLimiter | None = None,
+        max_conversations: int = 4,
+        max_retries: int = 5,
+        telemetry: Telemetry | None = None
+    ):
         """Initialize the Slack uploader with a bot token
         
         Args:
             token: Slack bot user OAuth token
+            client: Client to use instead of creating a WebClient for the token
+            upload_workers: Number of files to upload concurrently
+            rate_limiter: Paces API calls, Slack's published limits by default
+            max_conversations: Number of threaded conversations to post concurrently
+            max_retries: Number of times to retry a call that was rate limited
+            telemetry: Where the time taken by each API call is recorded
         """
-        self.client = WebClient(token=token)
+        self.client = client or WebClient(token=token)
+        self._upload_workers = upload_workers
+        self._rate_limiter = rate_limiter or RateLimiter(SLACK_RATE_LIMITS)
+        self._max_conversations = max_conversations
+        self._max_retries = max_retries
+        self.telemetry = telemetry or Telemetry()
         self._user_emojis = {}  # Cache for user -> emoji mappings
         self._available_emojis = FRIENDLY_EMOJIS.copy()  # Available emojis for assignment
+        self._emoji_lock = threading.Lock()
+
+    def _call(self, method: str, key: str, **kwargs):
+        """Call a WebClient method at the pace of its rate limit, retrying 429s
+
+        Args:
+            method: WebClient method name, e.g. "chat_postMessage"
+            key: What the limit applies to, e.g. the channel for chat_postMessage
+        """
+        with self.telemetry.measure(f"slack.{method}"):
+            for attempt in range(self._max_retries + 1):
+                self.telemetry.add_wait(self._rate_limiter.acquire(method, key))
+                try:
+                    return getattr(self.client, method)(**kwargs)
+                except SlackApiError as e:
+                    if e.response.status_code != 429 or attempt == self._max_retries:
+                        raise
+                    # Honor Retry-After, backing off further if we keep getting limited
+                    retry_after = float(e.response.headers.get("Retry-After", 1))
+                    delay = max(retry_after, 2 ** attempt)
+                    print(f"Rate limited on {method}, retrying in {delay}s")
+                    self._rate_limiter.pause(method, key, delay)
 
     def _assign_emoji(self, username: str) -> str:
         """Consistently assign an emoji to a username"""
+        with self._emoji_lock:
+            return self._assign_emoji_locked(username)
+
+    def _assign_emoji_locked(self, username: str) -> str:
         if username not in self._user_emojis:
             # Replenish available emojis if empty
             if not self._available_emojis:
@@ -40,12 +99,12 @@ class SlackUploader:
             self._user_emojis[username] = chosen_emoji
         return self._user_emojis[username]
 
-    def _block_builder(self, text: str, message_files: List[Dict], file_urls: Dict[str, str]) -> Dict:
+    def _block_builder(self, text: str, message_files: List[File], file_urls: Dict[str, str]) -> Dict:
         """Build a Slack block with text and files
         
         Args:
             text: The message text
-            message_files: List of file dictionaries from the message
+            message_files: Files attached to the message
             file_urls: Mapping of saved_path -> URL from file uploads
             
         Returns:
@@ -61,38 +120,43 @@ class SlackUploader:
                 "text": text
             }
         })
-        file_links = [
-            f"<{file_urls[f['saved_path']]}|{f['filename']}>"
-            for f in message_files
-            if f['saved_path'] in file_urls
-        ]
         # Add divider and file blocks if we have files
-        if any(f['saved_path'] in file_urls for f in message_files):
+        if any(f.saved_path in file_urls for f in message_files):
             blocks.append({"type": "divider"})
             
             # Add each file as an image block
             for f in message_files:
-                if f['saved_path'] in file_urls:
+                if f.saved_path in file_urls:
                     blocks.append({
                         "type": "section",
                         "text": {
                             "type": "mrkdwn",
-                            "text": f"<{file_urls[f['saved_path']]}|{f['filename']}>",
+                            "text": f"<{file_urls[f.saved_path]}|{f.filename}>",
                         }
                     })
         
         return blocks
 
-    def _upload_files(self, files: List[Dict], conversation_dir: Path, channel: str) -> Dict[str, str]:
-        """Upload all files at once and return mapping of saved_path -> URL"""
-        file_urls = {}
+    def _start_uploads(self, files: List[File], conversation_dir: Path, channel: str, executor: ThreadPoolExecutor) -> Dict[str, Future]:
+        """Queue uploads for all files and return mapping of saved_path -> future URL"""
+        uploads = {}
         for file in files:
-            if file["saved_path"]:
-                file_path = conversation_dir / file["saved_path"]
+            if file.saved_path and file.saved_path not in uploads:
+                file_path = conversation_dir / file.saved_path
                 if file_path.exists():
-                    url = self._upload_file(file_path, channel, file["filename"], file["description"])
-                    if url:
-                        file_urls[file["saved_path"]] = url
+                    uploads[file.saved_path] = executor.submit(
+                        self._upload_file, file_path, channel, file.filename, file.description
+                    )
+        return uploads
+
+    def _file_urls(self, message_files: List[File], uploads: Dict[str, Future]) -> Dict[str, str]:
+        """Wait for just this message's uploads and return mapping of saved_path -> URL"""
+        file_urls = {}
+        for f in message_files:
+            if f.saved_path in uploads:
+                url = uploads[f.saved_path].result()
+                if url:
+                    file_urls[f.saved_path] = url
         return file_urls
 
     def _upload_file(self, file_path: Path, channel: str, original_filename: str, alt_text: str) -> str:
@@ -106,7 +170,9 @@ class SlackUploader:
             The file's share URL
         """
         try:
-            response = self.client.files_upload_v2(
+            response = self._call(
+                "files_upload_v2",
+                "",
                 channel=channel,
                 file=str(file_path),
                 filename=original_filename,
@@ -124,72 +190,212 @@ class SlackUploader:
         channel: str, 
         file_channel: str | None = None,
         conversation_dir: Path | str = '',
-        wait_time_fn: Callable[[], int] = lambda: 1,
+        wait_time_fn: Callable[[], int] | None = None,
         thread_messages: bool = True
     ):
         """Upload a conversation and its attachments to Slack
         
         Args:
-            conversation_data: Dictionary containing conversation data
+            conversation_data: Dictionary containing conversation data, as in conversations.json
             channel: Channel ID to upload to
             file_channel: Channel ID to upload files to
             conversation_dir: Directory containing attachments
-            wait_time_fn: Function that returns wait time between messages
-            thread_messages: If True, replies are threaded. If False, all messages post to channel
+            wait_time_fn: Function that returns extra wait time between messages, on top of the rate limits
+            thread_messages: If True, replies are threaded, and the threads of several conversations
+                post concurrently while their first messages still post in order.
+                If False, all messages post to channel one conversation at a time
+        """
+        conversations = (Conversation.from_dict(conversation) for conversation in conversation_data["conversations"])
+        self.upload_conversations(conversations, channel, file_channel, conversation_dir, wait_time_fn, thread_messages)
+
+    def upload_conversations(
+        self,
+        conversations: Iterable[Conversation],
+        channel: str,
+        file_channel: str | None = None,
+        conversation_dir: Path | str = '',
+        wait_time_fn: Callable[[], int] | None = None,
+        thread_messages: bool = True
+    ):
+        """Upload conversations to Slack as they are read from `conversations`
+
+        Only a few conversations are held at once: the ones being posted, plus the next
+        one, whose files start uploading while the previous one posts. Takes the same
+        arguments as `upload_conversation`.
         """
         conversation_folder = Path(conversation_dir)
-        
-        # First, upload ALL files for ALL conversations
-        all_files = []
-        for conversation in conversation_data["conversations"]:
-            for message in conversation["messages"]:
-                all_files.extend(message["files"])
-        
-        # Upload all files once and get the URLs
         upload_channel = file_channel or channel
-        file_urls = self._upload_files(all_files, conversation_folder, upload_channel)
-        time.sleep(wait_time_fn() + wait_time_fn() + wait_time_fn())
-        
-        # Now process each conversation
-        for conversation in conversation_data["conversations"]:
-            first_message = conversation["messages"][0]
-            thread_ts = None
-            
-            try:
-                response = self.client.chat_postMessage(
-                    channel=channel,
-                    blocks=self._block_builder(first_message["message_content"], first_message["files"], file_urls),
-                    username=first_message["sender_name"],
-                    icon_emoji=self._assign_emoji(first_message["sender_name"])
-                )
-                # Only store thread_ts if we want threaded messages
-                if thread_messages:
-                    thread_ts = response["ts"]
-                
+        with ThreadPoolExecutor(max_workers=self._upload_workers) as upload_executor:
+            staged = (
+                (conversation, self._start_uploads(conversation.files, conversation_folder, upload_channel, upload_executor))
+                for conversation in conversations
+            )
+            self._post_conversations(staged, channel, wait_time_fn, thread_messages)
+
+    def _post_conversations(
+        self,
+        staged: Iterator[tuple[Conversation, Dict[str, Future]]],
+        channel: str,
+        wait_time_fn: Callable[[], int] | None,
+        thread_messages: bool
+    ):
+        if not thread_messages or self._max_conversations <= 1:
+            # Unthreaded conversations would interleave in the channel. Stage the
+            # next conversation before posting this one so its uploads get a head start
+            previous = None
+            for current in staged:
+                if previous:
+                    self._post_conversation(previous[0], channel, previous[1], wait_time_fn, thread_messages)
+                previous = current
+            if previous:
+                self._post_conversation(previous[0], channel, previous[1], wait_time_fn, thread_messages)
+            return
+
+        # Root messages are posted here one at a time, so conversations appear in the
+        # channel in order; only the replies in their threads are posted concurrently
+        with ThreadPoolExecutor(max_workers=self._max_conversations) as executor:
+            in_flight: set[Future] = set()
+            for conversation, uploads in staged:
+                thread_ts = self._post_root(conversation.messages[0], channel, uploads, wait_time_fn)
+                if thread_ts is None:
+                    continue
+                in_flight.add(executor.submit(self._post_replies, conversation.messages[1:], channel, uploads, wait_time_fn, thread_ts))
+                # Don't read further ahead than we can post
+                if len(in_flight) >= self._max_conversations:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+            for future in in_flight:
+                future.result()
+
+    def _post_message(self, message: Message, channel: str, uploads: Dict[str, Future], thread_ts: str | None = None):
+        kwargs = {
+            "channel": channel,
+            "blocks": self._block_builder(message.message_content, message.files, self._file_urls(message.files, uploads)),
+            "username": message.sender_name,
+            "icon_emoji": self._assign_emoji(message.sender_name)
+        }
+        if thread_ts:
+            kwargs["thread_ts"] = thread_ts
+        return self._call("chat_postMessage", channel, **kwargs)
+
+    def _post_conversation(
+        self,
+        conversation: Conversation,
+        channel: str,
+        uploads: Dict[str, Future],
+        wait_time_fn: Callable[[], int] | None,
+        thread_messages: bool
+    ):
+        thread_ts = self._post_root(conversation.messages[0], channel, uploads, wait_time_fn)
+        if thread_ts is None:
+            return
+        # Only reply in a thread if we want threaded messages
+        self._post_replies(conversation.messages[1:], channel, uploads, wait_time_fn, thread_ts if thread_messages else None)
+
+    def _post_root(
+        self,
+        message: Message,
+        channel: str,
+        uploads: Dict[str, Future],
+        wait_time_fn: Callable[[], int] | None
+    ) -> str | None:
+        """Post the first message of a conversation and return its ts, or None if it failed"""
+        try:
+            response = self._post_message(message, channel, uploads)
+            if wait_time_fn:
                 time.sleep(wait_time_fn())
-                
+        except SlackApiError as e:
+            print(f"Error posting message: {e.response['error']}")
+            return None
+        return response["ts"]
+
+    def _post_replies(
+        self,
+        messages: list[Message],
+        channel: str,
+        uploads: Dict[str, Future],
+        wait_time_fn: Callable[[], int] | None,
+        thread_ts: str | None
+    ):
+        """Send the rest of a conversation's messages, in thread_ts if given"""
+        for message in messages:
+            try:
+                self._post_message(message, channel, uploads, thread_ts)
+                if wait_time_fn:
+                    time.sleep(wait_time_fn())
+
             except SlackApiError as e:
                 print(f"Error posting message: {e.response['error']}")
-                continue
-            
-            # Send the rest of the messages
-            for message in conversation["messages"][1:]:
-                try:
-                    # Only include thread_ts if threading is enabled
-                    kwargs = {
-                        "channel": channel,
-                        "blocks": self._block_builder(message["message_content"], message["files"], file_urls),
-                        "username": message["sender_name"],
-                        "icon_emoji": self._assign_emoji(message["sender_name"])
-                    }
-                    if thread_messages and thread_ts:
-                        kwargs["thread_ts"] = thread_ts
-                        
-                    self.client.chat_postMessage(**kwargs)
-                    time.sleep(wait_time_fn())
-                    
-                except SlackApiError as e:
-                    print(f"Error posting message: {e.response['error']}")
+
+def read_conversations(output_dir: str | Path) -> Iterator[Conversation]:
+    """Yield the conversations in an output directory one at a time
+
+    Reads conversations.jsonl a line at a time, so memory use is bounded by one
+    conversation. Falls back to loading conversations.json for older outputs, and
+    when the jsonl doesn't end with a record matching conversations.json, e.g. it
+    is left over from an earlier run.
+    """
+    output_dir = Path(output_dir)
+    jsonl_file = output_dir / CONVERSATIONS_JSONL
+    conversations_file = output_dir / "conversations.json"
+    end = _jsonl_end(jsonl_file, conversations_file)
+    if end is not None:
+        count = 0
+        with open(jsonl_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if JSONL_END_KEY in record:
+                    break
+                count += 1
+                yield Conversation.from_dict(record)
+        if count != end["conversations"]:
+            raise ValueError(f"{jsonl_file} has {count} conversations, expected {end['conversations']}")
+        return
+
+    if not conversations_file.exists():
+        raise FileNotFoundError(f"Conversations file not found: {conversations_file}")
+    with open(conversations_file, 'r', encoding='utf-8') as f:
+        conversations = json.load(f)["conversations"]
+    for conversation in conversations:
+        yield Conversation.from_dict(conversation)
+
+
+def _jsonl_end(jsonl_file: Path, conversations_file: Path) -> Dict | None:
+    """The end record of a complete jsonl written along with conversations.json, if there is one"""
+    if not jsonl_file.exists():
+        return None
+    try:
+        end = json.loads(_last_line(jsonl_file))[JSONL_END_KEY]
+    except (ValueError, KeyError, TypeError):
+        return None
+    if conversations_file.exists() and end["json_sha256"] != _file_sha256(conversations_file):
+        return None
+    return end
+
+
+def _last_line(path: Path, block_size: int = 4096) -> str:
+    """Read the last non-empty line of a file from its end"""
+    with open(path, 'rb') as f:
+        position = f.seek(0, os.SEEK_END)
+        tail = b""
+        while position > 0 and tail.rstrip(b"\n").count(b"\n") == 0:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            tail = f.read(step) + tail
+    return tail.rstrip(b"\n").rsplit(b"\n", 1)[-1].decode("utf-8")
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 
 def upload_to_slack(
     output_dir: str | Path, 
@@ -197,30 +403,33 @@ def upload_to_slack(
     token: str,
     file_channel: str,
     thread_messages: bool = True,
-    wait_time_fn: Callable[[], int] = lambda: random.randint(1, 5)
+    wait_time_fn: Callable[[], int] | None = None,
+    client: WebClient | None = None,
+    rate_limiter: RateLimiter | None = None,
+    telemetry: Telemetry | None = None
 ):
     """Upload processed book content to Slack
     
     Args:
-        output_dir: Directory containing conversations.json and attachments
+        output_dir: Directory containing conversations.jsonl or conversations.json, and attachments
         channel: Channel ID to post to
         token: Slack bot user OAuth token
         file_channel: Channel ID to post files to
+        thread_messages: If True, replies are threaded. If False, all messages post to channel
+        wait_time_fn: Function that returns extra wait time between messages, on top of the rate limits
+        client: Client to use instead of creating a WebClient for the token
+        rate_limiter: Paces API calls, Slack's published limits by default
+        telemetry: Where the time taken by each API call is recorded
     """
     output_dir = Path(output_dir)
-    conversations_file = output_dir / "conversations.json"
     attachments_dir = output_dir
     
-    if not conversations_file.exists():
-        raise FileNotFoundError(f"Conversations file not found: {conversations_file}")
+    if not (output_dir / CONVERSATIONS_JSONL).exists() and not (output_dir / "conversations.json").exists():
+        raise FileNotFoundError(f"Conversations file not found: {output_dir / 'conversations.json'}")
     
     if not attachments_dir.exists():
         raise FileNotFoundError(f"Attachments directory not found: {attachments_dir}")
     
-    # Load the conversation data
-    with open(conversations_file, 'r', encoding='utf-8') as f:
-        conversation_data = json.load(f)
-    
-    # Upload to Slack
-    uploader = SlackUploader(token)
-    uploader.upload_conversation(conversation_data, channel, file_channel, attachments_dir, wait_time_fn, thread_messages)
\ No newline at end of file
+    # Upload to Slack, posting each conversation as it's read
+    uploader = SlackUploader(token, client, rate_limiter=rate_limiter, telemetry=telemetry)
+    uploader.upload_conversations(read_conversations(output_dir), channel, file_channel, attachments_dir, wait_time_fn, thread_messages)
@@ -1,10 +1,33 @@
-from typing import Dict
+from concurrent.futures import Executor, ThreadPoolExecutor, Future
+from contextlib import ExitStack, closing
+from typing import BinaryIO, Dict, Iterable, Iterator
 import openai
+import hashlib
 import json
-from dataclasses import asdict, dataclass
+import os
+import threading
+import time
 from pathlib import Path
 import requests
+from kafka_speaker.backends import BACKENDS, ChatCompletionsBackend, ResponsesBackend
+from kafka_speaker.cache import GenerationCache, cache_key
+from kafka_speaker.governor import BudgetExceeded, Governor
+from kafka_speaker.images import ImageOptions, ImageProcessor
+from kafka_speaker.journal import JOURNAL_NAME, ConversationJournal
+from kafka_speaker.model import Conversation, File, Message, MessageStream, decode_messages, parse_messages
 from kafka_speaker.paragraph import Paragraph, file_paragraphs
+from kafka_speaker.pipeline import prefetch
+from kafka_speaker.registry import AssistantRegistry
+from kafka_speaker.render import DocumentRenderer, _document_format, _document_instructions, parse_document
+from kafka_speaker.store import CHUNK_SIZE, AttachmentStore, iter_chunks
+from kafka_speaker.telemetry import CODE_INTERPRETER_SESSION_PRICE, Telemetry
+from kafka_speaker.threads import ThreadManager, ThreadPolicy
+from kafka_speaker.tracing import traced
+
+# Line-delimited copy of conversations.json, one conversation per line
+CONVERSATIONS_JSONL = "conversations.jsonl"
+# Key of the record that ends a complete conversations.jsonl
+JSONL_END_KEY = "end_of_conversations"
 
 _message_assistant_name = "Kafka Speaker"
 _message_format = {
@@ -108,152 +131,272 @@ Allowable file types are listed below. If you are asked to generate a file that
 Do NOT generate audio, video, or archive (zip etc) attachments.
 '''
 
-@dataclass
-class File:
-    filename: str
-    docext: str
-    description: str
-    saved_name: str | None = None
-    saved_path: str | None = None
+_message_assistant_description = "An assistant that converts Kafka texts into Slack-style conversations."
+_attachment_assistant_description = "An assistant that generates Kafka-esque documents and images."
+_image_extensions = ('png', 'jpg', 'jpeg', 'gif')
 
-    def __str__(self):
-        # Keep the original string format for the AI
-        return f"File: {self.filename}\nDocument Extension: {self.docext}\nDescription: {self.description}"
 
-    def __post_init__(self):
-        """Normalize docext after initialization"""
-        self.docext = self.docext.lstrip('.')
+def _message_assistant_params(model: str) -> dict:
+    return {
+        "instructions": _speaker_instructions,
+        "response_format": { "type": "json_schema", "json_schema": _message_format },
+        "model": model
+    }
 
-    @property
-    def normalized_docext(self) -> str:
-        """Returns the document extension with leading dot"""
-        return f'.{self.docext}'
 
-    @property
-    def original_name(self) -> str:
-        """Returns original filename with extension"""
-        return f"{self.filename}{self.normalized_docext}"
-
-    def set_saved_location(self, path: Path | str) -> None:
-        """Updates the saved location information"""
-        self.saved_path = str(path)
-        self.saved_name = path.name
-
-@dataclass
-class Message:
-    sender_name: str
-    message_content: str
-    files: list[File]
-
-@dataclass
-class Conversation:
-    messages: list[Message]
-    
+def _attachment_assistant_params(model: str) -> dict:
+    return {
+        "instructions": _attachment_instructions,
+        "tools": [{"type": "code_interpreter"}],
+        "model": model
+    }
+
+
+def _messages_cache_key(model: str, paragraph: Paragraph) -> str:
+    return cache_key("messages", model, _speaker_instructions, _message_format, str(paragraph))
+
+
+def _attachment_cache_key(model: str, attachment: File, is_image: bool, image: tuple[str, str] = ("dall-e-3", "1024x1024")) -> str:
+    """Cache key for an attachment, after `_normalize_image_attachment` has been applied
+
+    image is the (model, size) images are generated with.
+    """
+    if is_image:
+        return cache_key("image", *image, "natural", _image_prompt(attachment))
+    return cache_key("attachment", model, _attachment_instructions, str(attachment))
+
+
+def _document_cache_key(model: str, attachment: File) -> str:
+    return cache_key("document", model, _document_instructions, _document_format, str(attachment))
+
+
+def _attachment_file_ids(new_messages) -> list[str]:
+    """Every file id the attachment assistant's reply made, the attachment first"""
+    file_ids = [attachment.file_id for message in new_messages.data for attachment in message.attachments]
+    if (len(file_ids) > 1):
+        print("Attachment assistant returned more than one attachment")
+    return file_ids
+
+
+def _attachment_file_id(file_ids: list[str]) -> str:
+    if (len(file_ids) == 0):
+        raise Exception("Attachment assistant failed to make an attachment")
+    return file_ids[0]
+
+
+def _normalize_image_attachment(attachment: File) -> bool:
+    """Returns True for image attachments, converting them to use the .png extension"""
+    if any(ext in attachment.docext.lower() for ext in _image_extensions):
+        attachment.docext = 'png'
+        attachment.filename = attachment.filename.rsplit('.', 1)[0]  # Remove any existing extension
+        return True
+    return False
+
+
+def _image_prompt(attachment: File) -> str:
+    return f"""
+            Generate an oil painting in either:
+             - a modern expressionistic style
+             - an impressionistic style
+             - a surreal style
+             - a pop art style
+             - an abstract style
+             
+            for a file that was sent in a Slack conversation.
+
+            You are participating in an art project where we are re-interpreting Kafka texts as Slack channel conversations, and your responsibility is to help with the images.
+
+            They should be reflections of office life and the Kafka-esque situations people find themselves in.
+
+            Do not generate images with large amount of text--small amounts are fine when it is appropriate to the scene.
+
+            Attachment:
+            {str(attachment)}
+            """
+
 
 class KafkaSpeaker:
-    def __init__(self, openai_client: openai.OpenAI, model: str = "gpt-4o-mini"):
+    def __init__(
+        self,
+        openai_client: openai.OpenAI,
+        model: str = "gpt-4o-mini",
+        cache: GenerationCache | None = None,
+        backend: str = "assistants",
+        http_session: requests.Session | None = None,
+        registry: AssistantRegistry | None = None,
+        thread_policy: ThreadPolicy | None = None,
+        attachments: str = "assistant",
+        renderer: DocumentRenderer | None = None,
+        image_options: ImageOptions | None = None,
+        image_processor: ImageProcessor | None = None,
+        telemetry: Telemetry | None = None,
+        governor: Governor | None = None
+    ):
+        """
+        Args:
+            openai_client: OpenAI client instance
+            model: OpenAI model to use
+            cache: Cache of previous generations to reuse
+            backend: How messages are generated, "assistants" for the assistant thread or
+                one of `backends.BACKENDS` for a single request per paragraph
+            http_session: Session used to download generated images
+            registry: Where assistant IDs are remembered between runs; in memory only by default
+            thread_policy: When to start a new message thread, or response chain, see `ThreadPolicy`
+            attachments: How documents are made, "assistant" for a code_interpreter run or
+                "local" to have the model write the content and render the file locally
+            renderer: Process pool for local rendering, shared with forks; one is started if needed
+            image_options: How to post-process generated images; they're kept as they are by default
+            image_processor: Process pool for image post-processing, shared with forks; one is
+                started if image_options are given
+            telemetry: Where API call latency, tokens and cost are recorded, shared with forks;
+                the governor's by default
+            governor: Enforces the run's budgets and picks cheaper options as they run out,
+                shared with forks; unlimited by default
+        """
         self._client = openai_client
+        self._http = http_session or requests.Session()
         self._model = model
+        self._cache = cache
+        self._registry = registry or AssistantRegistry(None)
+        self.telemetry = telemetry or (governor.telemetry if governor else Telemetry())
+        self.governor = governor or Governor(telemetry=self.telemetry)
+        self._backend_name = backend
+        self.threads = ThreadManager(openai_client, model, thread_policy, self.telemetry, self.governor)
+        self._backend = None
+        if backend == ResponsesBackend.name:
+            self._backend = ResponsesBackend(openai_client, model, _speaker_instructions, _message_format, self.telemetry, self.threads)
+        elif backend != "assistants":
+            self._backend = BACKENDS[backend](openai_client, model, _speaker_instructions, _message_format, self.telemetry)
         self._message_assistant = None
-        self._message_thread = None
         self._attachment_assistant = None
-        self._attachment_thread = None
+        self._attachments = attachments
+        self._document_backend = None
+        self._renderer = renderer
+        self._owns_renderer = False
+        if attachments == "local":
+            self._document_backend = ChatCompletionsBackend(openai_client, model, _document_instructions, _document_format, self.telemetry)
+            if renderer is None:
+                self._renderer = DocumentRenderer()
+                self._owns_renderer = True
+        self.image_processor = image_processor
+        self._owns_image_processor = False
+        if image_processor is None and image_options is not None:
+            self.image_processor = ImageProcessor(image_options)
+            self._owns_image_processor = True
+        # Each lazily created resource has its own lock so they can be set up concurrently
+        self._setup_locks = {
+            name: threading.Lock()
+            for name in ("_message_assistant", "_attachment_assistant", "_document_backend", "_renderer")
+        }
+        # Guards the shared message thread, which only allows one active run at a time
+        self._lock = threading.RLock()
+
+    def _lazy(self, name: str, setup):
+        with self._setup_locks[name]:
+            if getattr(self, name) is None:
+                setattr(self, name, setup())
+            return getattr(self, name)
     
     @property
     def _get_message_assistant(self):
-        if self._message_assistant is None:
-            self._message_assistant = self._setup_message_assistant()
-        return self._message_assistant
+        return self._lazy("_message_assistant", self._setup_message_assistant)
 
     @property
     def _get_message_thread(self):
-        if self._message_thread is None:
-            self._message_thread = self._start_thread()
-        return self._message_thread
+        return self.threads.thread()
     
     @property
     def _get_attachment_assistant(self):
-        if self._attachment_assistant is None:
-            self._attachment_assistant = self._setup_attachment_assistant()
-        return self._attachment_assistant
+        return self._lazy("_attachment_assistant", self._setup_attachment_assistant)
 
     @property
-    def _get_attachment_thread(self):
-        if self._attachment_thread is None:
-            self._attachment_thread = self._start_thread()
-        return self._attachment_thread
-
-    def _find_existing_assistant(self, assistant_name: str):
-        existing_assistants = self._client.beta.assistants.list(
-            order="desc",
-            limit="20", # lol paging
-        )
-        return next(
-            (a for a in existing_assistants.data if a.name == assistant_name),
-            None
+    def _get_document_backend(self):
+        return self._lazy("_document_backend", lambda: ChatCompletionsBackend(
+            self._client, self._model, _document_instructions, _document_format, self.telemetry
+        ))
+
+    @property
+    def _get_renderer(self):
+        return self._lazy("_renderer", self._start_renderer)
+
+    def _start_renderer(self) -> DocumentRenderer:
+        self._owns_renderer = True
+        return DocumentRenderer()
+
+    def _run_params(self, model: str) -> dict:
+        """Override the assistant's model for a run, when the governor has degraded it"""
+        return {"model": model} if model != self._model else {}
+
+    def warm(self, threads: bool = True) -> None:
+        """Set up the assistants, and the message thread, concurrently instead of on first use"""
+        setups = []
+        if self._attachments == "assistant":
+            setups.append(lambda: self._get_attachment_assistant)
+        if self._backend is None:
+            setups.append(lambda: self._get_message_assistant)
+            if threads:
+                setups.append(lambda: self._get_message_thread)
+        if not setups:
+            return
+        with ThreadPoolExecutor(max_workers=len(setups)) as executor:
+            for future in [executor.submit(setup) for setup in setups]:
+                future.result()
+
+    def fork(self) -> "KafkaSpeaker":
+        """Create a speaker that shares this one's assistants but gets its own threads"""
+        speaker = KafkaSpeaker(
+            self._client, self._model, self._cache, self._backend_name, self._http, self._registry,
+            self.threads.policy, self._attachments, self._renderer, image_processor=self.image_processor, telemetry=self.telemetry, governor=self.governor
         )
+        if self._backend is None:
+            speaker._message_assistant = self._get_message_assistant
+        if self._attachments == "assistant":
+            speaker._attachment_assistant = self._get_attachment_assistant
+        return speaker
+
+    def close(self) -> None:
+        """Stop the process pools this speaker started"""
+        if self._owns_renderer:
+            self._renderer.close()
+        if self._owns_image_processor:
+            self.image_processor.close()
 
     def _setup_message_assistant(self):
-        existing_assistant = self._find_existing_assistant(_message_assistant_name)
-        
-        assistant_params = {
-            "instructions": _speaker_instructions,
-            "response_format": { "type": "json_schema", "json_schema": _message_format },
-            "model": self._model
-        }
-        
-        if existing_assistant:
-            print(f"Assistant {_message_assistant_name} already exists, updating it.")
-            _assistant = self._client.beta.assistants.update(
-                existing_assistant.id,
-                **assistant_params
-            )
-        else:
-            print(f"Assistant {_message_assistant_name} does not exist, creating it.")
-            _assistant = self._client.beta.assistants.create(
-                name=_message_assistant_name,
-                description="An assistant that converts Kafka texts into Slack-style conversations.",
-                **assistant_params
-            )
-        return _assistant
+        return self._registry.setup(
+            self._client,
+            _message_assistant_name,
+            _message_assistant_description,
+            _message_assistant_params(self._model)
+        )
     
     def _start_thread(self, messages: list[dict] = []):
         return self._client.beta.threads.create( messages=messages )
 
     def _setup_attachment_assistant(self):
-        existing_assistant = self._find_existing_assistant(_attachment_assistant_name)
-        
-        assistant_params = {
-            "instructions": _attachment_instructions,
-            "tools": [{"type": "code_interpreter"}],
-            "model": self._model
-        }
-
-        if existing_assistant:
-            print(f"Assistant {_attachment_assistant_name} already exists, updating it.")
-            _assistant = self._client.beta.assistants.update(
-                existing_assistant.id,
-                **assistant_params
-            )
-        else:
-            print(f"Assistant {_attachment_assistant_name} does not exist, creating it.")
-            _assistant = self._client.beta.assistants.create(
-                name=_attachment_assistant_name,
-                description="An assistant that generates Kafka-esque documents and images.",
-                **assistant_params
-            )
-        return _assistant
+        return self._registry.setup(
+            self._client,
+            _attachment_assistant_name,
+            _attachment_assistant_description,
+            _attachment_assistant_params(self._model)
+        )
 
-    def _get_assistant_response(self, thread_id: str, assistant_id: str) -> list:
+    def _get_assistant_response(self, thread_id: str, assistant_id: str, model: str | None = None) -> list:
         """
         Common function to get responses from any assistant.
         Returns the list of messages from the assistant.
         """
-        run = self._client.beta.threads.runs.create_and_poll(
-            thread_id=thread_id,
-            assistant_id=assistant_id
-        )
+        model = model or self._model
+        start = time.perf_counter()
+        with self.telemetry.span("runs.create_and_poll", thread_id=thread_id):
+            run = self._client.beta.threads.runs.create_and_poll(
+                thread_id=thread_id,
+                assistant_id=assistant_id,
+                **self._run_params(model)
+            )
+        self.telemetry.add_wait(time.perf_counter() - start)
+        self.telemetry.add_usage(model, getattr(run, "usage", None))
 
+        self.threads.record_run(thread_id, run)
         if run.status == "completed":
             return self._client.beta.threads.messages.list(
                 thread_id=thread_id,
@@ -262,96 +405,404 @@ class KafkaSpeaker:
         else:
             raise Exception(f"Assistant failed to respond: {run.status}")
 
-    def generate_messages(self, paragraph: Paragraph) -> list[Message]:
+    def _generate_thread_messages(self, paragraph: Paragraph, model: str | None = None) -> str:
+        """Run the message assistant on the message thread and return its JSON reply"""
+        thread = self._get_message_thread
         message = self._client.beta.threads.messages.create(
-            thread_id=self._get_message_thread.id,
+            thread_id=thread.id,
             role="user",
             content=str(paragraph)
         )
+        self.threads.record_paragraph(str(paragraph))
 
         new_messages = self._get_assistant_response(
-            thread_id=self._get_message_thread.id,
-            assistant_id=self._get_message_assistant.id
+            thread_id=thread.id,
+            assistant_id=self._get_message_assistant.id,
+            model=model
         )
+        return new_messages.data[0].content[0].text.value
+
+    def generate_messages(self, paragraph: Paragraph) -> list[Message]:
+        """Raises `BudgetExceeded` once the governor's budget is spent"""
+        model = self.governor.model(self._model)
+        if self._cache:
+            key = _messages_cache_key(model, paragraph)
+            cached = self._cache.get_json(key)
+            if cached is not None:
+                return decode_messages(cached)
+
+        with self._lock:
+            self.governor.admit()
+            with self.telemetry.measure("messages"):
+                if self._backend:
+                    response_text = self._backend.generate(str(paragraph), model)
+                else:
+                    response_text = self._generate_thread_messages(paragraph, model)
         
         # Parse the JSON string and extract messages
-        parsed_response = json.loads(new_messages.data[0].content[0].text.value)
-        responses = [Message(
-            sender_name=msg["sender_name"],
-            message_content=msg["message_content"],
-            files=[File(**file) for file in msg["files"]]
-        ) for msg in parsed_response["messages"]]
-        return responses
-
-    def _generate_attachment(self, attachment: File) -> str:
-        message = self._client.beta.threads.messages.create(
-            thread_id=self._get_message_thread.id,
+        messages = parse_messages(response_text)
+        if self._cache:
+            self._cache.put_json(key, [msg.to_dict() for msg in messages])
+        return messages
+
+    def _stream_thread_messages(self, paragraph: Paragraph, model: str) -> Iterator[str]:
+        """Stream a run of the message assistant on the message thread, yielding its reply as it's written"""
+        thread = self._get_message_thread
+        self._client.beta.threads.messages.create(
+            thread_id=thread.id,
             role="user",
-            content=str(attachment)
+            content=str(paragraph)
         )
+        self.threads.record_paragraph(str(paragraph))
+
+        with self.telemetry.span("runs.stream", thread_id=thread.id), self._client.beta.threads.runs.stream(
+            thread_id=thread.id,
+            assistant_id=self._get_message_assistant.id,
+            **self._run_params(model)
+        ) as stream:
+            yield from stream.text_deltas
+            run = stream.get_final_run()
+        self.telemetry.add_usage(model, getattr(run, "usage", None))
+        self.threads.record_run(thread.id, run)
+        if run.status != "completed":
+            raise Exception(f"Assistant failed to respond: {run.status}")
 
-        new_messages = self._get_assistant_response(
-            thread_id=self._get_message_thread.id,
-            assistant_id=self._get_attachment_assistant.id
-        )
+    def stream_messages(self, paragraph: Paragraph) -> Iterator[Message]:
+        """Like `generate_messages`, but yields each message as soon as it has been generated
 
-        if (len(new_messages.data[0].attachments) == 0):
-            raise Exception("Attachment assistant failed to make an attachment")
-        if (len(new_messages.data[0].attachments) > 1):
-            print("Attachment assistant returned more than one attachment")
-        
-        file_id = new_messages.data[0].attachments[0].file_id
+        The cache and budget are checked before this returns, so `BudgetExceeded`
+        is raised here rather than by the iterator.
+        """
+        model = self.governor.model(self._model)
+        key = None
+        if self._cache:
+            key = _messages_cache_key(model, paragraph)
+            cached = self._cache.get_json(key)
+            if cached is not None:
+                return iter(decode_messages(cached))
+        self.governor.admit()
+        return self._stream_messages(paragraph, model, key)
+
+    def _stream_messages(self, paragraph: Paragraph, model: str, key: str | None) -> Iterator[Message]:
+        stream = MessageStream()
+        messages = []
+        with self._lock, self.telemetry.measure("messages"):
+            if self._backend:
+                deltas = self._backend.stream(str(paragraph), model)
+            else:
+                deltas = self._stream_thread_messages(paragraph, model)
+            for delta in deltas:
+                for message in stream.feed(delta):
+                    messages.append(message)
+                    yield message
+            for message in stream.finish():
+                messages.append(message)
+                yield message
+        if key:
+            self._cache.put_json(key, [msg.to_dict() for msg in messages])
 
-        return file_id
+    def _generate_attachment(self, attachment: File) -> str:
+        """Run the attachment assistant on a thread of its own and return the generated file's id
+
+        Each attachment gets a short-lived thread, so any number can run at once
+        without adding to the message thread's context. The thread, and any files
+        the run made besides the attachment, are deleted whether or not it succeeds.
+        """
+        assistant_id = self._get_attachment_assistant.id
+        model = self.governor.model(self._model)
+        self.governor.admit()
+        with self.telemetry.measure("attachment"):
+            thread_id = None
+            file_ids: list[str] = []
+            try:
+                start = time.perf_counter()
+                with self.telemetry.span("threads.create_and_run"):
+                    run = self._client.beta.threads.create_and_run(
+                        assistant_id=assistant_id,
+                        thread={"messages": [{"role": "user", "content": str(attachment)}]},
+                        **self._run_params(model)
+                    )
+                    thread_id = run.thread_id
+                    run = self._client.beta.threads.runs.poll(run.id, thread_id=thread_id)
+                self.telemetry.add_wait(time.perf_counter() - start)
+                self.telemetry.add_usage(model, getattr(run, "usage", None))
+                self.telemetry.add_cost(CODE_INTERPRETER_SESSION_PRICE)
+                if run.status != "completed":
+                    raise Exception(f"Assistant failed to respond: {run.status}")
+                new_messages = self._client.beta.threads.messages.list(
+                    thread_id=thread_id,
+                    run_id=run.id
+                )
+                file_ids = _attachment_file_ids(new_messages)
+                return _attachment_file_id(file_ids)
+            finally:
+                if thread_id is not None:
+                    self._delete_thread(thread_id)
+                for file_id in file_ids[1:]:
+                    self._delete_file(file_id)
+
+    def _delete_thread(self, thread_id: str) -> None:
+        try:
+            self._client.beta.threads.delete(thread_id)
+        except Exception as e:
+            print(f"Failed to delete thread {thread_id}: {e}")
+
+    def _delete_file(self, file_id: str) -> None:
+        try:
+            self._client.files.delete(file_id)
+        except Exception as e:
+            print(f"Failed to delete file {file_id}: {e}")
+
+    def _stream_download(self, file_id: str) -> Iterator[bytes]:
+        with self.telemetry.measure("download"), self._client.files.with_streaming_response.content(file_id) as response:
+            yield from response.iter_bytes(CHUNK_SIZE)
 
     def _download_attachment(self, file_id: str) -> bytes:
-        return self._client.files.content(file_id).content
+        return b"".join(self._stream_download(file_id))
+
+    def _stream_generated_file(self, attachment: File) -> Iterator[bytes]:
+        """Generate a file with the attachment assistant, stream it down, then delete it"""
+        file_id = self._generate_attachment(attachment)
+        try:
+            yield from self._stream_download(file_id)
+        finally:
+            self._delete_file(file_id)
+
+    def _stream_image_attachment(self, attachment: File, image: tuple[str, str] = ("dall-e-3", "1024x1024")) -> Iterator[bytes]:
+        model, size = image
+        # Only DALL-E 3 takes a style
+        style = {"style": "natural"} if model == "dall-e-3" else {}
+        self.governor.admit(images=1, image=image)
+        with self.telemetry.measure("image"):
+            result = self._client.images.generate(
+                model=model,
+                prompt=_image_prompt(attachment),
+                size=size,
+                user="elemdiscovery/kafka-speaker",
+                **style
+            )
+            self.telemetry.add_images(model, size, len(result.data))
+        with self.telemetry.measure("download"), self._http.get(result.data[0].url, stream=True) as response:
+            response.raise_for_status()
+            yield from response.iter_content(CHUNK_SIZE)
+
+    def _generate_image_attachment(self, attachment: File) -> bytes:
+        return b"".join(self._stream_image_attachment(attachment))
     
-    def _generate_image_attachment(self, attachment: File):
-        result = self._client.images.generate(
-            model="dall-e-3",
-            prompt=f"""
-            Generate an oil painting in either:
-             - a modern expressionistic style
-             - an impressionistic style
-             - a surreal style
-             - a pop art style
-             - an abstract style
-             
-            for a file that was sent in a Slack conversation.
+    def _generate_local_attachment(self, attachment: File) -> bytes:
+        """Have the model write the document's content, then render the file locally
 
-            You are participating in an art project where we are re-interpreting Kafka texts as Slack channel conversations, and your responsibility is to help with the images.
+        Changes the attachment's docext to md if the format can't be rendered.
+        """
+        text = None
+        model = self.governor.model(self._model)
+        if self._cache:
+            key = _document_cache_key(model, attachment)
+            cached = self._cache.get_bytes(key)
+            text = cached.decode("utf-8") if cached is not None else None
+        if text is None:
+            self.governor.admit()
+            with self.telemetry.measure("document"):
+                text = self._get_document_backend.generate(str(attachment), model)
+            document = parse_document(text)
+            if self._cache:
+                self._cache.put_bytes(key, text.encode("utf-8"))
+        else:
+            document = parse_document(text)
 
-            They should be reflections of office life and the Kafka-esque situations people find themselves in.
+        docext, content = self._get_renderer.render(document, attachment.docext).result()
+        attachment.docext = docext
+        return content
 
-            Do not generate images with large amount of text--small amounts are fine when it is appropriate to the scene.
+    def stream_attachment(self, attachment: File) -> Iterator[bytes]:
+        """Generate an attachment as chunks of its content, so it's never held in memory whole
 
-            Attachment:
-            {str(attachment)}
-            """,
-            size="1024x1024",
-            style="natural",
-            user="elemdiscovery/kafka-speaker"
-        )
-        response = requests.get(result.data[0].url)
-        return response.content
-    
-    def generate_attachment(self, attachment: File):
-        image_extensions = ('png', 'jpg', 'jpeg', 'gif')
-        if any(ext in attachment.docext.lower() for ext in image_extensions):
-            # Convert the attachment to use .png extension
-            attachment.docext = 'png'
-            attachment.filename = attachment.filename.rsplit('.', 1)[0]  # Remove any existing extension
-            return self._generate_image_attachment(attachment)
+        The attachment's docext is final once this returns, but nothing is
+        generated until the chunks are read. Chunks from the cache or the API
+        are read straight through; they are only cached once read to the end.
+        """
+        is_image = _normalize_image_attachment(attachment)
+        if not is_image and (self._attachments == "local" or self.governor.degraded):
+            return iter([self._generate_local_attachment(attachment)])
+        image = self.governor.image()
+        if self._cache:
+            key = _attachment_cache_key(self._model, attachment, is_image, image)
+            cached = self._cache.open(key)
+            if cached is not None:
+                return _read_and_close(cached)
+
+        if is_image:
+            chunks = self._stream_image_attachment(attachment, image)
         else:
-            file_id = self._generate_attachment(attachment)
-            return self._download_attachment(file_id)
+            chunks = self._stream_generated_file(attachment)
+        if self._cache:
+            chunks = self._cache.put_stream(key, chunks)
+        return chunks
+
+    def generate_attachment(self, attachment: File) -> bytes:
+        return b"".join(self.stream_attachment(attachment))
+
+
+def _read_and_close(f: BinaryIO) -> Iterator[bytes]:
+    with f:
+        yield from iter_chunks(f)
 
 
-def process_book(file_path: str, skip_past: str, end_at: str, output_dir: str | Path, openai_client: openai.OpenAI, model: str, file_limit: int) -> Dict:
+class FileBudget:
+    """Thread-safe count of generated files, shared by every book in a run
+
+    Like `file_limit`, this is not a hard cutoff: it is checked before each
+    paragraph, and a paragraph that starts under budget is always completed.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._used = 0
+        self._lock = threading.Lock()
+
+    @property
+    def used(self) -> int:
+        return self._used
+
+    @property
+    def exhausted(self) -> bool:
+        return self._used >= self.limit
+
+    def consume(self, count: int = 1) -> None:
+        with self._lock:
+            self._used += count
+
+
+def _save_attachment(
+    speaker: KafkaSpeaker,
+    file_desc: File,
+    attachments_dir: Path,
+    file_number: int,
+    journal: ConversationJournal | None = None,
+    store: AttachmentStore | None = None
+) -> bool:
+    """Generate a single attachment and stream it to disk
+
+    Runs on a worker thread, so the file number is assigned by the caller to keep
+    the ATT numbering independent of completion order.
+
+    Returns:
+        True if the attachment was generated and saved
+    """
+    try:
+        with speaker.telemetry.span("save_attachment", file_number=file_number):
+            file_content = speaker.stream_attachment(file_desc)
+            if speaker.image_processor and file_desc.docext == 'png':
+                with speaker.telemetry.span("process_image"):
+                    image = speaker.image_processor.process(b"".join(file_content)).result()
+                file_desc.docext = image.docext
+                file_content = image.content
+                if image.thumbnail:
+                    _write_thumbnail(attachments_dir, file_number, image.docext, image.thumbnail)
+            with speaker.telemetry.span("write_attachment", file_number=file_number, docext=file_desc.docext):
+                _write_attachment(file_desc, attachments_dir, file_number, file_content, journal, store)
+    except Exception as e:
+        print(f"Failed to generate attachment.\nFile description: {str(file_desc)}\nError: {e}")
+        return False
+    return True
+
+
+def _write_thumbnail(attachments_dir: Path, file_number: int, docext: str, thumbnail: bytes) -> None:
+    """Write an image's thumbnail to the thumbnails directory, named like its ATT file"""
+    thumbnails_dir = attachments_dir / "thumbnails"
+    thumbnails_dir.mkdir(exist_ok=True)
+    save_path = thumbnails_dir / f"ATT{file_number:07d}.{docext}"
+    tmp_path = save_path.with_name(save_path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(thumbnail)
+    os.replace(tmp_path, save_path)
+
+
+def _write_attachment(
+    file_desc: File,
+    attachments_dir: Path,
+    file_number: int,
+    file_content: bytes | Iterable[bytes],
+    journal: ConversationJournal | None = None,
+    store: AttachmentStore | None = None
+) -> None:
+    """Write generated attachment content, whole or in chunks, as the ATT file for file_number
+
+    Pass the same store for every attachment of a book so duplicates are hardlinked.
+    """
+    # Set up the save path with padded numbering (ATT + 7 digits)
+    save_path = attachments_dir / f"ATT{file_number:07d}{file_desc.normalized_docext}"
+
+    print(f"Saving file to {save_path}")
+    if isinstance(file_content, bytes):
+        file_content = [file_content]
+    (store or AttachmentStore()).write(save_path, file_content)
+    file_desc.set_saved_location(save_path)
+    if journal:
+        journal.record_attachment(file_number, file_desc)
+
+
+def _write_conversations(output_dir: Path, conversations: list[Conversation]) -> Dict:
+    """Write conversations.json and conversations.jsonl to the output directory and return their contents
+
+    conversations.jsonl holds one conversation per line so it can be read a
+    conversation at a time, see `kafka_speaker.slack.read_conversations`. It ends
+    with a `JSONL_END_KEY` record holding the number of conversations and the
+    sha256 of the conversations.json written with it, so a reader can tell a
+    complete jsonl that matches conversations.json from a partial or stale one
+    without relying on file times.
+    """
+    output = {
+        "conversations": [conv.to_dict() for conv in conversations]
+    }
+    
+    json_path = output_dir / "conversations.json"
+    json_bytes = json.dumps(output, indent=2, ensure_ascii=False).encode("utf-8")
+    with open(json_path.with_name(json_path.name + ".tmp"), "wb") as f:
+        f.write(json_bytes)
+    
+    jsonl_path = output_dir / CONVERSATIONS_JSONL
+    with open(jsonl_path.with_name(jsonl_path.name + ".tmp"), "w", encoding="utf-8") as f:
+        for conversation in output["conversations"]:
+            f.write(json.dumps(conversation, ensure_ascii=False) + "\n")
+        end = {"conversations": len(output["conversations"]), "json_sha256": hashlib.sha256(json_bytes).hexdigest()}
+        f.write(json.dumps({JSONL_END_KEY: end}) + "\n")
+
+    os.replace(json_path.with_name(json_path.name + ".tmp"), json_path)
+    os.replace(jsonl_path.with_name(jsonl_path.name + ".tmp"), jsonl_path)
+    return output
+
+
+def process_book(
+    file_path: str,
+    skip_past: str,
+    end_at: str,
+    output_dir: str | Path,
+    openai_client: openai.OpenAI,
+    model: str,
+    file_limit: int,
+    max_workers: int = 4,
+    file_budget: FileBudget | None = None,
+    speaker: KafkaSpeaker | None = None,
+    executor: Executor | None = None,
+    resume: bool = False,
+    cache: GenerationCache | None = None,
+    backend: str = "assistants",
+    paragraphs: Iterable[Paragraph] | None = None,
+    registry: AssistantRegistry | None = None,
+    thread_policy: ThreadPolicy | None = None,
+    attachments: str = "assistant",
+    image_options: ImageOptions | None = None,
+    telemetry: Telemetry | None = None,
+    governor: Governor | None = None,
+    stream: bool = False,
+    lookahead: int = 0
+) -> Dict:
     """Process a book file and generate Slack-style interpretations
     
-    Writes a JSON file containing the conversation history to the output directory
+    Writes a JSON file containing the conversation history to the output directory.
+    Progress is journaled while the book is processed so an interrupted run can be
+    resumed; the journal is removed once conversations.json is written.
 
     Args:
         file_path: Path to the book file
@@ -359,70 +810,175 @@ def process_book(file_path: str, skip_past: str, end_at: str, output_dir: str |
         end_at: String to end at in the book file
         output_dir: Directory to save outputs (string or Path)
         openai_client: OpenAI client instance
+        max_workers: Number of attachments to generate concurrently
+        file_budget: Shared file budget; overrides file_limit when several books draw from it
+        speaker: Speaker to use instead of creating one, e.g. to reuse assistants across books
+        executor: Shared executor for attachment generation; overrides max_workers
+        resume: Pick up from the journal left behind by an interrupted run; the
+            output of a finished run is returned as it is
+        cache: Cache of previous generations to reuse
+        backend: Message generation backend, see `KafkaSpeaker`
+        paragraphs: Paragraphs to process instead of the whole file, e.g. one shard of it
+        registry: Where assistant IDs are remembered between runs
+        thread_policy: When to start a new message thread, see `ThreadPolicy`
+        attachments: How documents are made, see `KafkaSpeaker`
+        image_options: How to post-process generated images, see `ImageOptions`
+        telemetry: Where API call latency, tokens and cost are recorded, see `Telemetry`
+        governor: Enforces spend and rate budgets, see `Governor`; the book stops early
+            once a budget is spent
+        stream: Stream each paragraph's messages and start generating a message's
+            attachments as soon as it arrives, instead of once the whole paragraph is done
+        lookahead: Number of paragraphs whose messages can be generated ahead of the
+            paragraph being journaled, see `prefetch`; 0 generates them in turn. A
+            paragraph is only generated ahead while the files of the paragraphs before
+            it leave room in the file budget, so no more are generated than without
+            lookahead. Ignored with stream.
 
     Returns:
         Dict containing the conversation history that was written to the output directory
     """
     # Convert output_dir to Path if it's a string
     output_dir = Path(output_dir)
+
+    # The journal is removed once a run finishes, so a finished run has nothing to resume
+    finished = output_dir / "conversations.json"
+    if resume and finished.exists() and not (output_dir / JOURNAL_NAME).exists():
+        print(f"{output_dir} already holds a finished run, not generating it again")
+        with open(finished, "r", encoding="utf-8") as f:
+            return json.load(f)
     
     # Create output directories
     attachments_dir = output_dir / "attachments"
     attachments_dir.mkdir(parents=True, exist_ok=True)
     
-    speaker = KafkaSpeaker(openai_client, model)
+    owns_speaker = speaker is None
+    if owns_speaker:
+        speaker = KafkaSpeaker(openai_client, model, cache, backend, registry=registry, thread_policy=thread_policy, attachments=attachments, image_options=image_options, telemetry=telemetry, governor=governor)
+        speaker.warm()
+    file_budget = file_budget or FileBudget(file_limit)
+    store = AttachmentStore()
     conversations: list[Conversation] = []
-    file_counter = 0
+    pending: list[Future] = []
     
-    print(f"Processing file {file_path}")
+    journal = ConversationJournal(output_dir / JOURNAL_NAME)
+    state = journal.open(resume=resume)
     
-    # Process each paragraph
-    for paragraph in file_paragraphs(file_path, skip_past=skip_past, end_at=end_at):
-        # Get messages for this paragraph
-        print(f"Processing paragraph {paragraph.paragraph_number}")
-        messages = speaker.generate_messages(paragraph)
-        if file_counter >= file_limit:
-            print(f"Reached max files ({file_limit})")
-            break
-        
-        # Create a new conversation for this paragraph
-        current_conversation = Conversation(messages=[])
-        
-        # Process each message and its attachments
-        for msg in messages:
-            # Handle any file attachments
+    # Restore whatever the interrupted run finished, and queue the rest of its attachments
+    unfinished: list[tuple[File, int]] = []
+    for first_file, data in state.paragraphs.values():
+        conversation = Conversation.from_dict(data)
+        file_number = first_file
+        for msg in conversation.messages:
             for file_desc in msg.files:
-                file_counter += 1
-
-                try:
-                    file_content = speaker.generate_attachment(file_desc)
-                except Exception as e:
-                    print(f"Failed to generate attachment.\nFile description: {str(file_desc)}\nError: {e}")
-                    continue
-                
-                # Set up the save path with padded numbering (ATT + 7 digits)
-                save_path = attachments_dir / f"ATT{file_counter:07d}{file_desc.normalized_docext}"
-                file_desc.set_saved_location(save_path)
-                
-                # Save the file
-                print(f"Saving file to {save_path}")
-                with open(save_path, "wb") as f:
-                    f.write(file_content)
-            
-            # Add message to current conversation
-            current_conversation.messages.append(msg)
-        
-        # Add completed conversation to list
-        conversations.append(current_conversation)
+                if file_number in state.attachments:
+                    saved = state.attachments[file_number]
+                    file_desc.filename = saved["filename"]
+                    file_desc.docext = saved["docext"]
+                    file_desc.saved_name = saved["saved_name"]
+                    file_desc.saved_path = saved["saved_path"]
+                else:
+                    unfinished.append((file_desc, file_number))
+                file_number += 1
+        conversations.append(conversation)
+    file_counter = state.last_file_number
+    file_budget.consume(file_counter)
+    if resume:
+        print(f"Resuming after paragraph {state.last_paragraph} with {len(unfinished)} attachments left to generate")
     
-    # Save the conversation data
-    output = {
-        "conversations": [asdict(conv) for conv in conversations]
-    }
+    print(f"Processing file {file_path}")
     
-    with open(output_dir / "conversations.json", "w", encoding="utf-8") as f:
-        json.dump(output, f, indent=2, ensure_ascii=False)
+    with ExitStack() as stack:
+        stack.callback(journal.close)
+        if owns_speaker:
+            stack.callback(speaker.close)
+        if executor is None:
+            executor = stack.enter_context(ThreadPoolExecutor(max_workers=max_workers))
+
+        for file_desc, file_number in unfinished:
+            pending.append(executor.submit(_save_attachment, speaker, file_desc, attachments_dir, file_number, journal, store))
+
+        # Paragraphs are read and their messages generated on a background thread,
+        # up to lookahead paragraphs ahead of journaling and queueing attachments
+        if paragraphs is None:
+            paragraphs = file_paragraphs(file_path, skip_past=skip_past, end_at=end_at)
+        remaining = (
+            paragraph for paragraph in traced(speaker.telemetry.tracer, "file_paragraphs", paragraphs)
+            if paragraph.paragraph_number > state.last_paragraph
+        )
+
+        # Files of paragraphs generated ahead that haven't been queued yet; they count
+        # against the budget so nothing is generated that the file limit would drop
+        ahead_files = 0
+        ahead_lock = threading.Lock()
+
+        def generate(paragraph: Paragraph) -> list[Message] | None:
+            nonlocal ahead_files
+            print(f"Processing paragraph {paragraph.paragraph_number}")
+            # Streamed messages are generated as the paragraph is handled below, and
+            # once the files have run out any messages would be thrown away
+            with ahead_lock:
+                full = file_budget.used + ahead_files >= file_budget.limit
+            if stream or full:
+                return None
+            messages = speaker.generate_messages(paragraph)
+            with ahead_lock:
+                ahead_files += sum(len(msg.files) for msg in messages)
+            return messages
+
+        try:
+            with closing(prefetch(remaining, generate, 0 if stream else lookahead)) as generated:
+                for paragraph, messages in generated:
+                    if file_budget.exhausted or (messages is None and not stream):
+                        print(f"Reached max files ({file_budget.limit})")
+                        break
+
+                    if stream:
+                        first_file = file_counter + 1
+                        messages, snapshots = [], []
+                        for msg in speaker.stream_messages(paragraph):
+                            messages.append(msg)
+                            # Journal the message as generated, before workers fill in its files
+                            snapshots.append(Message.from_dict(msg.to_dict()))
+                            for file_desc in msg.files:
+                                file_counter += 1
+                                file_budget.consume()
+                                pending.append(executor.submit(_save_attachment, speaker, file_desc, attachments_dir, file_counter, journal, store))
+                        journal.record_paragraph(paragraph.paragraph_number, first_file, Conversation(messages=snapshots))
+                        conversations.append(Conversation(messages=messages))
+                        continue
+
+                    # Create a new conversation for this paragraph
+                    current_conversation = Conversation(messages=messages)
+
+                    # Journal the paragraph before any worker touches its files
+                    journal.record_paragraph(paragraph.paragraph_number, file_counter + 1, current_conversation)
+
+                    # Queue each message's attachments; numbers are handed out in
+                    # paragraph order so the output is the same as a serial run
+                    for msg in messages:
+                        for file_desc in msg.files:
+                            file_counter += 1
+                            file_budget.consume()
+                            pending.append(executor.submit(_save_attachment, speaker, file_desc, attachments_dir, file_counter, journal, store))
+                    with ahead_lock:
+                        ahead_files -= sum(len(msg.files) for msg in messages)
+
+                    # Add completed conversation to list
+                    conversations.append(current_conversation)
+        except BudgetExceeded as e:
+            print(f"Stopping: {e}")
+
+        # Wait for the remaining attachments before writing the conversation data
+        for future in pending:
+            future.result()
     
+    with speaker.telemetry.span("write_conversations"):
+        output = _write_conversations(output_dir, conversations)
+    journal.remove()
+    if store.linked:
+        print(f"Linked {store.linked} duplicate attachments, saving {store.linked_bytes} bytes")
+    if speaker.threads.prompt_tokens:
+        print(speaker.threads.report())
     return output
 
 
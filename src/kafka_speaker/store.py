@@ -0,0 +1,74 @@
+import hashlib
+import os
+from pathlib import Path
+import threading
+from typing import BinaryIO, Dict, Iterable, Iterator
+
+# Read and write attachments this many bytes at a time
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_chunks(f: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Read an open binary file chunk by chunk"""
+    while chunk := f.read(chunk_size):
+        yield chunk
+
+
+class AttachmentStore:
+    """Streams attachments to disk, hardlinking any whose content was already written
+
+    Each file is written chunk by chunk to a temporary file that is renamed into
+    place once complete, so memory use doesn't grow with the attachment's size and
+    a crash never leaves a partial file. The SHA-256 of the content is computed on
+    the way through; a file with the same digest as an earlier one is replaced by a
+    hardlink to it. Only files written through this store are matched.
+    """
+
+    def __init__(self):
+        self.linked = 0
+        self.linked_bytes = 0
+        self._paths: Dict[str, Path] = {}
+        self._lock = threading.Lock()
+
+    def write(self, path: Path, chunks: Iterable[bytes]) -> str:
+        """Write chunks to path
+
+        Returns:
+            The hex SHA-256 digest of the content
+        """
+        tmp_path = path.with_name(path.name + ".tmp")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+        sha256 = digest.hexdigest()
+        with self._lock:
+            original = self._paths.get(sha256)
+            if original is not None and original != path and self._link(original, path):
+                tmp_path.unlink()
+                self.linked += 1
+                self.linked_bytes += size
+                return sha256
+            os.replace(tmp_path, path)
+            self._paths[sha256] = path
+        return sha256
+
+    def _link(self, original: Path, path: Path) -> bool:
+        """Hardlink path to original, returning False if the filesystem won't"""
+        link_path = path.with_name(path.name + ".link.tmp")
+        try:
+            link_path.unlink(missing_ok=True)
+            os.link(original, link_path)
+        except OSError as e:
+            print(f"Couldn't link {path} to {original}, writing a copy: {e}")
+            return False
+        os.replace(link_path, path)
+        return True
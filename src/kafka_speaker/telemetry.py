@@ -0,0 +1,249 @@
+"""Latency, token and cost accounting for the OpenAI and Slack calls of a run
+
+Calls are grouped into stages, e.g. "messages" for `KafkaSpeaker.generate_messages`
+or "slack.chat_postMessage" for every message posted. A stage's record is started
+with `Telemetry.measure`; code further down the same thread adds the run's usage,
+polling time and images to it without having to be handed the record.
+
+With a `Tracer`, every measured call, and every other `Telemetry.span`, is also
+recorded as a span of the run's trace.
+"""
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+import json
+import math
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Any, Callable, ContextManager, Dict, Iterator
+from kafka_speaker.tracing import Tracer
+
+# Estimated USD per million (input, output) tokens, from OpenAI's published prices.
+# Models that aren't listed are counted as free, so keep this up to date.
+TOKEN_PRICES: Dict[str, tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+}
+# USD per image by (model, size)
+IMAGE_PRICES: Dict[tuple[str, str], float] = {
+    ("dall-e-3", "1024x1024"): 0.040,
+    ("dall-e-3", "1024x1792"): 0.080,
+    ("dall-e-3", "1792x1024"): 0.080,
+    ("dall-e-2", "256x256"): 0.016,
+    ("dall-e-2", "512x512"): 0.018,
+    ("dall-e-2", "1024x1024"): 0.020,
+}
+# USD per code_interpreter session; every attachment run opens one
+CODE_INTERPRETER_SESSION_PRICE = 0.03
+
+PROMETHEUS_PREFIX = "kafka_speaker"
+
+
+@dataclass(slots=True)
+class CallRecord:
+    """One measured call
+
+    Attributes:
+        stage: What the call was for, e.g. "messages" or "slack.files_upload_v2"
+        seconds: Wall time of the call, waiting included
+        wait_seconds: Part of seconds spent waiting, polling a run or held by a rate limit
+        prompt_tokens: Input tokens billed for the call
+        completion_tokens: Output tokens billed for the call
+        images: Images generated
+        cost: Estimated USD, see `TOKEN_PRICES`
+        ok: False if the call raised
+    """
+    stage: str
+    seconds: float = 0.0
+    wait_seconds: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    images: int = 0
+    cost: float = 0.0
+    ok: bool = True
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Nearest-rank percentile, p between 0 and 1"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p * len(ordered)) - 1)]
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+class Telemetry:
+    """Thread-safe collection of `CallRecord`s, shared by every speaker of a run
+
+    Args:
+        clock: Time source, in seconds
+        tracer: Also record each call as a span of this trace
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter, tracer: Tracer | None = None):
+        self.records: list[CallRecord] = []
+        # Running tokens, images and cost of every call, including calls still in progress
+        self.totals = CallRecord("total")
+        self.tracer = tracer
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def span(self, name: str, **args: Any) -> ContextManager:
+        """A trace span that isn't a call of its own, e.g. writing a file; does nothing without a tracer"""
+        return self.tracer.span(name, **args) if self.tracer else nullcontext()
+
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[CallRecord]:
+        """Time the block as a call of stage; calls measured inside it are recorded separately"""
+        record = CallRecord(stage)
+        outer = getattr(self._local, "record", None)
+        self._local.record = record
+        start = self._clock()
+        try:
+            with self.span(stage):
+                yield record
+        except BaseException:
+            record.ok = False
+            raise
+        finally:
+            record.seconds = self._clock() - start
+            # A generator measuring across yields may be closed on another thread
+            if getattr(self._local, "record", None) is record:
+                self._local.record = outer
+            with self._lock:
+                self.records.append(record)
+
+    @property
+    def current(self) -> CallRecord | None:
+        """The innermost record being measured on this thread"""
+        return getattr(self._local, "record", None)
+
+    def add_wait(self, seconds: float) -> None:
+        record = self.current
+        if record is not None:
+            record.wait_seconds += seconds
+
+    def add_usage(self, model: str, usage: Any) -> None:
+        """Add a run's, completion's or response's usage to the current record"""
+        record = self.current
+        if record is None or usage is None:
+            return
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or getattr(usage, "input_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", None) or getattr(usage, "output_tokens", 0) or 0
+        input_price, output_price = TOKEN_PRICES.get(model, (0.0, 0.0))
+        cost = (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+        with self._lock:
+            for r in (record, self.totals):
+                r.prompt_tokens += prompt_tokens
+                r.completion_tokens += completion_tokens
+                r.cost += cost
+
+    def add_images(self, model: str, size: str, count: int = 1) -> None:
+        record = self.current
+        if record is not None:
+            with self._lock:
+                for r in (record, self.totals):
+                    r.images += count
+                    r.cost += IMAGE_PRICES.get((model, size), 0.0) * count
+
+    def add_cost(self, dollars: float) -> None:
+        record = self.current
+        if record is not None:
+            with self._lock:
+                record.cost += dollars
+                self.totals.cost += dollars
+
+    def summary(self) -> Dict:
+        """Totals and latency percentiles per stage, and for the whole run"""
+        with self._lock:
+            records = list(self.records)
+        stages: Dict[str, list[CallRecord]] = {}
+        for record in records:
+            stages.setdefault(record.stage, []).append(record)
+
+        def totals(group: list[CallRecord]) -> Dict:
+            seconds = [r.seconds for r in group]
+            return {
+                "calls": len(group),
+                "errors": sum(1 for r in group if not r.ok),
+                "seconds": sum(seconds),
+                "p50_seconds": percentile(seconds, 0.5),
+                "p95_seconds": percentile(seconds, 0.95),
+                "max_seconds": max(seconds, default=0.0),
+                "wait_seconds": sum(r.wait_seconds for r in group),
+                "prompt_tokens": sum(r.prompt_tokens for r in group),
+                "completion_tokens": sum(r.completion_tokens for r in group),
+                "images": sum(r.images for r in group),
+                "cost": sum(r.cost for r in group),
+            }
+
+        return {
+            "stages": {stage: totals(group) for stage, group in sorted(stages.items())},
+            "total": totals(records),
+        }
+
+    def write_summary(self, path: str | Path) -> None:
+        """Write `summary` as JSON"""
+        _write_atomic(Path(path), json.dumps(self.summary(), indent=2))
+
+    def write_prometheus(self, path: str | Path) -> None:
+        """Write the summary in the Prometheus text format, e.g. for node_exporter's textfile collector"""
+        stages = self.summary()["stages"]
+        p = PROMETHEUS_PREFIX
+        lines = [
+            f"# HELP {p}_call_seconds Wall time of API calls by stage.",
+            f"# TYPE {p}_call_seconds summary",
+        ]
+        for stage, s in stages.items():
+            lines += [
+                f'{p}_call_seconds{{stage="{stage}",quantile="0.5"}} {s["p50_seconds"]}',
+                f'{p}_call_seconds{{stage="{stage}",quantile="0.95"}} {s["p95_seconds"]}',
+                f'{p}_call_seconds_sum{{stage="{stage}"}} {s["seconds"]}',
+                f'{p}_call_seconds_count{{stage="{stage}"}} {s["calls"]}',
+            ]
+        counters = [
+            ("call_errors_total", "API calls that failed.", lambda s: [("", s["errors"])]),
+            ("wait_seconds_total", "Time spent polling runs or held by rate limits.", lambda s: [("", s["wait_seconds"])]),
+            ("tokens_total", "Tokens billed.", lambda s: [(',kind="prompt"', s["prompt_tokens"]), (',kind="completion"', s["completion_tokens"])]),
+            ("images_total", "Images generated.", lambda s: [("", s["images"])]),
+            ("cost_dollars_total", "Estimated cost in USD.", lambda s: [("", s["cost"])]),
+        ]
+        for name, help_text, values in counters:
+            lines += [f"# HELP {p}_{name} {help_text}", f"# TYPE {p}_{name} counter"]
+            for stage, s in stages.items():
+                for labels, value in values(s):
+                    lines.append(f'{p}_{name}{{stage="{stage}"{labels}}} {value}')
+        _write_atomic(Path(path), "\n".join(lines) + "\n")
+
+    def report(self) -> str:
+        """Latency percentiles, tokens and cost per stage, one line each"""
+        summary = self.summary()
+        if not summary["total"]["calls"]:
+            return "No API calls recorded"
+        lines = []
+        for stage, s in summary["stages"].items():
+            line = f"{stage}: {s['calls']} calls, p50 {s['p50_seconds']:.2f}s, p95 {s['p95_seconds']:.2f}s"
+            if s["errors"]:
+                line += f", {s['errors']} failed"
+            if s["wait_seconds"]:
+                line += f", {s['wait_seconds']:.1f}s waiting"
+            if s["prompt_tokens"] or s["completion_tokens"]:
+                line += f", {s['prompt_tokens']}+{s['completion_tokens']} tokens"
+            if s["images"]:
+                line += f", {s['images']} images"
+            if s["cost"]:
+                line += f", ${s['cost']:.4f}"
+            lines.append(line)
+        total = summary["total"]
+        lines.append(f"Total: {total['calls']} calls in {total['seconds']:.1f}s, estimated ${total['cost']:.4f}")
+        return "\n".join(lines)
@@ -0,0 +1,167 @@
+from collections import deque
+from dataclasses import dataclass
+import statistics
+import threading
+import openai
+from kafka_speaker.governor import Governor
+from kafka_speaker.telemetry import Telemetry
+
+_summary_instructions = '''
+You are keeping notes for a writer who turns a novel into Slack conversations, one passage at a time.
+Summarize the passages you are given in at most 150 words: who is involved, where the story stands and the mood of the office.
+Respond with only the summary.
+'''
+
+
+@dataclass
+class ThreadPolicy:
+    """When to move the message assistant to a fresh thread
+
+    Attributes:
+        max_prompt_tokens: Start a new thread once a run's prompt reaches this many tokens
+        max_paragraphs: Start a new thread after this many paragraphs
+        summarize: Seed each new thread with a short summary of the latest paragraphs
+        summary_paragraphs: How many of the latest paragraphs the summary covers
+    """
+    max_prompt_tokens: int | None = None
+    max_paragraphs: int | None = None
+    summarize: bool = False
+    summary_paragraphs: int = 5
+
+
+class ThreadManager:
+    """Hands out the message thread, rotating it once it uses up its budget
+
+    An assistant thread re-sends its whole history with every run, so without
+    rotation the prompt, and with it cost and latency, grows with every paragraph.
+    A chain of responses grows the same way, and is restarted by `chain`.
+    The prompt tokens of every run are kept in `prompt_tokens` for reporting.
+
+    Args:
+        openai_client: OpenAI client instance
+        model: Model to write the summaries with
+        policy: When to rotate, see `ThreadPolicy`
+        telemetry: Where the summaries' latency, tokens and cost are recorded
+        governor: Budgets the summaries are admitted against, and picks their model
+    """
+
+    def __init__(
+        self,
+        openai_client: openai.OpenAI,
+        model: str,
+        policy: ThreadPolicy | None = None,
+        telemetry: Telemetry | None = None,
+        governor: Governor | None = None
+    ):
+        self._client = openai_client
+        self._model = model
+        self.policy = policy or ThreadPolicy()
+        self._telemetry = telemetry or (governor.telemetry if governor else Telemetry())
+        self._governor = governor or Governor(telemetry=self._telemetry)
+        self._thread = None
+        self._paragraphs = 0
+        self._last_prompt_tokens = 0
+        self._recent: deque[str] = deque(maxlen=self.policy.summary_paragraphs)
+        self.threads_started = 0
+        self.prompt_tokens: list[int] = []
+        self._lock = threading.Lock()
+
+    def _over_budget(self) -> bool:
+        if self.policy.max_paragraphs and self._paragraphs >= self.policy.max_paragraphs:
+            return True
+        return bool(self.policy.max_prompt_tokens) and self._last_prompt_tokens >= self.policy.max_prompt_tokens
+
+    def thread(self):
+        """The current thread, starting a new one if there is none or it is over budget
+
+        A thread that is rotated out is deleted.
+        """
+        with self._lock:
+            if self._thread is not None and self._over_budget():
+                print(f"Rotating message thread after {self._paragraphs} paragraphs and {self._last_prompt_tokens} prompt tokens")
+                self._delete_thread(self._thread.id)
+                self._thread = None
+            if self._thread is None:
+                self._thread = self._client.beta.threads.create(messages=self._start())
+            return self._thread
+
+    def chain(self, previous_response_id: str | None) -> tuple[str | None, list[dict]]:
+        """Where a backend that chains requests, like `ResponsesBackend`, should continue from
+
+        Args:
+            previous_response_id: The response the last request was chained onto, if any
+
+        Returns:
+            previous_response_id while the chain is within budget, otherwise None and
+            the messages to start the new chain with
+        """
+        with self._lock:
+            if previous_response_id is not None and not self._over_budget():
+                return previous_response_id, []
+            if previous_response_id is not None:
+                print(f"Starting a new response chain after {self._paragraphs} paragraphs and {self._last_prompt_tokens} prompt tokens")
+            return None, self._start()
+
+    def _start(self) -> list[dict]:
+        """Reset the budget for a new thread or chain and return the messages to seed it with"""
+        messages = []
+        if self.policy.summarize and self._recent:
+            messages.append({"role": "user", "content": f"The story so far:\n{self._summary()}"})
+        self.threads_started += 1
+        self._paragraphs = 0
+        self._last_prompt_tokens = 0
+        return messages
+
+    def _delete_thread(self, thread_id: str) -> None:
+        try:
+            self._client.beta.threads.delete(thread_id)
+        except Exception as e:
+            print(f"Failed to delete thread {thread_id}: {e}")
+
+    def _summary(self) -> str:
+        """Raises `BudgetExceeded` once the governor's budget is spent"""
+        model = self._governor.model(self._model)
+        self._governor.admit()
+        with self._telemetry.measure("thread_summary"):
+            completion = self._client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": _summary_instructions},
+                    {"role": "user", "content": "\n\n".join(self._recent)},
+                ]
+            )
+            self._telemetry.add_usage(model, getattr(completion, "usage", None))
+        return completion.choices[0].message.content
+
+    def record_paragraph(self, content: str) -> None:
+        """Note that a paragraph was added to the current thread"""
+        with self._lock:
+            self._paragraphs += 1
+            self._recent.append(content)
+
+    def record_run(self, thread_id: str, run) -> None:
+        """Note the token usage of a run; runs on other threads are ignored"""
+        usage = getattr(run, "usage", None)
+        with self._lock:
+            if usage is None or self._thread is None or thread_id != self._thread.id:
+                return
+            self._last_prompt_tokens = usage.prompt_tokens
+            self.prompt_tokens.append(usage.prompt_tokens)
+
+    def record_response(self, response) -> None:
+        """Note the token usage of a response in the current chain"""
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        with self._lock:
+            self._last_prompt_tokens = usage.input_tokens
+            self.prompt_tokens.append(usage.input_tokens)
+
+    def report(self) -> str:
+        """One line summary of the prompt tokens per run"""
+        if not self.prompt_tokens:
+            return "No message runs"
+        return (
+            f"{len(self.prompt_tokens)} message runs on {self.threads_started} threads, prompt tokens per run: "
+            f"mean {statistics.mean(self.prompt_tokens):.0f}, max {max(self.prompt_tokens)}, last {self.prompt_tokens[-1]}"
+        )
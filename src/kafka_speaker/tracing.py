@@ -0,0 +1,89 @@
+"""Spans of a run in the Chrome trace-event format, for chrome://tracing or Perfetto
+
+Each span becomes a complete ("X") event on the thread it ran on, so opening the
+trace shows which calls overlapped and where a run waited on a single thread.
+"""
+from contextlib import contextmanager
+import json
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+
+class Tracer:
+    """Thread-safe recorder of nested spans"""
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        self._clock = clock
+        self._origin = clock()
+        self._events: list[Dict] = []
+        self._threads: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def _micros(self, t: float) -> float:
+        return round((t - self._origin) * 1_000_000, 3)
+
+    @contextmanager
+    def span(self, name: str, **args: Any) -> Iterator[None]:
+        """Record the block as a span; args are shown with it in the trace viewer"""
+        start = self._clock()
+        try:
+            yield
+        except BaseException as e:
+            args["error"] = repr(e)
+            raise
+        finally:
+            end = self._clock()
+            tid = threading.get_native_id()
+            event = {
+                "name": name,
+                "ph": "X",
+                "ts": self._micros(start),
+                "dur": self._micros(end) - self._micros(start),
+                "pid": os.getpid(),
+                "tid": tid,
+                "args": args,
+            }
+            with self._lock:
+                self._events.append(event)
+                self._threads.setdefault(tid, threading.current_thread().name)
+
+    def events(self) -> list[Dict]:
+        """The recorded spans, preceded by metadata events naming the process and threads"""
+        pid = os.getpid()
+        with self._lock:
+            metadata = [{"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": "kafka-speaker"}}]
+            metadata += [
+                {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                for tid, name in self._threads.items()
+            ]
+            return metadata + sorted(self._events, key=lambda event: event["ts"])
+
+    def write(self, path: str | Path) -> None:
+        """Write the trace as JSON in the Chrome trace-event format"""
+        path = Path(path)
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_text(json.dumps({"traceEvents": self.events(), "displayTimeUnit": "ms"}), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+
+def traced(tracer: Tracer | None, name: str, items: Iterable[T]) -> Iterable[T]:
+    """Record a span for producing each item, e.g. each paragraph read from a book"""
+    if tracer is None:
+        return items
+    return _traced(tracer, name, items)
+
+
+def _traced(tracer: Tracer, name: str, items: Iterable[T]) -> Iterator[T]:
+    iterator = iter(items)
+    while True:
+        with tracer.span(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
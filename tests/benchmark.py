@@ -0,0 +1,112 @@
+"""End-to-end throughput benchmark against the fake OpenAI and Slack backends
+
+Runs `process_book` over the bundled Gutenberg texts and `upload_to_slack` over
+the result, and reports paragraphs/sec, attachments/sec and messages posted/sec.
+
+    python -m tests.benchmark --latency 0.05 --workers 8
+"""
+import argparse
+from dataclasses import dataclass
+import os
+from pathlib import Path
+import tempfile
+import time
+
+from kafka_speaker.ratelimit import RateLimiter
+from kafka_speaker.slack import upload_to_slack
+from kafka_speaker.speaker import KafkaSpeaker, process_book
+from tests.fakes import FakeOpenAI, FakeSlackClient
+
+DATA_DIR = Path(os.path.dirname(__file__)) / "data"
+BOOKS = ["pg30570-kafka-grosser-larm.txt", "pg69327-kafka-der-prozess.txt"]
+
+
+@dataclass
+class BenchmarkResult:
+    book: str
+    paragraphs: int
+    attachments: int
+    messages_posted: int
+    speak_seconds: float
+    slack_seconds: float
+
+    @property
+    def paragraphs_per_sec(self) -> float:
+        return self.paragraphs / self.speak_seconds if self.speak_seconds else 0.0
+
+    @property
+    def attachments_per_sec(self) -> float:
+        return self.attachments / self.speak_seconds if self.speak_seconds else 0.0
+
+    @property
+    def messages_per_sec(self) -> float:
+        return self.messages_posted / self.slack_seconds if self.slack_seconds else 0.0
+
+
+def run_benchmark(
+    book: str,
+    output_dir: Path,
+    file_limit: int = 50,
+    max_workers: int = 4,
+    latency: float = 0.0,
+    error_rate: float = 0.0
+) -> BenchmarkResult:
+    """Run one book through process_book and upload_to_slack with fake backends"""
+    openai_client = FakeOpenAI(latency=latency, error_rate=error_rate)
+    slack_client = FakeSlackClient(latency=latency, error_rate=error_rate)
+    speaker = KafkaSpeaker(openai_client, http_session=openai_client.http)
+
+    start = time.perf_counter()
+    output = process_book(
+        str(DATA_DIR / book),
+        skip_past="*** START OF THE PROJECT GUTENBERG EBOOK",
+        end_at="*** END OF THE PROJECT GUTENBERG EBOOK",
+        output_dir=output_dir,
+        openai_client=openai_client,
+        model="gpt-4o-mini",
+        file_limit=file_limit,
+        max_workers=max_workers,
+        speaker=speaker
+    )
+    speak_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    # The fake has no rate limits, so measure the uploader itself
+    upload_to_slack(output_dir, "C_BENCH", "xoxb-fake", "C_FILES", client=slack_client, rate_limiter=RateLimiter({}))
+    slack_seconds = time.perf_counter() - start
+
+    conversations = output["conversations"]
+    return BenchmarkResult(
+        book=book,
+        paragraphs=len(conversations),
+        attachments=sum(1 for c in conversations for m in c["messages"] for f in m["files"] if f["saved_path"]),
+        messages_posted=len(slack_client.posted),
+        speak_seconds=speak_seconds,
+        slack_seconds=slack_seconds,
+    )
+
+
+def format_results(results: list[BenchmarkResult]) -> str:
+    lines = [f"{'book':<34} {'paragraphs/s':>12} {'attachments/s':>13} {'messages/s':>10}"]
+    for r in results:
+        lines.append(f"{r.book:<34} {r.paragraphs_per_sec:>12.1f} {r.attachments_per_sec:>13.1f} {r.messages_per_sec:>10.1f}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark process_book and upload_to_slack against fake backends.')
+    parser.add_argument('--latency', type=float, help='Seconds each fake API call takes', default=0.01)
+    parser.add_argument('--error-rate', type=float, help='Fraction of fake API calls that fail', default=0.0)
+    parser.add_argument('--workers', type=int, help='Number of attachments to generate concurrently', default=4)
+    parser.add_argument('--file-limit', type=int, help='Limit for the number of files to generate per book', default=50)
+    args = parser.parse_args()
+
+    results = []
+    for book in BOOKS:
+        with tempfile.TemporaryDirectory() as output_dir:
+            results.append(run_benchmark(book, Path(output_dir), args.file_limit, args.workers, args.latency, args.error_rate))
+    print(format_results(results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,476 @@
+"""In-process stand-ins for the OpenAI client and Slack WebClient
+
+They implement just the calls kafka_speaker makes, answer deterministically for a
+given seed, and can add latency and fail a fraction of calls so throughput and
+error handling can be exercised without network access.
+"""
+import asyncio
+import hashlib
+import itertools
+import json
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import openai
+from slack_sdk.errors import SlackApiError
+
+PNG_BYTES = b'\x89PNG\r\n\x1a\n' + b'\x00' * 1024
+
+
+class FakeAPIError(Exception):
+    pass
+
+
+class _Behaviour:
+    """Shared latency and error injection for the fakes"""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0, error_calls: set[str] | None = None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_calls = error_calls
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.calls: dict[str, int] = {}
+        # Names of the calls in the order they were made
+        self.log: list[str] = []
+
+    def call(self, name: str) -> None:
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            self.log.append(name)
+            fail = self._random.random() < self.error_rate and (self.error_calls is None or name in self.error_calls)
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            raise FakeAPIError(f"Injected failure in {name}")
+
+    def new_id(self, prefix: str) -> str:
+        with self._lock:
+            return f"{prefix}_{next(self._ids)}"
+
+
+def _fake_messages(content: str, files_per_paragraph: int) -> str:
+    """Deterministic `_message_format` reply for a paragraph"""
+    digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    extensions = ["png", "md", "pdf", "docx", "csv"]
+    messages = []
+    for i in range(3):
+        messages.append({
+            "sender_name": ["Max", "Lina", "Valli"][i],
+            "message_content": f"Message {i} about {digest[:8]} 🙃",
+            "files": [],
+        })
+    for i in range(files_per_paragraph):
+        messages[i % len(messages)]["files"].append({
+            "filename": f"file_{digest[:6]}_{i}",
+            "docext": extensions[(int(digest[i], 16) + i) % len(extensions)],
+            "description": f"A Kafka-esque document number {i} for {digest[:8]}.",
+        })
+    return json.dumps({"messages": messages}, ensure_ascii=False)
+
+
+def _fake_document(content: str) -> str:
+    """Deterministic `_document_format` reply for an attachment"""
+    lines = content.splitlines()
+    return json.dumps({"title": lines[0].removeprefix("File: "), "sections": [
+        {"heading": "Description", "paragraphs": lines[1:], "bullets": ["First", "Second"], "table": {"columns": [], "rows": []}},
+        {"heading": "Figures", "paragraphs": [], "bullets": [], "table": {"columns": ["Item", "Count"], "rows": [["Forms", "7"], ["Stamps", "0"]]}},
+    ]}, ensure_ascii=False)
+
+
+class FakeOpenAI:
+    """Stand-in for `openai.OpenAI` covering assistants, threads, runs, files and images
+
+    Args:
+        latency: Seconds each API call takes
+        error_rate: Fraction of API calls that raise FakeAPIError
+        files_per_paragraph: Attachments described in each generated conversation
+        files_per_attachment: Files the attachment assistant makes for each attachment
+        seed: Seed for error injection
+        error_calls: Names of the calls that may fail, e.g. {"images.generate"}; all calls by default
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, files_per_paragraph: int = 2, seed: int = 0, error_calls: set[str] | None = None, files_per_attachment: int = 1):
+        self.behaviour = _Behaviour(latency, error_rate, seed, error_calls)
+        self.files_per_paragraph = files_per_paragraph
+        self.files_per_attachment = files_per_attachment
+        self._assistants: dict[str, SimpleNamespace] = {}
+        self._threads: dict[str, list[SimpleNamespace]] = {}
+        self._files: dict[str, bytes] = {}
+        self._runs: dict[str, SimpleNamespace] = {}
+        # Options passed to runs, completions and images, e.g. a model override
+        self.request_options: list[tuple[str, dict]] = []
+        self._lock = threading.Lock()
+
+        self.beta = SimpleNamespace(
+            assistants=SimpleNamespace(list=self._list_assistants, create=self._create_assistant, retrieve=self._retrieve_assistant, update=self._update_assistant),
+            threads=SimpleNamespace(
+                create=self._create_thread,
+                create_and_run=self._create_and_run,
+                delete=self._delete_thread,
+                messages=SimpleNamespace(create=self._create_message, list=self._list_messages),
+                runs=SimpleNamespace(create_and_poll=self._create_and_poll, poll=self._poll_run, stream=self._stream_run),
+            ),
+        )
+        self.files = SimpleNamespace(
+            content=self._file_content,
+            delete=self._delete_file,
+            with_streaming_response=SimpleNamespace(content=self._stream_file_content)
+        )
+        self.images = SimpleNamespace(generate=self._generate_image)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat_completion))
+        self.http = FakeHttpSession(self.behaviour)
+
+    def _list_assistants(self, order: str = "desc", limit: int = 20, after: str | None = None, **kwargs):
+        self.behaviour.call("assistants.list")
+        assistants = list(self._assistants.values())
+        if order == "desc":
+            assistants.reverse()
+        if after:
+            assistants = assistants[[a.id for a in assistants].index(after) + 1:]
+        return FakePage(assistants[:int(limit)], len(assistants) > int(limit), lambda last: self._list_assistants(order, limit, last))
+
+    def _create_assistant(self, name: str, **params):
+        self.behaviour.call("assistants.create")
+        assistant = SimpleNamespace(id=self.behaviour.new_id("asst"), name=name, **{"metadata": None, **params})
+        self._assistants[assistant.id] = assistant
+        return assistant
+
+    def _retrieve_assistant(self, assistant_id: str):
+        self.behaviour.call("assistants.retrieve")
+        if assistant_id not in self._assistants:
+            request = httpx.Request("GET", f"https://api.openai.com/v1/assistants/{assistant_id}")
+            raise openai.NotFoundError(f"No assistant found with id '{assistant_id}'.", response=httpx.Response(404, request=request), body=None)
+        return self._assistants[assistant_id]
+
+    def _update_assistant(self, assistant_id: str, **params):
+        self.behaviour.call("assistants.update")
+        self._assistants[assistant_id].__dict__.update(params)
+        return self._assistants[assistant_id]
+
+    def _create_thread(self, messages: list | None = None, **kwargs):
+        self.behaviour.call("threads.create")
+        thread = SimpleNamespace(id=self.behaviour.new_id("thread"))
+        with self._lock:
+            self._threads[thread.id] = []
+        for message in messages or []:
+            self._append(thread.id, "user", message["content"])
+        return thread
+
+    def _append(self, thread_id: str, role: str, content: str, run_id: str | None = None, attachments: list | None = None):
+        message = SimpleNamespace(
+            id=self.behaviour.new_id("msg"),
+            role=role,
+            run_id=run_id,
+            content=[SimpleNamespace(text=SimpleNamespace(value=content))],
+            attachments=attachments or [],
+        )
+        with self._lock:
+            self._threads[thread_id].append(message)
+        return message
+
+    def _create_message(self, thread_id: str, role: str, content: str):
+        self.behaviour.call("threads.messages.create")
+        return self._append(thread_id, role, content)
+
+    def _list_messages(self, thread_id: str, run_id: str | None = None, **kwargs):
+        self.behaviour.call("threads.messages.list")
+        with self._lock:
+            messages = [m for m in reversed(self._threads[thread_id]) if run_id is None or m.run_id == run_id]
+        return SimpleNamespace(data=messages)
+
+    def _delete_thread(self, thread_id: str):
+        self.behaviour.call("threads.delete")
+        with self._lock:
+            del self._threads[thread_id]
+        return SimpleNamespace(id=thread_id, deleted=True)
+
+    def _create_and_run(self, assistant_id: str, thread: dict | None = None, **kwargs):
+        self.behaviour.call("threads.create_and_run")
+        self.request_options.append(("threads.create_and_run", kwargs))
+        thread_id = self.behaviour.new_id("thread")
+        with self._lock:
+            self._threads[thread_id] = []
+        for message in (thread or {}).get("messages", []):
+            self._append(thread_id, "user", message["content"])
+        run = self._run(thread_id, assistant_id)
+        with self._lock:
+            self._runs[run.id] = run
+        return SimpleNamespace(id=run.id, thread_id=thread_id, status="queued", usage=None)
+
+    def _poll_run(self, run_id: str, thread_id: str, **kwargs):
+        self.behaviour.call("threads.runs.poll")
+        with self._lock:
+            return self._runs[run_id]
+
+    def _create_and_poll(self, thread_id: str, assistant_id: str, **kwargs):
+        self.behaviour.call("threads.runs.create_and_poll")
+        self.request_options.append(("threads.runs.create_and_poll", kwargs))
+        return self._run(thread_id, assistant_id)
+
+    def _stream_run(self, thread_id: str, assistant_id: str, **kwargs):
+        self.behaviour.call("threads.runs.stream")
+        self.request_options.append(("threads.runs.stream", kwargs))
+        run = self._run(thread_id, assistant_id)
+        with self._lock:
+            text = self._threads[thread_id][-1].content[0].text.value
+        return FakeRunStream(text, run, self.behaviour)
+
+    def _run(self, thread_id: str, assistant_id: str):
+        run_id = self.behaviour.new_id("run")
+        with self._lock:
+            prompt = self._threads[thread_id][-1].content[0].text.value
+            context = sum(len(m.content[0].text.value) for m in self._threads[thread_id])
+        assistant = self._assistants[assistant_id]
+        if "response_format" in assistant.__dict__:
+            self._append(thread_id, "assistant", _fake_messages(prompt, self.files_per_paragraph), run_id)
+        else:
+            file_ids = [self.behaviour.new_id("file") for _ in range(self.files_per_attachment)]
+            with self._lock:
+                for file_id in file_ids:
+                    self._files[file_id] = f"# Generated\n\n{prompt}\n".encode("utf-8")
+            self._append(thread_id, "assistant", "Here is your file.", run_id, [SimpleNamespace(file_id=file_id) for file_id in file_ids])
+        usage = SimpleNamespace(prompt_tokens=context // 4, completion_tokens=200, total_tokens=context // 4 + 200)
+        return SimpleNamespace(id=run_id, thread_id=thread_id, status="completed", usage=usage)
+
+    def _file_content(self, file_id: str):
+        self.behaviour.call("files.content")
+        with self._lock:
+            return SimpleNamespace(content=self._files[file_id])
+
+    def _stream_file_content(self, file_id: str):
+        self.behaviour.call("files.content")
+        with self._lock:
+            return FakeHttpResponse(self._files[file_id])
+
+    def _delete_file(self, file_id: str):
+        self.behaviour.call("files.delete")
+        with self._lock:
+            del self._files[file_id]
+        return SimpleNamespace(id=file_id, deleted=True)
+
+    def _generate_image(self, prompt: str, **kwargs):
+        self.behaviour.call("images.generate")
+        self.request_options.append(("images.generate", kwargs))
+        return SimpleNamespace(data=[SimpleNamespace(url=f"https://images.example/{self.behaviour.new_id('img')}.png")])
+
+    def _chat_completion(self, model: str, messages: list, response_format: dict | None = None, **kwargs):
+        self.behaviour.call("chat.completions.create")
+        self.request_options.append(("chat.completions.create", {"model": model, **kwargs}))
+        prompt = messages[-1]["content"]
+        if not response_format:
+            content = f"# Generated\n\n{prompt}\n"
+        elif response_format["json_schema"]["name"] == "document":
+            content = _fake_document(prompt)
+        else:
+            content = _fake_messages(prompt, self.files_per_paragraph)
+        message = SimpleNamespace(role="assistant", content=content, refusal=None)
+        usage = SimpleNamespace(prompt_tokens=len(prompt) // 4, completion_tokens=200, total_tokens=len(prompt) // 4 + 200)
+        if kwargs.get("stream"):
+            return self._chat_chunks(content, usage)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+    def _chat_chunks(self, content: str, usage):
+        for delta in _deltas(content):
+            self.behaviour.call("chat.completions.delta")
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta, refusal=None))], usage=None)
+        yield SimpleNamespace(choices=[], usage=usage)
+
+
+def _deltas(text: str, size: int = 32):
+    """Split a reply into the small pieces a streamed response arrives in"""
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class FakeRunStream:
+    """Context manager like the SDK's `AssistantStreamManager`, streaming a finished run's reply"""
+
+    def __init__(self, text: str, run, behaviour: _Behaviour):
+        self._text = text
+        self._run = run
+        self._behaviour = behaviour
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def text_deltas(self):
+        for delta in _deltas(self._text):
+            self._behaviour.call("threads.runs.stream.delta")
+            yield delta
+
+    def get_final_run(self):
+        return self._run
+
+
+class FakePage:
+    """A page of a list call; iterating it fetches the following pages like the SDK's cursor pages"""
+
+    def __init__(self, data: list, has_more: bool, next_page):
+        self.data = data
+        self.has_more = has_more
+        self._next_page = next_page
+
+    def __iter__(self):
+        page = self
+        while True:
+            yield from page.data
+            if not page.has_more:
+                return
+            page = page._next_page(page.data[-1].id)
+
+
+class FakeHttpResponse:
+    """A downloaded body, readable whole or streamed in chunks like requests' and the OpenAI SDK's responses"""
+
+    def __init__(self, content: bytes):
+        self.content = content
+        self.status_code = 200
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size: int = 1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    iter_bytes = iter_content
+
+
+class FakeHttpSession:
+    """Stand-in for the `requests.Session` used to download generated images"""
+
+    def __init__(self, behaviour: _Behaviour):
+        self.behaviour = behaviour
+
+    def get(self, url: str, **kwargs):
+        self.behaviour.call("http.get")
+        return FakeHttpResponse(PNG_BYTES)
+
+
+def _awaitable(namespace: SimpleNamespace) -> SimpleNamespace:
+    """Copy of a namespace of fake calls where each call is awaited on a worker thread"""
+    def wrap(fn):
+        async def call(*args, **kwargs):
+            return await asyncio.to_thread(fn, *args, **kwargs)
+        return call
+    return SimpleNamespace(**{
+        name: _awaitable(value) if isinstance(value, SimpleNamespace) else wrap(value)
+        for name, value in vars(namespace).items()
+    })
+
+
+class FakeAsyncPage:
+    """Async iteration over a `FakePage`, like the SDK's `AsyncPaginator`"""
+
+    def __init__(self, page: FakePage):
+        self._page = page
+
+    async def __aiter__(self):
+        for item in self._page:
+            yield item
+
+
+class FakeAsyncHttpClient:
+    """Stand-in for the `httpx.AsyncClient` used to download generated images"""
+
+    def __init__(self, behaviour: _Behaviour):
+        self.behaviour = behaviour
+
+    async def get(self, url: str, **kwargs):
+        await asyncio.to_thread(self.behaviour.call, "http.get")
+        return FakeHttpResponse(PNG_BYTES)
+
+    async def aclose(self):
+        pass
+
+
+class FakeAsyncOpenAI:
+    """Stand-in for `openai.AsyncOpenAI`, running the calls of a `FakeOpenAI` on worker threads
+
+    Takes the same arguments as `FakeOpenAI`, whose state is kept in `sync`.
+    """
+
+    def __init__(self, **kwargs):
+        self.sync = FakeOpenAI(**kwargs)
+        self.behaviour = self.sync.behaviour
+        self.beta = _awaitable(self.sync.beta)
+        # Listing isn't awaited, its pages are iterated with async for
+        self.beta.assistants.list = lambda **kwargs: FakeAsyncPage(self.sync.beta.assistants.list(**kwargs))
+        self.files = _awaitable(self.sync.files)
+        self.images = _awaitable(self.sync.images)
+        self.chat = _awaitable(self.sync.chat)
+        self.http = FakeAsyncHttpClient(self.behaviour)
+
+
+class FakeSlackResponse(dict):
+    """Dict-like like `slack_sdk.web.SlackResponse`, with the same data/status_code/headers"""
+
+    def __init__(self, data: dict, status_code: int = 200, headers: dict | None = None):
+        super().__init__(data)
+        self.data = data
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeSlackClient:
+    """Stand-in for `slack_sdk.WebClient` covering chat_postMessage and files_upload_v2
+
+    Failed calls raise SlackApiError like the real client.
+
+    Args:
+        latency: Seconds each API call takes
+        error_rate: Fraction of API calls that fail
+        seed: Seed for error injection
+        error_calls: Names of the calls that may fail; all calls by default
+        rate_limited: Number of calls answered with a 429 before any succeed
+        retry_after: Retry-After header sent with those 429s
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0, error_calls: set[str] | None = None, rate_limited: int = 0, retry_after: int = 1):
+        self.behaviour = _Behaviour(latency, error_rate, seed, error_calls)
+        self.rate_limited = rate_limited
+        self.retry_after = retry_after
+        self.posted: list[dict] = []
+        self.uploaded: list[dict] = []
+        self._lock = threading.Lock()
+        self._ts = itertools.count(1)
+
+    def _call(self, name: str):
+        with self._lock:
+            limited = self.rate_limited > 0
+            self.rate_limited -= limited
+        if limited:
+            response = FakeSlackResponse({"ok": False, "error": "ratelimited"}, status_code=429, headers={"Retry-After": str(self.retry_after)})
+            raise SlackApiError("ratelimited", response)
+        try:
+            self.behaviour.call(name)
+        except FakeAPIError as e:
+            raise SlackApiError(str(e), FakeSlackResponse({"ok": False, "error": "internal_error"}, status_code=500))
+
+    def chat_postMessage(self, **kwargs):
+        self._call("chat_postMessage")
+        with self._lock:
+            ts = f"{1700000000 + next(self._ts)}.000100"
+            self.posted.append({**kwargs, "ts": ts})
+        return FakeSlackResponse({"ok": True, "channel": kwargs["channel"], "ts": ts})
+
+    def files_upload_v2(self, **kwargs):
+        self._call("files_upload_v2")
+        file_id = self.behaviour.new_id("F")
+        with self._lock:
+            self.uploaded.append({**kwargs, "id": file_id})
+        return FakeSlackResponse({"ok": True, "file": {"id": file_id, "permalink": f"https://slack.example/files/{file_id}"}})
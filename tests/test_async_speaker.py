@@ -0,0 +1,78 @@
+import asyncio
+import json
+import os
+import pytest
+from environs import Env
+import openai
+import shutil
+
+from kafka_speaker.async_speaker import AsyncKafkaSpeaker, process_book
+from kafka_speaker.paragraph import file_paragraphs
+from tests.fakes import FakeAsyncOpenAI, _fake_messages
+
+@pytest.fixture
+def async_openai_client():
+    env = Env()
+    env.read_env()
+
+    return openai.AsyncOpenAI(
+        api_key=env("OPENAI_API_KEY"),
+        organization=env("OPENAI_ORGANIZATION"),
+        project=env("OPENAI_PROJECT"),
+    )
+
+@pytest.fixture
+def test_output_dir():
+    output_dir = os.path.join(os.path.dirname(__file__), "output_async")
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.makedirs(output_dir)
+    return output_dir
+
+def test_async_process_book(async_openai_client, test_output_dir):
+    test_file = os.path.join(os.path.dirname(__file__), "data", "pg30570-kafka-grosser-larm.txt")
+
+    output = asyncio.run(process_book(test_file, skip_past="*** START OF THE PROJECT GUTENBERG EBOOK", end_at="*** END OF THE PROJECT GUTENBERG EBOOK", output_dir=test_output_dir, openai_client=async_openai_client, model="gpt-4o-mini", file_limit=50))
+
+    conversations = output["conversations"]
+    assert len(conversations) > 0
+    assert os.path.exists(os.path.join(test_output_dir, "conversations.json")), "Expected output file to exist"
+
+    saved = [f for m in conversations[0]["messages"] for f in m["files"] if f["saved_path"]]
+    assert len(saved) > 0, "Expected at least one attachment to be saved"
+    assert all(os.path.exists(f["saved_path"]) for f in saved)
+
+def test_async_process_book_offline(tmp_path):
+    test_file = os.path.join(os.path.dirname(__file__), "data", "pg69327-kafka-der-prozess.txt")
+    markers = dict(skip_past="*** START OF THE PROJECT GUTENBERG EBOOK", end_at="*** END OF THE PROJECT GUTENBERG EBOOK")
+    # Every image fails, every other attachment succeeds
+    client = FakeAsyncOpenAI(latency=0.01, files_per_paragraph=3, error_rate=1.0, error_calls={"images.generate"})
+    speaker = AsyncKafkaSpeaker(client, http_client=client.http)
+
+    output = asyncio.run(process_book(
+        test_file, **markers, output_dir=tmp_path, openai_client=client, model="gpt-4o-mini",
+        file_limit=7, max_workers=4, speaker=speaker
+    ))
+
+    # Paragraphs stop once the limit is reached, without generating one more
+    conversations = output["conversations"]
+    paragraphs = list(file_paragraphs(test_file, **markers))[:3]
+    assert len(conversations) == 3
+    assert client.behaviour.calls["threads.runs.create_and_poll"] == 3
+    for conversation, paragraph in zip(conversations, paragraphs):
+        expected = json.loads(_fake_messages(str(paragraph), 3))["messages"]
+        assert [m["message_content"] for m in conversation["messages"]] == [m["message_content"] for m in expected]
+
+    files = [f for c in conversations for m in c["messages"] for f in m["files"]]
+    assert len(files) == 9
+    failed = [f for f in files if f["docext"] == "png"]
+    assert failed
+    for number, f in enumerate(files, 1):
+        if f in failed:
+            assert f["saved_path"] is None
+        else:
+            assert f["saved_name"].startswith(f"ATT{number:07d}.")
+            assert os.path.exists(f["saved_path"])
+    assert len(os.listdir(tmp_path / "attachments")) == len(files) - len(failed)
+    # Attachment threads and files are cleaned up
+    assert list(client.sync._threads) == [speaker._message_thread.id]
+    assert client.sync._files == {}
@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+from kafka_speaker.backends import ChatCompletionsBackend, ResponsesBackend
+from kafka_speaker.model import parse_messages
+from kafka_speaker.telemetry import Telemetry
+from kafka_speaker.threads import ThreadManager, ThreadPolicy
+from kafka_speaker.speaker import _message_format, _speaker_instructions
+
+reply = '{"messages": [{"sender_name": "Max", "message_content": "hi 👋", "files": []}]}'
+
+class FakeResponses:
+    def __init__(self):
+        self.calls = []
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        response = SimpleNamespace(id=f"resp_{len(self.calls)}", status="completed", output_text=reply)
+        if kwargs.get("stream"):
+            deltas = [SimpleNamespace(type="response.output_text.delta", delta=reply[i:i + 10]) for i in range(0, len(reply), 10)]
+            return iter(deltas + [SimpleNamespace(type="response.completed", response=response)])
+        return response
+
+class FakeCompletions:
+    def __init__(self):
+        self.calls = []
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        if kwargs.get("stream"):
+            return iter(
+                [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=reply[i:i + 10], refusal=None))], usage=None) for i in range(0, len(reply), 10)]
+                + [SimpleNamespace(choices=[], usage=SimpleNamespace(prompt_tokens=10, completion_tokens=20))]
+            )
+        message = SimpleNamespace(content=reply, refusal=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+def test_chat_completions_backend_single_request():
+    client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+    backend = ChatCompletionsBackend(client, "gpt-4o-mini", _speaker_instructions, _message_format)
+
+    messages = parse_messages(backend.generate("A paragraph"))
+    assert messages[0].sender_name == "Max"
+    call = client.chat.completions.calls[0]
+    assert call["response_format"] == {"type": "json_schema", "json_schema": _message_format}
+    assert call["messages"][-1] == {"role": "user", "content": "A paragraph"}
+
+def test_responses_backend_chains_context():
+    client = SimpleNamespace(responses=FakeResponses())
+    backend = ResponsesBackend(client, "gpt-4o-mini", _speaker_instructions, _message_format)
+
+    backend.generate("First paragraph")
+    backend.generate("Second paragraph")
+    first, second = client.responses.calls
+    assert first["previous_response_id"] is None
+    assert second["previous_response_id"] == "resp_1"
+    assert second["text"]["format"]["schema"] == _message_format["schema"]
+
+def test_chat_completions_backend_stream():
+    client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+    telemetry = Telemetry()
+    backend = ChatCompletionsBackend(client, "gpt-4o-mini", _speaker_instructions, _message_format, telemetry)
+
+    with telemetry.measure("messages"):
+        deltas = list(backend.stream("A paragraph"))
+    assert len(deltas) > 1
+    assert "".join(deltas) == reply
+    assert client.chat.completions.calls[0]["stream"] is True
+    assert telemetry.totals.completion_tokens == 20
+
+def test_responses_backend_stream_chains_context():
+    client = SimpleNamespace(responses=FakeResponses())
+    backend = ResponsesBackend(client, "gpt-4o-mini", _speaker_instructions, _message_format)
+
+    assert "".join(backend.stream("First paragraph")) == reply
+    backend.generate("Second paragraph")
+    assert client.responses.calls[1]["previous_response_id"] == "resp_1"
+
+def test_responses_backend_restarts_chain():
+    client = SimpleNamespace(responses=FakeResponses(), chat=SimpleNamespace(completions=FakeCompletions()))
+    threads = ThreadManager(client, "gpt-4o-mini", ThreadPolicy(max_paragraphs=2, summarize=True))
+    backend = ResponsesBackend(client, "gpt-4o-mini", _speaker_instructions, _message_format, threads=threads)
+
+    for i in range(5):
+        backend.generate(f"Paragraph {i}")
+    assert [call["previous_response_id"] for call in client.responses.calls] == [None, "resp_1", None, "resp_3", None]
+    assert client.responses.calls[0]["input"] == "Paragraph 0"
+    seeded = client.responses.calls[2]["input"]
+    assert seeded[0] == {"role": "user", "content": f"The story so far:\n{reply}"}
+    assert seeded[-1] == {"role": "user", "content": "Paragraph 2"}
+    assert threads.threads_started == 3
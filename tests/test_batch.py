@@ -0,0 +1,67 @@
+import json
+import os
+from kafka_speaker.batch import BatchRunner, chat_request, process_book_batch
+
+class FakeBatchRunner(BatchRunner):
+    """Answers every request locally, the way the Batch API output file would"""
+
+    def __init__(self, broken: dict | None = None):
+        self.batches = []
+        # custom_id -> message to answer with instead, e.g. a refusal or malformed JSON
+        self.broken = broken or {}
+
+    def run(self, requests):
+        self.batches.append(requests)
+        results = {}
+        for request in requests:
+            if request["custom_id"].startswith("paragraph-"):
+                content = json.dumps({"messages": [
+                    {"sender_name": "Max", "message_content": "Schon wieder 🙃", "files": [
+                        {"filename": "memo", "docext": ".docx", "description": "A memo"},
+                        {"filename": "notes", "docext": "txt", "description": "Some notes"},
+                    ]},
+                    {"sender_name": "Lina", "message_content": "😩", "files": []},
+                ]})
+            else:
+                content = "```markdown\n# " + request["custom_id"] + "\n```"
+            message = self.broken.get(request["custom_id"], {"role": "assistant", "content": content})
+            results[request["custom_id"]] = {"choices": [{"message": message}]}
+        return results
+
+def test_chat_request():
+    request = chat_request("paragraph-1", "gpt-4o-mini", "Be brief", "Hello", {"type": "json_schema"})
+    assert request["url"] == "/v1/chat/completions"
+    assert request["body"]["messages"][1] == {"role": "user", "content": "Hello"}
+    assert request["body"]["response_format"] == {"type": "json_schema"}
+
+def test_process_book_batch(tmp_path):
+    runner = FakeBatchRunner()
+    test_file = os.path.join(os.path.dirname(__file__), "data", "pg69327-kafka-der-prozess.txt")
+
+    output = process_book_batch(test_file, skip_past="*** START OF THE PROJECT GUTENBERG EBOOK", end_at="*** END OF THE PROJECT GUTENBERG EBOOK", output_dir=tmp_path, openai_client=None, model="gpt-4o-mini", file_limit=3, runner=runner)
+
+    # One batch of a paragraph per file in the budget, one for the attachments of the kept paragraphs
+    assert len(runner.batches) == 2
+    assert [r["custom_id"] for r in runner.batches[0]] == ["paragraph-1", "paragraph-2", "paragraph-3"]
+    assert [r["custom_id"] for r in runner.batches[1]] == ["attachment-1", "attachment-2", "attachment-3", "attachment-4"]
+
+    conversations = output["conversations"]
+    assert len(conversations) == 2
+    files = [f for c in conversations for m in c["messages"] for f in m["files"]]
+    assert [f["saved_name"] for f in files] == ["ATT0000001.md", "ATT0000002.txt", "ATT0000003.md", "ATT0000004.txt"]
+    assert (tmp_path / "attachments" / "ATT0000001.md").read_text(encoding="utf-8") == "# attachment-1\n"
+    assert (tmp_path / "conversations.json").exists()
+
+def test_process_book_batch_skips_unreadable_replies(tmp_path):
+    runner = FakeBatchRunner({
+        "paragraph-1": {"role": "assistant", "content": '{"messages": [{"sender_name": "Max"'},
+        "paragraph-2": {"role": "assistant", "content": None, "refusal": "No"},
+    })
+    test_file = os.path.join(os.path.dirname(__file__), "data", "pg69327-kafka-der-prozess.txt")
+
+    output = process_book_batch(test_file, skip_past="*** START OF THE PROJECT GUTENBERG EBOOK", end_at="*** END OF THE PROJECT GUTENBERG EBOOK", output_dir=tmp_path, openai_client=None, model="gpt-4o-mini", file_limit=3, runner=runner)
+
+    assert len(output["conversations"]) == 2
+    # Unreadable paragraphs leave files in the budget, so another paragraph is batched
+    assert [[r["custom_id"] for r in batch] for batch in runner.batches[:-1]] == [["paragraph-1", "paragraph-2", "paragraph-3"], ["paragraph-4"]]
+    assert [r["custom_id"] for r in runner.batches[-1]] == ["attachment-1", "attachment-2", "attachment-3", "attachment-4"]
@@ -0,0 +1,72 @@
+import os
+import pytest
+from kafka_speaker.ratelimit import RateLimiter
+from kafka_speaker.slack import upload_to_slack
+from kafka_speaker.speaker import File, KafkaSpeaker, process_book
+from tests.benchmark import run_benchmark, format_results
+from tests.fakes import FakeOpenAI, FakeSlackClient, PNG_BYTES
+
+test_file = os.path.join(os.path.dirname(__file__), "data", "pg69327-kafka-der-prozess.txt")
+
+def test_benchmark_reports_throughput(tmp_path):
+    result = run_benchmark("pg69327-kafka-der-prozess.txt", tmp_path, file_limit=10, max_workers=4)
+    assert result.paragraphs == 5
+    assert result.attachments == 10
+    assert result.messages_posted == 15
+    assert result.paragraphs_per_sec > 0 and result.attachments_per_sec > 0 and result.messages_per_sec > 0
+    assert "pg69327-kafka-der-prozess.txt" in format_results([result])
+
+def test_process_book_with_fake_openai(tmp_path):
+    client = FakeOpenAI()
+    speaker = KafkaSpeaker(client, http_session=client.http)
+    output = process_book(test_file, skip_past="*** START OF THE PROJECT GUTENBERG EBOOK", end_at="*** END OF THE PROJECT GUTENBERG EBOOK", output_dir=tmp_path, openai_client=client, model="gpt-4o-mini", file_limit=4, speaker=speaker)
+
+    files = [f for c in output["conversations"] for m in c["messages"] for f in m["files"]]
+    assert [f["saved_name"][:10] for f in files] == ["ATT0000001", "ATT0000002", "ATT0000003", "ATT0000004"]
+    pngs = [f for f in files if f["docext"] == "png"]
+    assert all(open(f["saved_path"], "rb").read() == PNG_BYTES for f in pngs)
+
+def test_process_book_skips_failed_attachments(tmp_path):
+    client = FakeOpenAI(error_rate=1.0, error_calls={"images.generate", "files.content"})
+    speaker = KafkaSpeaker(client, http_session=client.http)
+    output = process_book(test_file, skip_past="*** START OF THE PROJECT GUTENBERG EBOOK", end_at="*** END OF THE PROJECT GUTENBERG EBOOK", output_dir=tmp_path, openai_client=client, model="gpt-4o-mini", file_limit=4, speaker=speaker)
+
+    files = [f for c in output["conversations"] for m in c["messages"] for f in m["files"]]
+    assert len(files) == 4
+    assert all(f["saved_path"] is None for f in files)
+
+def test_upload_to_slack_with_fake_client():
+    client = FakeSlackClient(error_rate=0.5, error_calls={"chat_postMessage"})
+    upload_to_slack(os.path.join(os.path.dirname(__file__), "data", "short_output"), "C_TEST", "xoxb-fake", "C_FILES", client=client, rate_limiter=RateLimiter({}))
+
+    assert len(client.uploaded) == 3
+    # Failed posts are reported and skipped rather than aborting the upload
+    assert len(client.posted) < client.behaviour.calls["chat_postMessage"]
+
+def test_attachments_run_on_their_own_threads(tmp_path):
+    client = FakeOpenAI(files_per_paragraph=4)
+    speaker = KafkaSpeaker(client, http_session=client.http)
+    output = process_book(test_file, skip_past="*** START OF THE PROJECT GUTENBERG EBOOK", end_at="*** END OF THE PROJECT GUTENBERG EBOOK", output_dir=tmp_path, openai_client=client, model="gpt-4o-mini", file_limit=8, speaker=speaker)
+
+    files = [f for c in output["conversations"] for m in c["messages"] for f in m["files"]]
+    text_files = [f for f in files if f["docext"] != "png"]
+    assert text_files and all(f["saved_path"] for f in text_files)
+    # Only paragraphs went into the message thread, and every attachment thread and file was cleaned up
+    assert list(client._threads) == [speaker._get_message_thread.id]
+    assert not any(m.content[0].text.value.startswith("File:") for m in client._threads[speaker._get_message_thread.id])
+    assert client.behaviour.calls["threads.create_and_run"] == len(text_files)
+    assert client._files == {}
+
+def test_attachment_threads_and_files_are_cleaned_up_on_failure():
+    client = FakeOpenAI(error_rate=1.0, error_calls={"threads.runs.poll"})
+    speaker = KafkaSpeaker(client, http_session=client.http)
+    with pytest.raises(Exception):
+        speaker._generate_attachment(File(filename="memo", docext="md", description="A memo"))
+    assert client._threads == {}
+
+def test_extra_attachment_files_are_deleted():
+    client = FakeOpenAI(files_per_attachment=3)
+    speaker = KafkaSpeaker(client, http_session=client.http)
+    content = speaker.generate_attachment(File(filename="memo", docext="md", description="A memo"))
+    assert content.startswith(b"# Generated")
+    assert client._threads == {} and client._files == {}
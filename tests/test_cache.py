@@ -0,0 +1,64 @@
+import os
+import time
+from kafka_speaker.cache import GenerationCache, cache_key
+
+def test_cache_key_is_content_addressed():
+    assert cache_key("messages", "gpt-4o-mini", {"b": 1, "a": 2}) == cache_key("messages", "gpt-4o-mini", {"a": 2, "b": 1})
+    assert cache_key("messages", "gpt-4o-mini", "text") != cache_key("messages", "gpt-4o", "text")
+
+def test_cache_round_trip(tmp_path):
+    cache = GenerationCache(tmp_path)
+    key = cache_key("attachment", "x")
+    assert cache.get_bytes(key) is None
+    cache.put_bytes(key, b"\x89PNG")
+    assert cache.get_bytes(key) == b"\x89PNG"
+
+    cache.put_json("ab" + key[2:], [{"sender_name": "Max"}])
+    assert GenerationCache(tmp_path).get_json("ab" + key[2:]) == [{"sender_name": "Max"}]
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = GenerationCache(tmp_path, max_bytes=25)
+    keys = [cache_key(i) for i in range(3)]
+    for i, key in enumerate(keys[:2]):
+        cache.put_bytes(key, b"x" * 10)
+        # mtime resolution can be coarse, so age entries explicitly
+        os.utime(cache._path(key), (time.time() - 100 + i, time.time() - 100 + i))
+    cache.get_bytes(keys[0])
+
+    cache.put_bytes(keys[2], b"x" * 10)
+    assert cache.get_bytes(keys[0]) is not None
+    assert cache.get_bytes(keys[1]) is None
+    assert cache.get_bytes(keys[2]) is not None
+
+def test_cache_streams_entries(tmp_path):
+    cache = GenerationCache(tmp_path)
+    key = cache_key("attachment", "stream")
+    assert list(cache.put_stream(key, iter([b"ab", b"cd"]))) == [b"ab", b"cd"]
+    with cache.open(key) as f:
+        assert f.read() == b"abcd"
+
+    def failing():
+        yield b"ab"
+        raise OSError("connection reset")
+    other = cache_key("attachment", "failed")
+    try:
+        list(cache.put_stream(other, failing()))
+    except OSError:
+        pass
+    assert cache.open(other) is None
+    assert not list(tmp_path.glob("??/*.tmp"))
+
+def test_cache_evicts_to_low_water_mark(tmp_path):
+    cache = GenerationCache(tmp_path, max_bytes=100)
+    scans = []
+    entries = cache._entries
+    cache._entries = lambda: scans.append(1) or entries()
+    for i in range(11):
+        cache.put_bytes(cache_key(i), b"x" * 10)
+        os.utime(cache._path(cache_key(i)), (time.time() - 100 + i, time.time() - 100 + i))
+    # 110 bytes went over the limit once, and the two oldest entries were evicted to reach 90
+    assert len(scans) == 1
+    assert cache.get_bytes(cache_key(0)) is None and cache.get_bytes(cache_key(1)) is None
+    cache.put_bytes(cache_key(11), b"x" * 10)
+    assert len(scans) == 1
+    assert not list(tmp_path.glob("**/*.tmp"))
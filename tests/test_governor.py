@@ -0,0 +1,84 @@
+import os
+import pytest
+from kafka_speaker.governor import Budget, BudgetExceeded, Governor
+from kafka_speaker.speaker import KafkaSpeaker, process_book
+from kafka_speaker.telemetry import Telemetry
+from tests.fakes import FakeOpenAI
+
+BOOK = os.path.join(os.path.dirname(__file__), "data", "pg69327-kafka-der-prozess.txt")
+
+def _process(tmp_path, client, governor, file_limit=30):
+    speaker = KafkaSpeaker(client, "gpt-4o", http_session=client.http, governor=governor)
+    try:
+        return process_book(
+            BOOK, skip_past="*** START OF THE PROJECT GUTENBERG EBOOK", end_at="*** END OF THE PROJECT GUTENBERG EBOOK",
+            output_dir=tmp_path, openai_client=client, model="gpt-4o", file_limit=file_limit, speaker=speaker
+        )
+    finally:
+        speaker.close()
+
+def test_image_budget_is_hard():
+    governor = Governor(Budget(max_images=2))
+    governor.admit(images=1, image=("dall-e-3", "1024x1024"))
+    governor.admit(images=1, image=("dall-e-3", "1024x1024"))
+    with pytest.raises(BudgetExceeded):
+        governor.admit(images=1, image=("dall-e-3", "1024x1024"))
+    governor.admit()
+
+def test_dollar_budget_counts_images_up_front():
+    telemetry = Telemetry()
+    governor = Governor(Budget(max_dollars=0.06), telemetry)
+    with telemetry.measure("image"):
+        telemetry.add_images("dall-e-3", "1024x1024")
+    governor.admit()
+    with pytest.raises(BudgetExceeded):
+        governor.admit(images=1, image=("dall-e-3", "1024x1024"))
+    governor.admit(images=1, image=("dall-e-2", "256x256"))
+
+def test_degrades_past_threshold():
+    telemetry = Telemetry()
+    governor = Governor(Budget(max_tokens=1000, degrade_at=0.5, cheap_model="gpt-4o-mini"), telemetry)
+    assert governor.model("gpt-4o") == "gpt-4o"
+    assert governor.image() == ("dall-e-3", "1024x1024")
+    usage = type("Usage", (), {"prompt_tokens": 400, "completion_tokens": 200})()
+    with telemetry.measure("messages"):
+        telemetry.add_usage("gpt-4o", usage)
+    assert governor.degraded
+    assert governor.model("gpt-4o") == "gpt-4o-mini"
+    assert governor.image() == ("dall-e-2", "512x512")
+
+def test_requests_are_paced():
+    now = [0.0]
+    sleeps = []
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+    governor = Governor(Budget(requests_per_minute=30), clock=lambda: now[0], sleep=sleep)
+    for _ in range(3):
+        governor.admit()
+    assert sleeps == [2.0, 2.0]
+
+def test_process_book_stops_when_budget_spent(tmp_path):
+    client = FakeOpenAI(files_per_paragraph=4)
+    governor = Governor(Budget(max_tokens=3000))
+    output = _process(tmp_path, client, governor)
+
+    assert 0 < len(output["conversations"]) < 10
+    totals = governor.telemetry.totals
+    runs = client.behaviour.calls["threads.runs.create_and_poll"]
+    assert totals.prompt_tokens + totals.completion_tokens >= 3000
+    assert runs == len(output["conversations"])
+
+def test_process_book_degrades(tmp_path):
+    client = FakeOpenAI(files_per_paragraph=4)
+    governor = Governor(Budget(max_dollars=100, degrade_at=0, cheap_model="gpt-4o-mini"))
+    output = _process(tmp_path, client, governor)
+
+    options = client.request_options
+    assert {"threads.runs.create_and_poll", "images.generate"} <= {name for name, _ in options}
+    assert all(o.get("model") == "gpt-4o-mini" for name, o in options if name == "threads.runs.create_and_poll")
+    assert all((o["model"], o["size"]) == ("dall-e-2", "512x512") and "style" not in o for name, o in options if name == "images.generate")
+    # Documents are rendered locally instead of by the code_interpreter
+    assert "threads.create_and_run" not in client.behaviour.calls
+    files = [f for c in output["conversations"] for m in c["messages"] for f in m["files"]]
+    assert files and all(f["saved_path"] for f in files)
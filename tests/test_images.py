@@ -0,0 +1,56 @@
+import io
+import os
+import pytest
+from kafka_speaker.images import ImageOptions, ImageProcessor, process_image
+from kafka_speaker.speaker import KafkaSpeaker, process_book
+from tests.fakes import PNG_BYTES, FakeOpenAI
+
+def _png(size=(64, 48)) -> bytes:
+    Image = pytest.importorskip("PIL.Image")
+    image = Image.new("RGB", size, (200, 30, 30))
+    out = io.BytesIO()
+    image.save(out, format="PNG", pnginfo=None)
+    return out.getvalue()
+
+def test_keeps_original_when_unreadable():
+    processed = process_image(PNG_BYTES, ImageOptions(format="webp", thumbnail_size=16))
+    assert processed.docext == "png"
+    assert processed.content == PNG_BYTES
+    assert processed.thumbnail is None
+
+@pytest.mark.parametrize("format, docext, magic", [("webp", "webp", b"RIFF"), ("jpeg", "jpg", b"\xff\xd8")])
+def test_transcodes_and_thumbnails(format, docext, magic):
+    Image = pytest.importorskip("PIL.Image")
+    processed = process_image(_png(), ImageOptions(format=format, max_size=32, thumbnail_size=8))
+    assert processed.docext == docext
+    assert processed.content.startswith(magic)
+    with Image.open(io.BytesIO(processed.content)) as image:
+        assert max(image.size) == 32
+        assert not image.info.get("exif")
+    with Image.open(io.BytesIO(processed.thumbnail)) as thumbnail:
+        assert max(thumbnail.size) == 8
+
+def test_processor_process_pool():
+    processor = ImageProcessor(ImageOptions(format="jpeg"), max_workers=1)
+    try:
+        assert processor.process(PNG_BYTES).result() == process_image(PNG_BYTES, processor.options)
+    finally:
+        processor.close()
+
+def test_process_book_processes_images(tmp_path):
+    client = FakeOpenAI(files_per_paragraph=4)
+    speaker = KafkaSpeaker(client, http_session=client.http, image_options=ImageOptions(format="webp", thumbnail_size=16))
+    try:
+        output = process_book(
+            os.path.join(os.path.dirname(__file__), "data", "pg69327-kafka-der-prozess.txt"),
+            skip_past="*** START OF THE PROJECT GUTENBERG EBOOK", end_at="*** END OF THE PROJECT GUTENBERG EBOOK",
+            output_dir=tmp_path, openai_client=client, model="gpt-4o-mini", file_limit=30, speaker=speaker
+        )
+    finally:
+        speaker.close()
+
+    images = [f for c in output["conversations"] for m in c["messages"] for f in m["files"] if f["docext"] in ("png", "webp", "jpg")]
+    assert images and all(f["saved_path"] for f in images)
+    # The fake's PNGs aren't real images, so Pillow keeps them as they are too
+    assert all(f["docext"] == "png" and f["saved_name"].endswith(".png") for f in images)
+    assert not (tmp_path / "attachments" / "thumbnails").exists()
@@ -0,0 +1,61 @@
+import os
+from kafka_speaker.journal import ConversationJournal
+from kafka_speaker.speaker import Conversation, File, KafkaSpeaker, Message, process_book
+from tests.fakes import FakeOpenAI
+
+def test_journal_round_trip(tmp_path):
+    journal = ConversationJournal(tmp_path / "journal.jsonl")
+    journal.open()
+    files = [File(filename="a", docext="md", description="A"), File(filename="b", docext="png", description="B")]
+    journal.record_paragraph(1, 1, Conversation(messages=[Message("Max", "hi", files)]))
+    journal.record_paragraph(2, 3, Conversation(messages=[Message("Lina", "hey", [])]))
+    files[1].set_saved_location(tmp_path / "ATT0000002.png")
+    journal.record_attachment(2, files[1])
+    journal.close()
+
+    state = ConversationJournal(tmp_path / "journal.jsonl").load()
+    assert list(state.paragraphs) == [1, 2]
+    assert state.last_paragraph == 2
+    assert state.last_file_number == 2
+    assert state.attachments[2]["saved_name"] == "ATT0000002.png"
+
+def test_journal_ignores_truncated_line(tmp_path):
+    journal = ConversationJournal(tmp_path / "journal.jsonl")
+    journal.open()
+    journal.record_paragraph(1, 1, Conversation(messages=[Message("Max", "hi", [])]))
+    journal.close()
+    with open(tmp_path / "journal.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"type": "paragraph", "paragraph_nu')
+
+    state = journal.open(resume=True)
+    journal.close()
+    assert list(state.paragraphs) == [1]
+
+def test_journal_drops_attachments_of_unrecorded_paragraphs(tmp_path):
+    journal = ConversationJournal(tmp_path / "journal.jsonl")
+    journal.open()
+    file = File(filename="a", docext="md", description="A")
+    journal.record_paragraph(1, 1, Conversation(messages=[Message("Max", "hi", [file])]))
+    file.set_saved_location(tmp_path / "ATT0000001.md")
+    journal.record_attachment(1, file)
+    # Saved while paragraph 2 was streaming, which was never recorded
+    journal.record_attachment(2, file)
+    journal.close()
+
+    state = journal.open(resume=True)
+    journal.close()
+    assert list(state.attachments) == [1]
+    assert list(ConversationJournal(tmp_path / "journal.jsonl").load().attachments) == [1]
+    assert len((tmp_path / "journal.jsonl").read_text().splitlines()) == 2
+
+def test_resume_keeps_finished_run(tmp_path):
+    book = os.path.join(os.path.dirname(__file__), "data", "pg69327-kafka-der-prozess.txt")
+    markers = dict(skip_past="*** START OF THE PROJECT GUTENBERG EBOOK", end_at="*** END OF THE PROJECT GUTENBERG EBOOK")
+    client = FakeOpenAI()
+    first = process_book(book, **markers, output_dir=tmp_path, openai_client=client, model="gpt-4o-mini", file_limit=4,
+                         speaker=KafkaSpeaker(client, http_session=client.http))
+    client = FakeOpenAI()
+    again = process_book(book, **markers, output_dir=tmp_path, openai_client=client, model="gpt-4o-mini", file_limit=4,
+                         speaker=KafkaSpeaker(client, http_session=client.http), resume=True)
+    assert again == first
+    assert client.behaviour.calls == {}
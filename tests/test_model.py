@@ -0,0 +1,61 @@
+import json
+import pytest
+from kafka_speaker.model import Conversation, File, Message, MessageStream, ModelError, parse_messages
+
+response = json.dumps({"messages": [
+    {"sender_name": "Max", "message_content": "Hello", "files": [
+        {"filename": "report", "docext": ".pdf", "description": "A report"},
+    ]},
+    {"sender_name": "Lina", "message_content": "Hi", "files": []},
+]})
+
+def test_parse_messages():
+    messages = parse_messages(response)
+    assert messages == [
+        Message("Max", "Hello", [File("report", "pdf", "A report")]),
+        Message("Lina", "Hi", []),
+    ]
+    assert not hasattr(messages[0], "__dict__")
+
+@pytest.mark.parametrize("text", [
+    "not json",
+    json.dumps({"message": []}),
+    json.dumps({"messages": [{"sender_name": "Max", "message_content": "Hello"}]}),
+    json.dumps({"messages": [{"sender_name": 1, "message_content": "Hello", "files": []}]}),
+    json.dumps({"messages": [{"sender_name": "Max", "message_content": "Hello", "files": [{"filename": "a", "docext": "md"}]}]}),
+    json.dumps({"messages": [{"sender_name": "Max", "message_content": "Hello", "files": [], "extra": 1}]}),
+])
+def test_parse_messages_rejects_bad_responses(text):
+    with pytest.raises(ModelError):
+        parse_messages(text)
+
+def test_round_trip():
+    conversation = Conversation(parse_messages(response))
+    conversation.files[0].set_saved_location("attachments/ATT0000001.pdf")
+    data = conversation.to_dict()
+    assert data["messages"][0]["files"][0]["saved_name"] == "ATT0000001.pdf"
+    assert Conversation.from_dict(json.loads(json.dumps(data))) == conversation
+
+def test_message_stream_returns_messages_as_they_close():
+    stream = MessageStream()
+    returned = []
+    for i in range(0, len(response), 7):
+        returned.append(stream.feed(response[i:i + 7]))
+    assert [m.sender_name for batch in returned for m in batch] == ["Max", "Lina"]
+    # Max's message is returned before Lina's has started
+    first = next(i for i, batch in enumerate(returned) if batch)
+    assert sum(len(batch) for batch in returned[:first + 1]) == 1
+    assert first * 7 < response.index("Lina")
+    assert stream.finish() == []
+
+def test_message_stream_handles_braces_in_strings():
+    text = json.dumps({"messages": [{"sender_name": "Max", "message_content": 'a } "quoted" { b', "files": []}]})
+    stream = MessageStream()
+    messages = [m for c in text for m in stream.feed(c)]
+    assert messages == [Message("Max", 'a } "quoted" { b', [])]
+
+def test_message_stream_finish_validates():
+    stream = MessageStream()
+    stream.feed(response[:-1])
+    with pytest.raises(ModelError):
+        stream.finish()
@@ -31,3 +31,50 @@ def test_chunk_short_file_kafka():
         end_at='*** END OF THE PROJECT GUTENBERG EBOOK'
     ))
     assert len(paragraphs) == 1
+
+def test_chunk_concatenated_books(tmp_path):
+    data_dir = os.path.join(os.path.dirname(__file__), "data")
+    corpus = tmp_path / "corpus.txt"
+    with open(corpus, "w", encoding="utf-8") as out:
+        for name in ["pg69327-kafka-der-prozess.txt", "pg30570-kafka-grosser-larm.txt"]:
+            with open(os.path.join(data_dir, name), encoding="utf-8") as f:
+                out.write(f.read())
+
+    paragraphs = list(file_paragraphs(
+        str(corpus),
+        skip_past='*** START OF THE PROJECT GUTENBERG EBOOK',
+        end_at='*** END OF THE PROJECT GUTENBERG EBOOK'
+    ))
+    first_book = list(file_paragraphs(
+        os.path.join(data_dir, "pg69327-kafka-der-prozess.txt"),
+        skip_past='*** START OF THE PROJECT GUTENBERG EBOOK',
+        end_at='*** END OF THE PROJECT GUTENBERG EBOOK'
+    ))
+    assert paragraphs[:len(first_book)] == first_book
+    assert len(paragraphs) == len(first_book) + 1
+    assert [p.paragraph_number for p in paragraphs] == list(range(1, len(paragraphs) + 1))
+    assert paragraphs[-1].chapter_title != first_book[-1].chapter_title
+
+def test_chunk_missing_start_marker():
+    with pytest.raises(ValueError):
+        list(file_paragraphs(
+            os.path.join(os.path.dirname(__file__), "data", "pg30570-kafka-grosser-larm.txt"),
+            skip_past='*** NOT IN THIS FILE',
+            end_at='*** END OF THE PROJECT GUTENBERG EBOOK'
+        ))
+
+def test_paragraph_index_seek(tmp_path):
+    from kafka_speaker.paragraph import build_paragraph_index, load_paragraph_index, save_paragraph_index
+    book = os.path.join(os.path.dirname(__file__), "data", "pg69327-kafka-der-prozess.txt")
+    markers = dict(skip_past='*** START OF THE PROJECT GUTENBERG EBOOK', end_at='*** END OF THE PROJECT GUTENBERG EBOOK')
+    paragraphs = list(file_paragraphs(book, **markers))
+    index = build_paragraph_index(book, **markers)
+    assert [entry.paragraph_number for entry in index] == [p.paragraph_number for p in paragraphs]
+
+    save_paragraph_index(tmp_path / "index.json", index, size=1)
+    assert load_paragraph_index(tmp_path / "index.json", size=2) is None
+    index = load_paragraph_index(tmp_path / "index.json", size=1)
+
+    middle = len(paragraphs) // 2
+    seeked = list(file_paragraphs(book, **markers, start=index[middle], stop_after=index[middle + 2].paragraph_number))
+    assert seeked == paragraphs[middle:middle + 3]
@@ -0,0 +1,64 @@
+import json
+import os
+import threading
+import pytest
+from kafka_speaker.pipeline import prefetch
+from kafka_speaker.speaker import KafkaSpeaker, process_book
+from tests.fakes import FakeOpenAI
+
+BOOK = os.path.join(os.path.dirname(__file__), "data", "pg69327-kafka-der-prozess.txt")
+
+def test_prefetch_keeps_order():
+    assert list(prefetch(range(20), lambda n: n * n, 3)) == [(n, n * n) for n in range(20)]
+    assert list(prefetch(range(5), lambda n: -n, 0)) == [(n, -n) for n in range(5)]
+
+def test_prefetch_runs_ahead_up_to_depth():
+    called = []
+    ready = threading.Event()
+    def fn(n):
+        called.append(n)
+        if n == 3:
+            ready.set()
+        return n
+    results = prefetch(range(10), fn, 2)
+    assert next(results) == (0, 0)
+    ready.wait(1)
+    # 1 and 2 are queued and 3 is waiting to be put, nothing further has started
+    assert called == [0, 1, 2, 3]
+    results.close()
+    assert called == [0, 1, 2, 3]
+
+def test_prefetch_raises_in_place():
+    def fn(n):
+        if n == 2:
+            raise ValueError("two")
+        return n
+    results = prefetch(range(5), fn, 2)
+    assert next(results) == (0, 0)
+    assert next(results) == (1, 1)
+    with pytest.raises(ValueError):
+        next(results)
+
+def _process(tmp_path, client, lookahead):
+    speaker = KafkaSpeaker(client, "gpt-4o-mini", http_session=client.http)
+    try:
+        return process_book(
+            BOOK, skip_past="*** START OF THE PROJECT GUTENBERG EBOOK", end_at="*** END OF THE PROJECT GUTENBERG EBOOK",
+            output_dir=tmp_path, openai_client=client, model="gpt-4o-mini", file_limit=8, speaker=speaker, lookahead=lookahead
+        )
+    finally:
+        speaker.close()
+
+def test_lookahead_matches_serial_output(tmp_path):
+    serial_client, ahead_client = FakeOpenAI(latency=0.005), FakeOpenAI(latency=0.005)
+    serial = _process(tmp_path / "serial", serial_client, lookahead=0)
+    ahead = _process(tmp_path / "ahead", ahead_client, lookahead=2)
+    assert json.dumps(ahead).replace(str(tmp_path / "ahead"), str(tmp_path / "serial")) == json.dumps(serial)
+
+@pytest.mark.parametrize("lookahead", [1, 3])
+def test_lookahead_generates_no_more_than_serial(tmp_path, lookahead):
+    serial_client, ahead_client = FakeOpenAI(latency=0.005), FakeOpenAI(latency=0.005)
+    serial = _process(tmp_path / "serial", serial_client, lookahead=0)
+    _process(tmp_path / "ahead", ahead_client, lookahead=lookahead)
+    runs = ahead_client.behaviour.calls["threads.runs.create_and_poll"]
+    assert runs == serial_client.behaviour.calls["threads.runs.create_and_poll"] == len(serial["conversations"])
@@ -0,0 +1,34 @@
+from kafka_speaker.ratelimit import RateLimiter, TokenBucket
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+def test_token_bucket_allows_burst_then_paces():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=1.0, capacity=3, clock=clock, sleep=clock.sleep)
+    waits = [bucket.acquire() for _ in range(5)]
+    assert waits[:3] == [0, 0, 0]
+    assert waits[3:] == [1.0, 1.0]
+    assert clock.now == 2.0
+
+def test_token_bucket_pause_holds_callers():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=10.0, capacity=10, clock=clock, sleep=clock.sleep)
+    bucket.pause(5)
+    assert bucket.acquire() == 5
+    assert clock.now == 5
+
+def test_rate_limiter_buckets_per_key():
+    clock = FakeClock()
+    limiter = RateLimiter({"chat_postMessage": (1.0, 1)}, clock=clock, sleep=clock.sleep)
+    assert limiter.acquire("chat_postMessage", "C1") == 0
+    assert limiter.acquire("chat_postMessage", "C2") == 0
+    assert limiter.acquire("chat_postMessage", "C1") == 1.0
+    assert limiter.acquire("files_upload_v2") == 0
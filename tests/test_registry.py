@@ -0,0 +1,65 @@
+from kafka_speaker.registry import AssistantRegistry
+from kafka_speaker.speaker import KafkaSpeaker, _message_assistant_params
+from tests.fakes import FakeOpenAI
+
+params = _message_assistant_params("gpt-4o-mini")
+
+def test_registry_skips_listing(tmp_path):
+    client = FakeOpenAI()
+    assistant = AssistantRegistry(tmp_path / "assistants.json").setup(client, "Speaker", "Speaks", params)
+    assert client.behaviour.calls == {"assistants.list": 1, "assistants.create": 1}
+
+    again = AssistantRegistry(tmp_path / "assistants.json").setup(client, "Speaker", "Speaks", params)
+    assert again.id == assistant.id
+    assert client.behaviour.calls == {"assistants.list": 1, "assistants.create": 1, "assistants.retrieve": 1}
+
+def test_registry_updates_when_params_change(tmp_path):
+    client = FakeOpenAI()
+    registry = AssistantRegistry(tmp_path / "assistants.json")
+    assistant = registry.setup(client, "Speaker", "Speaks", params)
+    updated = registry.setup(client, "Speaker", "Speaks", _message_assistant_params("gpt-4o"))
+    assert updated.id == assistant.id
+    assert client.behaviour.calls["assistants.update"] == 1
+    assert client._assistants[assistant.id].model == "gpt-4o"
+
+def test_registry_pages_through_assistants():
+    client = FakeOpenAI()
+    original = AssistantRegistry(None).setup(client, "Speaker", "Speaks", params)
+    for i in range(150):
+        client.beta.assistants.create(name=f"Other {i}")
+
+    # A fresh registry has to find it by listing, and its metadata says it's up to date
+    assistant = AssistantRegistry(None).setup(client, "Speaker", "Speaks", params)
+    assert assistant.id == original.id
+    assert client.behaviour.calls["assistants.list"] == 3
+    assert client.behaviour.calls["assistants.create"] == 151
+    assert "assistants.update" not in client.behaviour.calls
+
+def test_warm_sets_up_concurrently():
+    client = FakeOpenAI()
+    speaker = KafkaSpeaker(client)
+    speaker.warm()
+    assert client.behaviour.calls["assistants.create"] == 2
+    assert client.behaviour.calls["threads.create"] == 1
+    assert speaker.fork()._attachment_assistant is speaker._attachment_assistant
+
+def test_registry_checks_the_assistant_itself(tmp_path):
+    client = FakeOpenAI()
+    assistant = AssistantRegistry(tmp_path / "assistants.json").setup(client, "Speaker", "Speaks", params)
+
+    # Another machine, with its own registry, sets the assistant up differently
+    AssistantRegistry(None).setup(client, "Speaker", "Speaks", _message_assistant_params("gpt-4o"))
+    again = AssistantRegistry(tmp_path / "assistants.json").setup(client, "Speaker", "Speaks", params)
+    assert again.id == assistant.id
+    assert client.behaviour.calls["assistants.update"] == 2
+    assert client._assistants[assistant.id].model == "gpt-4o-mini"
+
+def test_registry_recreates_deleted_assistant(tmp_path):
+    client = FakeOpenAI()
+    assistant = AssistantRegistry(tmp_path / "assistants.json").setup(client, "Speaker", "Speaks", params)
+    del client._assistants[assistant.id]
+
+    again = AssistantRegistry(tmp_path / "assistants.json").setup(client, "Speaker", "Speaks", params)
+    assert again.id != assistant.id
+    assert client.behaviour.calls["assistants.create"] == 2
+    assert AssistantRegistry(tmp_path / "assistants.json").registered_id(client, "Speaker") == again.id
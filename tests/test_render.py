@@ -0,0 +1,66 @@
+import json
+import os
+import pytest
+from kafka_speaker.render import DocumentRenderer, parse_document, render_document
+from kafka_speaker.speaker import KafkaSpeaker, _attachment_assistant_name, process_book
+from tests.fakes import FakeOpenAI
+
+document = parse_document(json.dumps({"title": "Form 27-B", "sections": [
+    {"heading": "Instructions", "paragraphs": ["Fill in every field."], "bullets": ["In triplicate"], "table": {"columns": [], "rows": []}},
+    {"heading": "Queue", "paragraphs": [], "bullets": [], "table": {"columns": ["Name", "Days waiting"], "rows": [["K.", "365"]]}},
+]}))
+
+def test_render_markdown():
+    docext, content = render_document(document, ".md")
+    assert docext == "md"
+    text = content.decode("utf-8")
+    assert text.startswith("# Form 27-B")
+    assert "- In triplicate" in text
+    assert "| K. | 365 |" in text
+
+def test_render_csv_uses_first_table():
+    assert render_document(document, "csv") == ("csv", b"Name,Days waiting\r\nK.,365\r\n")
+
+@pytest.mark.parametrize("docext, module", [("docx", "docx"), ("pptx", "pptx"), ("xlsx", "openpyxl"), ("pdf", "reportlab")])
+def test_render_office_formats(docext, module):
+    installed = True
+    try:
+        __import__(module)
+    except ImportError:
+        installed = False
+    rendered, content = render_document(document, docext)
+    if installed:
+        assert rendered == docext
+        assert content.startswith(b"%PDF" if docext == "pdf" else b"PK")
+    else:
+        assert rendered == "md"
+
+def test_render_unknown_format_as_markdown():
+    assert render_document(document, "zip")[0] == "md"
+
+def test_parse_document_rejects_bad_content():
+    with pytest.raises(ValueError):
+        parse_document(json.dumps({"title": "No sections"}))
+
+def test_renderer_process_pool():
+    renderer = DocumentRenderer(max_workers=1)
+    try:
+        assert renderer.render(document, "md").result() == render_document(document, "md")
+    finally:
+        renderer.close()
+
+def test_process_book_renders_attachments_locally(tmp_path):
+    client = FakeOpenAI(files_per_paragraph=4)
+    speaker = KafkaSpeaker(client, http_session=client.http, attachments="local", renderer=DocumentRenderer(max_workers=2))
+    output = process_book(
+        os.path.join(os.path.dirname(__file__), "data", "pg69327-kafka-der-prozess.txt"),
+        skip_past="*** START OF THE PROJECT GUTENBERG EBOOK", end_at="*** END OF THE PROJECT GUTENBERG EBOOK",
+        output_dir=tmp_path, openai_client=client, model="gpt-4o-mini", file_limit=8, speaker=speaker
+    )
+    speaker._renderer.close()
+
+    files = [f for c in output["conversations"] for m in c["messages"] for f in m["files"] if f["docext"] != "png"]
+    assert files and all(f["saved_path"] for f in files)
+    assert all(f["saved_name"].endswith("." + f["docext"]) for f in files)
+    assert "threads.create_and_run" not in client.behaviour.calls
+    assert all(a.name != _attachment_assistant_name for a in client._assistants.values())
@@ -0,0 +1,76 @@
+import os
+import threading
+import time
+from pathlib import Path
+from kafka_speaker import scheduler, speaker
+from kafka_speaker.scheduler import book_output_names, book_paths, process_books
+from kafka_speaker.speaker import KafkaSpeaker, process_book
+from tests.fakes import FakeOpenAI
+
+data_dir = os.path.join(os.path.dirname(__file__), "data")
+
+def test_book_paths_glob():
+    books = book_paths(os.path.join(data_dir, "pg*.txt"))
+    assert [b.name for b in books] == ["pg30570-kafka-grosser-larm.txt", "pg69327-kafka-der-prozess.txt"]
+
+def test_book_paths_directory():
+    assert book_paths(data_dir) == book_paths(os.path.join(data_dir, "*.txt"))
+
+def test_book_paths_single_file():
+    book = os.path.join(data_dir, "pg30570-kafka-grosser-larm.txt")
+    assert book_paths(book) == [Path(book)]
+
+def test_book_output_names_disambiguate_stems(tmp_path):
+    paths = [tmp_path / "a" / "book.txt", tmp_path / "b" / "book.txt", tmp_path / "b" / "book.md", tmp_path / "other.txt"]
+    assert list(book_output_names(paths).values()) == ["a-book", "b-book-txt", "b-book-md", "other"]
+
+def test_process_books_share_budget(tmp_path, monkeypatch):
+    books = []
+    for i, book in enumerate(book_paths(os.path.join(data_dir, "pg*.txt")) * 2):
+        books.append(tmp_path / "books" / f"{i}-{book.name}")
+        books[-1].parent.mkdir(exist_ok=True)
+        books[-1].write_bytes(book.read_bytes())
+
+    lock = threading.Lock()
+    running = []
+    peak = []
+    def counting_process_book(**kwargs):
+        with lock:
+            running.append(kwargs["output_dir"])
+            peak.append(len(running))
+        try:
+            time.sleep(0.05)
+            return process_book(**kwargs)
+        finally:
+            with lock:
+                running.remove(kwargs["output_dir"])
+    monkeypatch.setattr(scheduler, "process_book", counting_process_book)
+
+    closed = []
+    close = KafkaSpeaker.close
+    def recording_close(self):
+        closed.append(self)
+        close(self)
+    monkeypatch.setattr(KafkaSpeaker, "close", recording_close)
+
+    client = FakeOpenAI(files_per_paragraph=2)
+    monkeypatch.setattr(speaker.requests, "Session", lambda: client.http)
+    results = process_books(
+        books, skip_past='*** START OF THE PROJECT GUTENBERG EBOOK', end_at='*** END OF THE PROJECT GUTENBERG EBOOK',
+        output_dir=tmp_path / "out", openai_client=client, model="gpt-4o-mini", file_limit=10, max_books=2
+    )
+
+    names = book_output_names(books)
+    assert sorted(results) == sorted(names.values())
+    assert max(peak) == 2
+    # One fork per book, and the base speaker
+    assert len(closed) == len(books) + 1
+    files = []
+    for name, result in results.items():
+        assert (tmp_path / "out" / name / "conversations.json").exists()
+        for c in result["conversations"]:
+            for m in c["messages"]:
+                for f in m["files"]:
+                    assert Path(f["saved_path"]).is_relative_to(tmp_path / "out" / name)
+                    files.append(f)
+    assert len(files) == 10
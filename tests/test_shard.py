@@ -0,0 +1,95 @@
+import json
+import os
+import pytest
+from kafka_speaker.paragraph import file_paragraphs
+from kafka_speaker.shard import SHARD_NAME, merge_shards, paragraph_index, process_shard, shard_range
+from kafka_speaker.speaker import KafkaSpeaker, process_book
+from tests.fakes import FakeOpenAI
+
+book = os.path.join(os.path.dirname(__file__), "data", "pg69327-kafka-der-prozess.txt")
+markers = dict(skip_past='*** START OF THE PROJECT GUTENBERG EBOOK', end_at='*** END OF THE PROJECT GUTENBERG EBOOK')
+
+@pytest.mark.parametrize("by_chapter", [False, True])
+def test_shards_cover_book(by_chapter):
+    index = paragraph_index(book, **markers)
+    shards = [shard_range(index, i, 4, by_chapter) for i in range(4)]
+    assert [entry for shard in shards for entry in shard] == index
+    if by_chapter:
+        for shard in shards[1:]:
+            assert not shard or shard[0].chapter_title != index[index.index(shard[0]) - 1].chapter_title
+
+def test_shard_index_out_of_range():
+    with pytest.raises(ValueError):
+        shard_range([], 2, 2)
+
+def test_merge_matches_serial_run(tmp_path):
+    index_path = tmp_path / "index.json"
+    shard_dirs = []
+    for i in range(3):
+        client = FakeOpenAI()
+        shard_dirs.append(tmp_path / f"shard{i}")
+        process_shard(
+            book, **markers, output_dir=shard_dirs[-1], openai_client=client, model="gpt-4o-mini",
+            file_limit=1000, shard_index=i, shard_count=3, index_path=index_path,
+            speaker=KafkaSpeaker(client, http_session=client.http)
+        )
+    assert index_path.exists()
+    merged = merge_shards(reversed(shard_dirs), tmp_path / "merged")
+
+    client = FakeOpenAI()
+    serial = process_book(
+        book, **markers, output_dir=tmp_path / "serial", openai_client=client, model="gpt-4o-mini",
+        file_limit=1000, speaker=KafkaSpeaker(client, http_session=client.http)
+    )
+    assert len(merged["conversations"]) == len(list(file_paragraphs(book, **markers)))
+    merged_files = [f for c in merged["conversations"] for m in c["messages"] for f in m["files"]]
+    serial_files = [f for c in serial["conversations"] for m in c["messages"] for f in m["files"]]
+    assert [f["saved_name"] for f in merged_files] == [f["saved_name"] for f in serial_files]
+    for f in merged_files:
+        assert os.path.exists(f["saved_path"])
+    with open(tmp_path / "merged" / "conversations.json", encoding="utf-8") as f:
+        assert json.load(f) == merged
+
+def test_merge_requires_every_shard(tmp_path):
+    client = FakeOpenAI(files_per_paragraph=0)
+    process_shard(book, **markers, output_dir=tmp_path / "shard0", openai_client=client, model="gpt-4o-mini",
+                  file_limit=10, shard_index=0, shard_count=2, speaker=KafkaSpeaker(client))
+    with pytest.raises(ValueError):
+        merge_shards([tmp_path / "shard0"], tmp_path / "merged")
+
+def test_index_rebuilt_when_book_changes(tmp_path):
+    copy = tmp_path / "book.txt"
+    copy.write_bytes(open(book, "rb").read())
+    index_path = tmp_path / "index.json"
+    index = paragraph_index(str(copy), **markers, index_path=index_path)
+    assert paragraph_index(str(copy), **markers, index_path=index_path) == index
+
+    # Same size, different text and modification time
+    text = copy.read_text(encoding="utf-8")
+    copy.write_text(text.replace("Josef K.", "Josef X.", 1), encoding="utf-8")
+    os.utime(copy, ns=(os.stat(copy).st_atime_ns, os.stat(copy).st_mtime_ns + 10**9))
+    assert os.path.getsize(copy) == len(text.encode("utf-8"))
+    with open(index_path, encoding="utf-8") as f:
+        saved_mtime = json.load(f)["params"]["mtime_ns"]
+    paragraph_index(str(copy), **markers, index_path=index_path)
+    with open(index_path, encoding="utf-8") as f:
+        assert json.load(f)["params"]["mtime_ns"] != saved_mtime
+
+def test_merge_carries_thumbnails(tmp_path):
+    for i in range(2):
+        shard_dir = tmp_path / f"shard{i}"
+        (shard_dir / "attachments" / "thumbnails").mkdir(parents=True)
+        (shard_dir / "attachments" / "ATT0000001.webp").write_bytes(b"image %d" % i)
+        (shard_dir / "attachments" / "thumbnails" / "ATT0000001.webp").write_bytes(b"thumbnail %d" % i)
+        with open(shard_dir / SHARD_NAME, "w", encoding="utf-8") as f:
+            json.dump({"shard_index": i, "shard_count": 2}, f)
+        file = {"filename": "photo", "docext": "webp", "description": "A photo", "saved_name": "ATT0000001.webp",
+                "saved_path": str(shard_dir / "attachments" / "ATT0000001.webp")}
+        with open(shard_dir / "conversations.json", "w", encoding="utf-8") as f:
+            json.dump({"conversations": [{"messages": [{"sender_name": "Max", "message_content": "hi", "files": [file]}]}]}, f)
+
+    merge_shards([tmp_path / "shard0", tmp_path / "shard1"], tmp_path / "merged")
+    thumbnails = tmp_path / "merged" / "attachments" / "thumbnails"
+    assert (thumbnails / "ATT0000001.webp").read_bytes() == b"thumbnail 0"
+    assert (thumbnails / "ATT0000002.webp").read_bytes() == b"thumbnail 1"
+    assert (tmp_path / "merged" / "attachments" / "ATT0000002.webp").read_bytes() == b"image 1"
@@ -3,9 +3,16 @@ import pytest
 from pathlib import Path
 import json
 from environs import Env
-from kafka_speaker.slack import SlackUploader, upload_to_slack
+from kafka_speaker.slack import SlackUploader, read_conversations, upload_to_slack
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
+from kafka_speaker.model import Conversation
+from kafka_speaker.ratelimit import RateLimiter
+from kafka_speaker.speaker import _write_conversations
+from tests.fakes import FakeSlackClient
+
+def write_conversations(output_dir, conversations):
+    _write_conversations(output_dir, [Conversation.from_dict(c) for c in conversations])
 
 @pytest.fixture
 def env():
@@ -62,3 +69,98 @@ def test_upload_to_slack_function(slack_token, slack_channel, slack_file_channel
         thread_messages=False
     )
     # If no exception is raised, consider it a success
+
+def test_upload_conversation_links_uploaded_files(test_data_dir, sample_conversation_data):
+    client = FakeSlackClient(latency=0.01)
+    uploader = SlackUploader("xoxb-fake", client=client, rate_limiter=RateLimiter({}))
+
+    uploader.upload_conversation(sample_conversation_data, "C_TEST", "C_FILES", Path(test_data_dir))
+
+    assert {u["channel"] for u in client.uploaded} == {"C_FILES"}
+    permalinks = {f"https://slack.example/files/{u['id']}" for u in client.uploaded}
+    linked = {
+        block["text"]["text"].split("|")[0][1:]
+        for message in client.posted
+        for block in message["blocks"][2:]
+    }
+    assert linked == permalinks
+
+def test_upload_conversation_keeps_thread_order(test_data_dir, sample_conversation_data):
+    client = FakeSlackClient(latency=0.005)
+    conversation_data = {"conversations": sample_conversation_data["conversations"] * 4}
+    uploader = SlackUploader("xoxb-fake", client=client, rate_limiter=RateLimiter({}), max_conversations=4)
+
+    uploader.upload_conversation(conversation_data, "C_TEST", "C_FILES", Path(test_data_dir))
+
+    sent = [m["message_content"] for m in sample_conversation_data["conversations"][0]["messages"]]
+    roots = [m for m in client.posted if "thread_ts" not in m]
+    assert len(roots) == 4
+    for root in roots:
+        replies = [m["blocks"][0]["text"]["text"] for m in client.posted if m.get("thread_ts") == root["ts"]]
+        assert [root["blocks"][0]["text"]["text"], *replies] == sent
+
+def test_threaded_conversations_start_in_order(test_data_dir, sample_conversation_data):
+    client = FakeSlackClient(latency=0.005)
+    conversations = []
+    for i in range(8):
+        conversation = json.loads(json.dumps(sample_conversation_data["conversations"][0]))
+        conversation["messages"][0]["message_content"] = f"Conversation {i}"
+        conversations.append(conversation)
+    uploader = SlackUploader("xoxb-fake", client=client, rate_limiter=RateLimiter({}), max_conversations=4)
+
+    uploader.upload_conversation({"conversations": conversations}, "C_TEST", "C_FILES", Path(test_data_dir))
+
+    roots = [m["blocks"][0]["text"]["text"] for m in client.posted if "thread_ts" not in m]
+    assert roots == [f"Conversation {i}" for i in range(8)]
+    assert len(client.posted) == sum(len(c["messages"]) for c in conversations)
+
+def test_rate_limited_calls_are_retried():
+    sleeps = []
+    client = FakeSlackClient(rate_limited=2, retry_after=3)
+    uploader = SlackUploader("xoxb-fake", client=client, rate_limiter=RateLimiter({}, sleep=sleeps.append))
+
+    response = uploader._call("chat_postMessage", "C_TEST", channel="C_TEST", blocks=[])
+    assert response["ok"]
+    assert sleeps == [3, 3]
+
+def test_read_conversations_jsonl(tmp_path, sample_conversation_data):
+    conversations = sample_conversation_data["conversations"] * 3
+    write_conversations(tmp_path, conversations)
+    # Only the jsonl was copied
+    os.remove(tmp_path / "conversations.json")
+
+    reader = read_conversations(tmp_path)
+    assert next(reader).to_dict() == conversations[0]
+    assert [c.to_dict() for c in reader] == conversations[1:]
+
+def test_read_conversations_falls_back_to_json(test_data_dir, sample_conversation_data):
+    assert [c.to_dict() for c in read_conversations(test_data_dir)] == sample_conversation_data["conversations"]
+
+def test_read_conversations_skips_stale_jsonl(tmp_path, sample_conversation_data):
+    write_conversations(tmp_path, sample_conversation_data["conversations"])
+    conversations = sample_conversation_data["conversations"] * 2
+    with open(tmp_path / "conversations.json", "w", encoding="utf-8") as f:
+        json.dump({"conversations": conversations}, f)
+    # Whatever the file times say, e.g. on a filesystem with coarse times or after a copy
+    os.utime(tmp_path / "conversations.json", (1, 1))
+
+    assert [c.to_dict() for c in read_conversations(tmp_path)] == conversations
+
+def test_read_conversations_skips_unfinished_jsonl(tmp_path, sample_conversation_data):
+    conversations = sample_conversation_data["conversations"] * 50
+    write_conversations(tmp_path, conversations)
+    lines = (tmp_path / "conversations.jsonl").read_text(encoding="utf-8").splitlines(keepends=True)
+    (tmp_path / "conversations.jsonl").write_text("".join(lines[:-2]), encoding="utf-8")
+
+    assert [c.to_dict() for c in read_conversations(tmp_path)] == conversations
+
+def test_upload_to_slack_streams_in_order(tmp_path, test_data_dir, sample_conversation_data):
+    conversations = sample_conversation_data["conversations"] * 3
+    write_conversations(tmp_path, conversations)
+    os.remove(tmp_path / "conversations.json")
+    client = FakeSlackClient()
+
+    upload_to_slack(tmp_path, "C_TEST", "xoxb-fake", "C_FILES", thread_messages=False, client=client, rate_limiter=RateLimiter({}))
+
+    sent = [m["message_content"] for c in conversations for m in c["messages"]]
+    assert [m["blocks"][0]["text"]["text"] for m in client.posted] == sent
@@ -70,7 +70,6 @@ def test_kafka_speaker_send_paragraph(openai_client):
 def test_kafka_attachment_assistant(openai_client, output_path):
     speaker = KafkaSpeaker(openai_client)
     assert speaker._get_attachment_assistant is not None
-    assert speaker._get_attachment_thread is not None
 
     attachment = File(filename="jump_analysis.txt",
                             docext=".txt",
@@ -95,7 +94,6 @@ def test_kafka_attachment_assistant(openai_client, output_path):
 def test_kafka_png_attachment(openai_client, output_path):
     speaker = KafkaSpeaker(openai_client)
     assert speaker._get_attachment_assistant is not None
-    assert speaker._get_attachment_thread is not None
 
     attachment = File(filename="scene_visualization.png",
                      docext=".png",
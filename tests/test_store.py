@@ -0,0 +1,57 @@
+import hashlib
+import os
+import pytest
+from kafka_speaker.speaker import KafkaSpeaker, process_book
+from kafka_speaker.store import AttachmentStore
+from tests.fakes import PNG_BYTES, FakeOpenAI
+
+def test_store_hashes_and_links_duplicates(tmp_path):
+    store = AttachmentStore()
+    digest = store.write(tmp_path / "ATT0000001.md", [b"# Form ", b"27-B\n"])
+    assert digest == hashlib.sha256(b"# Form 27-B\n").hexdigest()
+    assert store.write(tmp_path / "ATT0000002.md", [b"# Form 27-B\n"]) == digest
+    store.write(tmp_path / "ATT0000003.md", [b"# Form 27-C\n"])
+
+    assert (tmp_path / "ATT0000002.md").read_bytes() == b"# Form 27-B\n"
+    assert os.path.samefile(tmp_path / "ATT0000001.md", tmp_path / "ATT0000002.md")
+    assert not os.path.samefile(tmp_path / "ATT0000001.md", tmp_path / "ATT0000003.md")
+    assert (store.linked, store.linked_bytes) == (1, 12)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["ATT0000001.md", "ATT0000002.md", "ATT0000003.md"]
+
+def test_store_leaves_nothing_behind_on_failure(tmp_path):
+    def failing():
+        yield b"partial"
+        raise OSError("connection reset")
+    with pytest.raises(OSError):
+        AttachmentStore().write(tmp_path / "ATT0000001.pdf", failing())
+    assert not list(tmp_path.iterdir())
+
+def test_process_book_streams_and_links_images(tmp_path):
+    client = FakeOpenAI(files_per_paragraph=4)
+    speaker = KafkaSpeaker(client, http_session=client.http)
+    output = process_book(
+        os.path.join(os.path.dirname(__file__), "data", "pg69327-kafka-der-prozess.txt"),
+        skip_past="*** START OF THE PROJECT GUTENBERG EBOOK", end_at="*** END OF THE PROJECT GUTENBERG EBOOK",
+        output_dir=tmp_path, openai_client=client, model="gpt-4o-mini", file_limit=30, speaker=speaker
+    )
+
+    # The fake returns the same bytes for every image, so all but the first are links
+    images = [tmp_path / "attachments" / f["saved_name"] for c in output["conversations"] for m in c["messages"] for f in m["files"] if f["docext"] == "png"]
+    assert len(images) > 1
+    assert all(path.read_bytes() == PNG_BYTES for path in images)
+    assert all(os.path.samefile(images[0], path) for path in images[1:])
+    assert not list((tmp_path / "attachments").glob("*.tmp"))
+
+def test_failed_download_is_not_saved(tmp_path):
+    client = FakeOpenAI(files_per_paragraph=4, error_rate=1.0, error_calls={"files.content"})
+    speaker = KafkaSpeaker(client, http_session=client.http)
+    output = process_book(
+        os.path.join(os.path.dirname(__file__), "data", "pg69327-kafka-der-prozess.txt"),
+        skip_past="*** START OF THE PROJECT GUTENBERG EBOOK", end_at="*** END OF THE PROJECT GUTENBERG EBOOK",
+        output_dir=tmp_path, openai_client=client, model="gpt-4o-mini", file_limit=8, speaker=speaker
+    )
+
+    documents = [f for c in output["conversations"] for m in c["messages"] for f in m["files"] if f["docext"] != "png"]
+    assert documents and not any(f["saved_path"] for f in documents)
+    assert "files.delete" in client.behaviour.calls
+    assert not list((tmp_path / "attachments").glob("*.tmp"))
@@ -0,0 +1,44 @@
+import json
+import os
+from kafka_speaker.speaker import KafkaSpeaker, process_book
+from tests.fakes import FakeOpenAI
+
+BOOK = os.path.join(os.path.dirname(__file__), "data", "pg69327-kafka-der-prozess.txt")
+
+def _process(tmp_path, client, stream, backend="assistants"):
+    speaker = KafkaSpeaker(client, "gpt-4o-mini", backend=backend, http_session=client.http)
+    try:
+        return process_book(
+            BOOK, skip_past="*** START OF THE PROJECT GUTENBERG EBOOK", end_at="*** END OF THE PROJECT GUTENBERG EBOOK",
+            output_dir=tmp_path, openai_client=client, model="gpt-4o-mini", file_limit=8, speaker=speaker, stream=stream
+        )
+    finally:
+        speaker.close()
+
+def test_stream_matches_unstreamed_output(tmp_path):
+    plain = _process(tmp_path / "plain", FakeOpenAI(), stream=False)
+    streamed = _process(tmp_path / "streamed", FakeOpenAI(), stream=True)
+    # Saved paths differ only by output directory
+    assert json.dumps(streamed).replace(str(tmp_path / "streamed"), str(tmp_path / "plain")) == json.dumps(plain)
+    assert sorted(p.name for p in (tmp_path / "streamed" / "attachments").iterdir()) == \
+        sorted(p.name for p in (tmp_path / "plain" / "attachments").iterdir())
+    assert not (tmp_path / "streamed" / "conversations.journal.jsonl").exists()
+
+def test_attachments_start_before_the_reply_is_finished(tmp_path):
+    client = FakeOpenAI(latency=0.01, files_per_paragraph=3)
+    _process(tmp_path, client, stream=True)
+    log = client.behaviour.log
+    # The first paragraph's reply runs up to the second paragraph's run
+    start = log.index("threads.runs.stream")
+    end = log.index("threads.runs.stream", start + 1)
+    last_delta = max(i for i in range(start, end) if log[i] == "threads.runs.stream.delta")
+    first_attachment = next(i for i, name in enumerate(log) if name in ("threads.create_and_run", "images.generate"))
+    assert first_attachment < last_delta
+
+def test_stream_with_chat_completions_backend(tmp_path):
+    client = FakeOpenAI()
+    output = _process(tmp_path, client, stream=True, backend="chat")
+    assert client.behaviour.calls["chat.completions.delta"] > 1
+    with open(tmp_path / "conversations.json", encoding="utf-8") as f:
+        assert json.load(f) == output
+    assert sum(1 for p in (tmp_path / "attachments").iterdir() if p.is_file()) == 8
@@ -0,0 +1,78 @@
+import json
+import os
+import pytest
+from kafka_speaker.ratelimit import RateLimiter
+from kafka_speaker.slack import SlackUploader
+from kafka_speaker.speaker import KafkaSpeaker, process_book
+from kafka_speaker.telemetry import Telemetry, percentile
+from tests.fakes import FakeOpenAI, FakeSlackClient
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_percentile_nearest_rank():
+    values = [float(i) for i in range(1, 21)]
+    assert percentile(values, 0.5) == 10.0
+    assert percentile(values, 0.95) == 19.0
+    assert percentile([], 0.5) == 0.0
+
+def test_measure_records_nested_calls_separately():
+    clock = FakeClock()
+    telemetry = Telemetry(clock=clock)
+    usage = type("Usage", (), {"prompt_tokens": 1000, "completion_tokens": 500})()
+    with telemetry.measure("messages"):
+        clock.now += 1
+        telemetry.add_wait(0.5)
+        with telemetry.measure("image"):
+            clock.now += 2
+            telemetry.add_images("dall-e-3", "1024x1024")
+        telemetry.add_usage("gpt-4o-mini", usage)
+    with pytest.raises(ValueError):
+        with telemetry.measure("messages"):
+            raise ValueError("refused")
+    telemetry.add_usage("gpt-4o-mini", usage)
+
+    stages = telemetry.summary()["stages"]
+    assert stages["image"]["seconds"] == 2 and stages["image"]["images"] == 1
+    assert stages["image"]["cost"] == pytest.approx(0.04)
+    assert stages["messages"]["calls"] == 2 and stages["messages"]["errors"] == 1
+    assert stages["messages"]["max_seconds"] == 3 and stages["messages"]["wait_seconds"] == 0.5
+    assert (stages["messages"]["prompt_tokens"], stages["messages"]["completion_tokens"]) == (1000, 500)
+    assert stages["messages"]["cost"] == pytest.approx(0.00045)
+
+def test_process_book_records_calls(tmp_path):
+    client = FakeOpenAI(files_per_paragraph=4)
+    speaker = KafkaSpeaker(client, http_session=client.http)
+    process_book(
+        os.path.join(os.path.dirname(__file__), "data", "pg69327-kafka-der-prozess.txt"),
+        skip_past="*** START OF THE PROJECT GUTENBERG EBOOK", end_at="*** END OF THE PROJECT GUTENBERG EBOOK",
+        output_dir=tmp_path, openai_client=client, model="gpt-4o-mini", file_limit=30, speaker=speaker
+    )
+
+    summary = speaker.telemetry.summary()
+    stages = summary["stages"]
+    assert {"messages", "attachment", "image", "download"} <= set(stages)
+    assert stages["messages"]["prompt_tokens"] > 0 and stages["messages"]["cost"] > 0
+    assert stages["attachment"]["calls"] == client.behaviour.calls["threads.create_and_run"]
+    assert stages["image"]["images"] == client.behaviour.calls["images.generate"]
+    assert summary["total"]["cost"] == pytest.approx(sum(s["cost"] for s in stages.values()))
+
+    speaker.telemetry.write_summary(tmp_path / "metrics.json")
+    assert json.loads((tmp_path / "metrics.json").read_text())["stages"]["image"]["images"] == stages["image"]["images"]
+    speaker.telemetry.write_prometheus(tmp_path / "metrics.prom")
+    prom = (tmp_path / "metrics.prom").read_text()
+    assert 'kafka_speaker_call_seconds{stage="messages",quantile="0.95"}' in prom
+    assert f'kafka_speaker_images_total{{stage="image"}} {stages["image"]["images"]}' in prom
+    assert "p95" in speaker.telemetry.report().splitlines()[0]
+
+def test_slack_calls_are_recorded():
+    client = FakeSlackClient(rate_limited=2, retry_after=3)
+    uploader = SlackUploader("xoxb-fake", client=client, rate_limiter=RateLimiter({}, sleep=lambda seconds: None))
+    uploader._call("chat_postMessage", "C_TEST", channel="C_TEST", blocks=[])
+
+    stage = uploader.telemetry.summary()["stages"]["slack.chat_postMessage"]
+    assert (stage["calls"], stage["errors"]) == (1, 0)
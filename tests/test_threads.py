@@ -0,0 +1,64 @@
+import os
+from kafka_speaker.paragraph import file_paragraphs
+import pytest
+from kafka_speaker.governor import Budget, BudgetExceeded, Governor
+from kafka_speaker.speaker import KafkaSpeaker
+from kafka_speaker.threads import ThreadPolicy
+from tests.fakes import FakeOpenAI
+
+paragraphs = list(file_paragraphs(
+    os.path.join(os.path.dirname(__file__), "data", "pg69327-kafka-der-prozess.txt"),
+    skip_past='*** START OF THE PROJECT GUTENBERG EBOOK',
+    end_at='*** END OF THE PROJECT GUTENBERG EBOOK'
+))[:12]
+
+def test_threads_rotate_after_paragraphs():
+    client = FakeOpenAI()
+    speaker = KafkaSpeaker(client, thread_policy=ThreadPolicy(max_prompt_tokens=None, max_paragraphs=5))
+    for paragraph in paragraphs:
+        speaker.generate_messages(paragraph)
+    assert speaker.threads.threads_started == 3
+    assert client.behaviour.calls["threads.create"] == 3
+    # Only the current thread is left
+    assert client.behaviour.calls["threads.delete"] == 2
+    assert list(client._threads) == [speaker.threads.thread().id]
+
+def test_prompt_tokens_stay_bounded():
+    unbounded = KafkaSpeaker(FakeOpenAI(), thread_policy=ThreadPolicy(max_prompt_tokens=None))
+    bounded = KafkaSpeaker(FakeOpenAI(), thread_policy=ThreadPolicy(max_prompt_tokens=1500))
+    for paragraph in paragraphs:
+        unbounded.generate_messages(paragraph)
+        bounded.generate_messages(paragraph)
+
+    assert unbounded.threads.threads_started == 1
+    assert bounded.threads.threads_started > 1
+    assert len(bounded.threads.prompt_tokens) == len(paragraphs)
+    largest_paragraph = max(len(str(p)) for p in paragraphs) // 4
+    assert max(bounded.threads.prompt_tokens) < 1500 + largest_paragraph
+    assert max(unbounded.threads.prompt_tokens) > max(bounded.threads.prompt_tokens)
+    assert "12 message runs" in bounded.threads.report()
+
+def test_new_threads_are_seeded_with_a_summary():
+    client = FakeOpenAI()
+    speaker = KafkaSpeaker(client, thread_policy=ThreadPolicy(max_prompt_tokens=None, max_paragraphs=2, summarize=True))
+    for paragraph in paragraphs[:3]:
+        speaker.generate_messages(paragraph)
+
+    assert client.behaviour.calls["chat.completions.create"] == 1
+    first_message = client._threads[speaker._get_message_thread.id][0]
+    assert first_message.content[0].text.value.startswith("The story so far:")
+
+def test_summaries_are_metered_and_budgeted():
+    client = FakeOpenAI()
+    governor = Governor(Budget(max_tokens=10**9))
+    speaker = KafkaSpeaker(client, "gpt-4o", thread_policy=ThreadPolicy(max_prompt_tokens=None, max_paragraphs=2, summarize=True), governor=governor)
+    for paragraph in paragraphs[:3]:
+        speaker.generate_messages(paragraph)
+    assert speaker.telemetry.summary()["stages"]["thread_summary"]["calls"] == 1
+    assert speaker.telemetry.summary()["stages"]["thread_summary"]["prompt_tokens"] > 0
+
+    governor.budget.max_tokens = 1
+    with pytest.raises(BudgetExceeded):
+        for paragraph in paragraphs[3:5]:
+            speaker.generate_messages(paragraph)
+    assert client.behaviour.calls["chat.completions.create"] == 1
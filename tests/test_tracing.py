@@ -0,0 +1,53 @@
+import json
+import os
+import pytest
+from kafka_speaker.speaker import KafkaSpeaker, process_book
+from kafka_speaker.telemetry import Telemetry
+from kafka_speaker.tracing import Tracer, traced
+from tests.fakes import FakeOpenAI
+
+def test_spans_are_complete_events():
+    tracer = Tracer()
+    with tracer.span("outer", book="Der Process"):
+        with tracer.span("inner"):
+            pass
+    with pytest.raises(ValueError):
+        with tracer.span("failed"):
+            raise ValueError("no")
+
+    metadata = [e for e in tracer.events() if e["ph"] == "M"]
+    spans = {e["name"]: e for e in tracer.events() if e["ph"] == "X"}
+    assert {e["name"] for e in metadata} == {"process_name", "thread_name"}
+    assert spans["outer"]["args"] == {"book": "Der Process"}
+    assert spans["outer"]["ts"] <= spans["inner"]["ts"]
+    assert spans["inner"]["ts"] + spans["inner"]["dur"] <= spans["outer"]["ts"] + spans["outer"]["dur"]
+    assert "ValueError" in spans["failed"]["args"]["error"]
+
+def test_traced_spans_each_item():
+    tracer = Tracer()
+    assert list(traced(tracer, "read", iter([1, 2]))) == [1, 2]
+    assert [e["name"] for e in tracer.events() if e["ph"] == "X"] == ["read"] * 3
+    items = [1, 2]
+    assert traced(None, "read", items) is items
+
+def test_process_book_trace(tmp_path):
+    client = FakeOpenAI(files_per_paragraph=4, latency=0.001)
+    telemetry = Telemetry(tracer=Tracer())
+    speaker = KafkaSpeaker(client, http_session=client.http, telemetry=telemetry)
+    process_book(
+        os.path.join(os.path.dirname(__file__), "data", "pg69327-kafka-der-prozess.txt"),
+        skip_past="*** START OF THE PROJECT GUTENBERG EBOOK", end_at="*** END OF THE PROJECT GUTENBERG EBOOK",
+        output_dir=tmp_path, openai_client=client, model="gpt-4o-mini", file_limit=12, speaker=speaker
+    )
+    telemetry.tracer.write(tmp_path / "trace.json")
+
+    events = json.loads((tmp_path / "trace.json").read_text())["traceEvents"]
+    spans = [e for e in events if e["ph"] == "X"]
+    names = {e["name"] for e in spans}
+    assert {"file_paragraphs", "messages", "runs.create_and_poll", "attachment", "download", "write_attachment", "write_conversations"} <= names
+    # Attachments are written on the worker threads, off the thread reading paragraphs
+    main_tids = {e["tid"] for e in spans if e["name"] == "file_paragraphs"}
+    assert len(main_tids) == 1
+    assert {e["tid"] for e in spans if e["name"] == "write_attachment"}.isdisjoint(main_tids)
+    thread_names = {e["tid"] for e in events if e["name"] == "thread_name"}
+    assert {e["tid"] for e in spans} <= thread_names